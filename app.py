@@ -1,40 +1,34 @@
-print("=== INÍCIO DO APP.PY ===", flush=True)
 import sys
 import os
-try:
-    print(f"Python: {sys.version}")
-    print(f"CWD: {os.getcwd()}")
-    print(f"FILES: {os.listdir('.')}")
-except Exception as e:
-    print(f"[ERRO AO LOGAR AMBIENTE]: {e}")
 
 import streamlit as st
-import time
-import subprocess
-from db import init_db
-from services import (create_user, list_users, update_user_email, create_task, list_tasks, validate_task,
-                      get_conversion, set_conversion, create_debit, get_report, seed_sample_data, save_user_photo,
-                      authenticate_user, get_user_by_email, update_user_password, list_debits, delete_user, delete_task, delete_debit)
+from streamlit.errors import StreamlitAPIException
+import base64
+import mimetypes
+from datetime import date, timedelta
+from passwords import PasswordQueueFull
+from photos import rendition_for
+from photo_cache import fetch_photo, photo_cache_stats
+from services import (bootstrap, create_user, list_users, list_children, update_user_email, create_task, list_tasks, validate_task, validate_tasks,
+                      get_conversion, set_conversion, create_debit, get_report, enqueue_user_photo, photo_upload_pending,
+                      authenticate_user, get_user_by_email, update_user_password, list_debits, delete_user, delete_tasks, delete_debits,
+                      next_page_cursor, get_balance_history)
 # Envio de e-mail desabilitado por padrão para evitar falhas em ambientes sem SMTP
 
 import logging
-import sys
 import traceback
-import pandas as pd
-import plotly.express as px
+# pandas e plotly são importados nas funções que os usam: o formulário de
+# login não paga o custo de carregá-los
 
 
 def safe_rerun():
-    """Tenta usar st.experimental_rerun() quando disponível; caso contrário usa st.stop().
-    Isso evita AttributeError em versões do Streamlit que não expõem experimental_rerun.
+    """Reexecuta o script com st.rerun() (ou st.experimental_rerun() em versões
+    antigas do Streamlit); se nenhum existir, usa st.stop().
     """
-    try:
-        fn = getattr(st, 'experimental_rerun', None)
-        if callable(fn):
-            fn()
-            return
-    except Exception:
-        pass
+    fn = getattr(st, 'rerun', None) or getattr(st, 'experimental_rerun', None)
+    if callable(fn):
+        fn()
+        return
     try:
         # st.stop() interrompe a execução do script atual e força refresh
         st.stop()
@@ -43,50 +37,134 @@ def safe_rerun():
         raise
 
 
-# Logging setup - simplificado para Streamlit Cloud
-LOG_DIR = os.environ.get('GESTAO_LOGS', 'logs')
-try:
-    os.makedirs(LOG_DIR, exist_ok=True)
-    log_file = os.path.join(LOG_DIR, 'app.log')
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
-        handlers=[logging.FileHandler(log_file), logging.StreamHandler(sys.stdout)]
-    )
-except Exception:
-    # Fallback para apenas stdout se não conseguir criar arquivo de log
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
-        handlers=[logging.StreamHandler(sys.stdout)]
-    )
-logging.getLogger("sqlalchemy").setLevel(logging.WARNING)
-
-# Registrar exceções não tratadas para facilitar debug
+def rerun_fragment():
+    """Reexecuta só o fragmento corrente (ver fragment); fora de um fragmento,
+    ou em Streamlit sem rerun parcial, reexecuta o app inteiro."""
+    try:
+        st.rerun(scope='fragment')
+    except (AttributeError, TypeError, StreamlitAPIException):
+        safe_rerun()
+
+
+def _identity(fn):
+    return fn
+
+
+# Reruns parciais: cliques dentro de um fragmento reexecutam só a função
+# decorada, não o main() inteiro (autenticação, barra lateral, cabeçalho).
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or _identity
+
+
+def flash(key, message):
+    """Guarda uma mensagem de sucesso para exibir após o próximo rerun."""
+    st.session_state[f'{key}_flash'] = message
+
+
+def show_flash(key):
+    message = st.session_state.pop(f'{key}_flash', None)
+    if message:
+        st.success(message)
+
+
+def configure_logging():
+    """Configura o logging (arquivo + stdout) uma única vez por processo.
+
+    O Streamlit reexecuta app.py num módulo __main__ novo a cada rerun, então
+    a marca fica nos handlers do logger raiz (que persiste) e não num global
+    deste módulo.
+    """
+    root = logging.getLogger()
+    if any(getattr(handler, '_gestao_app', False) for handler in root.handlers):
+        return
+    handlers = [logging.StreamHandler(sys.stdout)]
+    try:
+        log_dir = os.environ.get('GESTAO_LOGS', 'logs')
+        os.makedirs(log_dir, exist_ok=True)
+        handlers.insert(0, logging.FileHandler(os.path.join(log_dir, 'app.log')))
+    except Exception:
+        # Fallback para apenas stdout se não conseguir criar arquivo de log
+        pass
+    formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    for handler in handlers:
+        handler._gestao_app = True
+        handler.setFormatter(formatter)
+        root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    logging.getLogger("sqlalchemy").setLevel(logging.WARNING)
+    # Registrar exceções não tratadas para facilitar debug
+    sys.excepthook = _log_uncaught_exceptions
+
+
 def _log_uncaught_exceptions(exctype, value, tb):
     logging.error("Uncaught exception", exc_info=(exctype, value, tb))
 
-sys.excepthook = _log_uncaught_exceptions
-
-# Marca de importação para ajudar a diagnosticar se o arquivo é carregado corretamente
-logging.info('app.py imported — starting module initialization')
 
 def photo_or_placeholder(user, width=60):
-    """Retorna o caminho/URL da foto do usuário se existir.
-    Aceita tanto URLs HTTP (Supabase) quanto paths locais.
+    """Retorna a foto do usuário se existir, na menor miniatura com pelo menos
+    ``width`` px: bytes do cache local para URLs HTTP (Supabase) ou o path local.
     """
     path = getattr(user, 'photo', None)
     if not path:
         return None
-    # Se for URL HTTP (Supabase Storage), retorna diretamente
+    # Se for URL HTTP (Supabase Storage), serve do cache de fotos (memória/disco);
+    # a URL só é devolvida se não for possível obter os bytes
     if path.startswith('http://') or path.startswith('https://'):
-        return path
+        url = rendition_for(path, width)
+        return fetch_photo(url) or url
     # Se for path local, verifica se existe
     if os.path.exists(path):
-        return path
+        return rendition_for(path, width)
     return None
 
 
+def image_cell(path):
+    """Valor para st.column_config.ImageColumn: URLs seguem como estão e
+    bytes do cache ou arquivos locais viram data URI (o navegador não acessa o
+    disco do servidor).
+    """
+    if isinstance(path, bytes):
+        return f"data:{image_mime(path)};base64,{base64.b64encode(path).decode()}"
+    if not path or path.startswith(('http://', 'https://')):
+        return path
+    mime = mimetypes.guess_type(path)[0] or 'image/jpeg'
+    try:
+        with open(path, 'rb') as fh:
+            return f"data:{mime};base64,{base64.b64encode(fh.read()).decode()}"
+    except OSError:
+        return None
+
+
+def image_mime(data):
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    return 'image/jpeg'
+
+
+PAGE_SIZE = 20
+
+
+def page_cursor(state_key):
+    """Cursor (keyset) da página atual da listagem identificada por state_key."""
+    stack = st.session_state.setdefault(state_key, [None])
+    return stack[-1]
+
+
+def render_page_nav(state_key, items):
+    """Botões Anterior/Próxima; a pilha de cursores fica em st.session_state[state_key]."""
+    stack = st.session_state.setdefault(state_key, [None])
+    nxt = next_page_cursor(items, PAGE_SIZE)
+    col_prev, col_info, col_next = st.columns([1,2,1])
+    if len(stack) > 1 and col_prev.button('← Anterior', key=f'{state_key}_prev'):
+        stack.pop()
+        rerun_fragment()
+    col_info.caption(f'Página {len(stack)}')
+    if nxt and col_next.button('Próxima →', key=f'{state_key}_next'):
+        stack.append(nxt)
+        rerun_fragment()
+
+
 def is_role(user, role):
     return role in (user.roles or "").split(',')
 
@@ -94,23 +172,15 @@ def is_role(user, role):
 def main():
 
     st.set_page_config(page_title="Gestão Infantil", layout="wide")
+    configure_logging()
 
-    # Diagnóstico explícito para Streamlit Cloud: print/log no início
-    print('==== [DEBUG] Entrou no main() do app.py ====', flush=True)
-    logging.info('==== [DEBUG] Entrou no main() do app.py ====')
-
+    # init_db + seed rodam uma única vez por processo (reruns não fazem consultas aqui)
     try:
-        init_db()
+        bootstrap()
     except Exception as e:
         logging.exception("Falha ao inicializar o DB")
         st.error(f"❌ Falha ao inicializar o DB: {e}")
         st.stop()
-    try:
-        seed_sample_data()
-    except Exception as e:
-        logging.exception("Falha ao rodar seed_sample_data")
-        st.error(f"❌ Falha ao rodar seed_sample_data: {e}")
-        st.stop()
 
     if 'user_id' not in st.session_state:
         st.session_state.user_id = None
@@ -125,7 +195,11 @@ def main():
             password = st.text_input("Senha", type="password")
             submitted = st.form_submit_button("Entrar")
             if submitted:
-                user = authenticate_user(email, password)
+                try:
+                    user = authenticate_user(email, password)
+                except PasswordQueueFull:
+                    st.warning("Muitos logins simultâneos. Tente novamente em instantes.")
+                    st.stop()
                 if user:
                     st.session_state.user_id = user.id
                     safe_rerun()
@@ -149,7 +223,7 @@ def main():
     with st.sidebar:
         # Mostrar foto do usuário logado (se disponível)
         try:
-            photo_path = photo_or_placeholder(current_user)
+            photo_path = photo_or_placeholder(current_user, 80)
             if photo_path:
                 st.image(photo_path, width=80)
             else:
@@ -169,11 +243,16 @@ def main():
         else:
             pages = ['Dashboard']
         page = st.radio("Página", pages)
+        if is_validator:
+            stats = photo_cache_stats()
+            if stats['misses'] or stats['bytes_saved']:
+                st.caption(f"Cache de fotos: {stats['hit_ratio']:.0%} de acertos, "
+                           f"{stats['bytes_saved'] / 1024:.0f} KB economizados")
 
     # Cabeçalho: mostrar foto e nome do usuário logado antes de tudo (acima do título)
     try:
         hdr_col1, hdr_col2 = st.columns([1, 8])
-        header_photo = photo_or_placeholder(current_user)
+        header_photo = photo_or_placeholder(current_user, 64)
         if header_photo:
             hdr_col1.image(header_photo, width=64)
         else:
@@ -184,16 +263,13 @@ def main():
 
     st.title("Gestão de Tarefas Infantis")
 
-    report = get_report()
-    children_report = [r for r in report if 'child' in (r['user'].roles or '')]
-
     def render_balance_charts(children_report):
         if not children_report:
             st.info('Nenhuma criança cadastrada.')
             return
+        import plotly.express as px
 
         names = [r['user'].name for r in children_report]
-        photos = [photo_or_placeholder(r['user']) for r in children_report]
         money_values = [r['money'] for r in children_report]
         hour_values = [r['hours'] for r in children_report]
 
@@ -223,54 +299,130 @@ def main():
             fig_hours.update_layout(margin=dict(l=10,r=10,b=40,t=10))
             st.plotly_chart(fig_hours, use_container_width=True)
 
+        render_balance_history(children_report)
+
         # (Fotos abaixo dos gráficos removidas por solicitação)
 
+    def render_balance_history(children_report):
+        import plotly.express as px
+        st.subheader('Histórico')
+        buckets = {'Dia': ('day', 30), 'Semana': ('week', 7 * 12), 'Mês': ('month', 365)}
+        label = st.radio('Agrupar por', list(buckets.keys()), index=1, horizontal=True, key='history_bucket')
+        bucket, days = buckets[label]
+        names_by_id = {r['user'].id: r['user'].name for r in children_report}
+        # Uma única criança no relatório: filtra no banco
+        only_child = next(iter(names_by_id)) if len(names_by_id) == 1 else None
+        # Início alinhado ao dia: o argumento se repete entre reruns e a consulta vem do cache
+        history = get_balance_history(only_child, bucket, start=date.today() - timedelta(days=days))
+        keep = [i for i, cid in enumerate(history['child_id']) if cid in names_by_id]
+        if not keep:
+            st.info('Sem movimentações no período.')
+            return
+        periods = [history['period'][i] for i in keep]
+        names = [names_by_id[history['child_id'][i]] for i in keep]
+
+        col1, col2 = st.columns(2)
+        for col, field, title, fmt in (
+            (col1, 'money', 'Saldo do período (R$)', 'R$ %{y:.2f}'),
+            (col2, 'hours', 'Saldo do período (horas)', '%{y:.2f} h'),
+        ):
+            values = [history[field][i] for i in keep]
+            fig = px.bar(x=periods, y=values, color=names, barmode='group',
+                         labels={'x': 'Período', 'y': title, 'color': 'Criança'})
+            fig.update_traces(hovertemplate='%{x}: ' + fmt)
+            fig.update_layout(margin=dict(l=10,r=10,b=40,t=10))
+            with col:
+                st.caption(title)
+                st.plotly_chart(fig, use_container_width=True)
+
     def render_tables(children_report):
         st.markdown('---')
-        st.subheader('Tabela de Dinheiro')
-        header = st.columns([1,2,2,2,2])
-        header[0].markdown('**Foto**')
-        header[1].markdown('**Nome**')
-        header[2].markdown('**Realizado (R$)**')
-        header[3].markdown('**Debitado (R$)**')
-        header[4].markdown('**Saldo (R$)**')
-        for r in children_report:
-            u = r['user']
-            row = st.columns([1,2,2,2,2])
-            if photo_or_placeholder(u):
-                row[0].image(photo_or_placeholder(u), width=60)
-            else:
-                row[0].write('—')
-            row[1].write(u.name)
-            row[2].write(f"R$ {r['earned_money']:.2f}")
-            row[3].write(f"R$ {r['debited_money']:.2f}")
-            row[4].write(f"R$ {r['money']:.2f}")
-
-        st.subheader('Tabela de Horas')
-        header = st.columns([1,2,2,2,2])
-        header[0].markdown('**Foto**')
-        header[1].markdown('**Nome**')
-        header[2].markdown('**Realizado (h)**')
-        header[3].markdown('**Debitado (h)**')
-        header[4].markdown('**Saldo (h)**')
-        for r in children_report:
-            u = r['user']
-            row = st.columns([1,2,2,2,2])
-            if photo_or_placeholder(u):
-                row[0].image(photo_or_placeholder(u), width=60)
-            else:
-                row[0].write('—')
-            row[1].write(u.name)
-            row[2].write(f"{r['earned_hours']:.2f} h")
-            row[3].write(f"{r['debited_hours']:.2f} h")
-            row[4].write(f"{r['hours']:.2f} h")
+        st.subheader('Saldos detalhados')
+        import pandas as pd
+        table = pd.DataFrame({
+            'Foto': [image_cell(photo_or_placeholder(r['user'])) for r in children_report],
+            'Nome': [r['user'].name for r in children_report],
+            'Realizado (R$)': [r['earned_money'] for r in children_report],
+            'Debitado (R$)': [r['debited_money'] for r in children_report],
+            'Saldo (R$)': [r['money'] for r in children_report],
+            'Realizado (h)': [r['earned_hours'] for r in children_report],
+            'Debitado (h)': [r['debited_hours'] for r in children_report],
+            'Saldo (h)': [r['hours'] for r in children_report],
+        })
+        money = st.column_config.NumberColumn(format='R$ %.2f')
+        hours = st.column_config.NumberColumn(format='%.2f h')
+        st.dataframe(
+            table,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'Foto': st.column_config.ImageColumn('Foto', width='small'),
+                'Realizado (R$)': money, 'Debitado (R$)': money, 'Saldo (R$)': money,
+                'Realizado (h)': hours, 'Debitado (h)': hours, 'Saldo (h)': hours,
+            },
+        )
+
+    def render_selectable_page(rows, state_key, can_delete, on_delete, delete_label):
+        """Uma página da listagem como uma única tabela; validadores marcam
+        linhas na coluna 'Excluir' e removem todas com um só clique."""
+        import pandas as pd
+        show_flash(state_key)
+        table = pd.DataFrame(rows)
+        if not can_delete:
+            st.dataframe(table, hide_index=True, use_container_width=True)
+            return
+        table.insert(0, 'Excluir', False)
+        edited = st.data_editor(
+            table,
+            hide_index=True,
+            use_container_width=True,
+            disabled=[c for c in table.columns if c != 'Excluir'],
+            column_config={'Excluir': st.column_config.CheckboxColumn('Excluir', width='small')},
+            # Página e exclusões anteriores no key: marcações não migram para outras linhas
+            key=f"{state_key}_editor_{len(st.session_state.get(state_key, []))}_{st.session_state.get(state_key + '_gen', 0)}",
+        )
+        selected = [int(i) for i in edited.loc[edited['Excluir'], 'ID']]
+        if st.button(f'{delete_label} ({len(selected)})', disabled=not selected, key=f'{state_key}_delete'):
+            try:
+                deleted = on_delete(selected)
+                st.session_state[state_key + '_gen'] = st.session_state.get(state_key + '_gen', 0) + 1
+                flash(state_key, f'✅ {deleted} registro(s) excluído(s).')
+                rerun_fragment()
+            except Exception as exc:
+                logging.exception('Erro na exclusão em lote')
+                st.error(f'❌ Erro: {str(exc)}')
+
+    def render_task_page(tasks_page, state_key, can_delete):
+        rows = [{
+            'ID': t.id,
+            'Tarefa': t.name,
+            'Pontos': t.points,
+            'Tipo': 'R$' if t.conversion_type == 'money' else 'h',
+            'Para': user_map[t.child_id].name if t.child_id in user_map else t.child_id,
+            'Status': '✅ Validada' if t.validated else '⏳ Pendente',
+        } for t in tasks_page]
+        if rows:
+            render_selectable_page(rows, state_key, can_delete, delete_tasks, 'Excluir tarefas selecionadas')
+
+    def render_debit_page(debs, state_key, can_delete):
+        rows = [{
+            'ID': d.id,
+            'Para': user_map[d.user_id].name if d.user_id in user_map else d.user_id,
+            'Valor (R$)': d.money_amount,
+            'Horas': d.hours_amount,
+            'Por': user_map[d.performed_by_id].name if d.performed_by_id in user_map else d.performed_by_id,
+            'Motivo': d.reason or '-',
+            'Data': str(d.created_at),
+        } for d in debs]
+        render_selectable_page(rows, state_key, can_delete, delete_debits, 'Excluir débitos selecionados')
 
     def render_child_card(r):
+        import pandas as pd
         u = r['user']
         money = r['money']
         hours = r['hours']
         col_photo, col_money, col_hours = st.columns([1,2,2])
-        dash_photo = photo_or_placeholder(u)
+        dash_photo = photo_or_placeholder(u, 90)
         if dash_photo:
             col_photo.image(dash_photo, width=90)
         else:
@@ -282,6 +434,8 @@ def main():
         col_chart2.bar_chart(pd.DataFrame({'Horas':[hours]}, index=['Saldo']))
 
     if page == 'Dashboard':
+        report = get_report()
+        children_report = [r for r in report if 'child' in (r['user'].roles or '')]
         st.subheader('Saldos por criança')
         if not children_report:
             st.info('Nenhuma criança cadastrada.')
@@ -293,142 +447,160 @@ def main():
         if not (is_validator or is_child):
             st.warning('Apenas validadores ou crianças podem cadastrar tarefas.')
         else:
-            # filtro por criança (por padrão, child vê seu próprio nome)
-            users_children = [u for u in users if 'child' in (u.roles or '')]
-            options = [None] + [u.id for u in users_children]
-            def fmt(uid):
-                if uid is None:
-                    return 'Todos'
-                return user_map[uid].name
-            default = current_user.id if is_child and not is_validator else None
-            filter_target = st.selectbox('Filtrar por criança', options=options, format_func=fmt, index=options.index(default) if default in options else 0)
-
-            st.subheader('Cadastrar tarefa')
-            with st.form('new_task_form'):
-                name = st.text_input('Nome da tarefa')
-                amount = st.number_input('Valor', min_value=0.0, step=0.5)
-                conv_type = st.selectbox('Tipo', ['money','hours'], format_func=lambda x: 'Dinheiro (R$)' if x=='money' else 'Horas de videogame')
-                # Se for child, somente cadastrar para si; se for validator, escolher criança alvo
-                if is_child and not is_validator:
-                    child = current_user.id
-                    st.write(f'Para criança: {current_user.name}')
-                else:
-                    child = st.selectbox('Para criança', options=[u.id for u in users if 'child' in (u.roles or '')], format_func=lambda id: user_map[id].name)
-                # Quando criado por child, deixar validator None (pendente). Quando criado por validator, registrar submitted_by como validator.
-                submitted_by = current_user.id
-                validator = None if is_child and not is_validator else current_user.id
-                submitted = st.form_submit_button('Registrar tarefa')
-                if submitted:
-                    try:
-                        create_task(name, amount, conv_type, child, submitted_by, validator)
-                        st.success('Tarefa registrada; aguarde validação.')
-                    except Exception as exc:
-                        logging.exception('Erro ao criar tarefa')
-                        st.error(f'Falha ao registrar tarefa: {exc}')
-
-            st.subheader('Tarefas registradas')
-            tasks_all = list_tasks()
-            if filter_target is not None:
-                tasks_all = [t for t in tasks_all if t.child_id == filter_target]
-            for t in tasks_all:
-                assignee = user_map[t.child_id].name if t.child_id in user_map else t.child_id
-                status = '✅ Validada' if t.validated else '⏳ Pendente'
-                cols = st.columns([6,2])
-                cols[0].write(f"{t.id} - {t.name} | {t.points} ({'R$' if t.conversion_type=='money' else 'h'}) | Para: {assignee} | {status}")
-                if is_validator:
-                    if cols[1].button('Excluir', key=f'del_task_{t.id}'):
+            @fragment
+            def tasks_panel():
+                # Cadastro, exclusão e paginação reexecutam só este bloco
+                # filtro por criança (por padrão, child vê seu próprio nome)
+                users_children = list_children()
+                options = [None] + [u.id for u in users_children]
+                def fmt(uid):
+                    if uid is None:
+                        return 'Todos'
+                    return user_map[uid].name
+                default = current_user.id if is_child and not is_validator else None
+                filter_target = st.selectbox('Filtrar por criança', options=options, format_func=fmt, index=options.index(default) if default in options else 0)
+
+                st.subheader('Cadastrar tarefa')
+                with st.form('new_task_form'):
+                    name = st.text_input('Nome da tarefa')
+                    conv = get_conversion()
+                    amount = st.number_input('Pontos', min_value=0.0, step=0.5,
+                                             help=f"Taxa atual: R$ {conv.money_per_point:.2f} ou {conv.hours_per_point:.2f} h por ponto")
+                    conv_type = st.selectbox('Tipo', ['money','hours'], format_func=lambda x: 'Dinheiro (R$)' if x=='money' else 'Horas de videogame')
+                    # Se for child, somente cadastrar para si; se for validator, escolher criança alvo
+                    if is_child and not is_validator:
+                        child = current_user.id
+                        st.write(f'Para criança: {current_user.name}')
+                    else:
+                        child = st.selectbox('Para criança', options=[u.id for u in list_children()], format_func=lambda id: user_map[id].name)
+                    # Quando criado por child, deixar validator None (pendente). Quando criado por validator, registrar submitted_by como validator.
+                    submitted_by = current_user.id
+                    validator = None if is_child and not is_validator else current_user.id
+                    submitted = st.form_submit_button('Registrar tarefa')
+                    if submitted:
                         try:
-                            ok = delete_task(t.id)
-                            if ok:
-                                st.success('✅ Tarefa excluída com sucesso.')
-                            else:
-                                st.error('❌ Falha ao excluir tarefa.')
+                            create_task(name, amount, conv_type, child, submitted_by, validator)
+                            st.success('Tarefa registrada; aguarde validação.')
                         except Exception as exc:
-                            logging.exception('Erro ao excluir tarefa')
-                            st.error(f'❌ Erro: {str(exc)}')
+                            logging.exception('Erro ao criar tarefa')
+                            st.error(f'Falha ao registrar tarefa: {exc}')
+
+                st.subheader('Tarefas registradas')
+                # Filtro e paginação no banco: só a página visível é buscada
+                tasks_key = f'tasks_pages_{filter_target}'
+                tasks_page = list_tasks(child_id=filter_target, limit=PAGE_SIZE, cursor=page_cursor(tasks_key))
+                render_task_page(tasks_page, tasks_key, is_validator)
+                render_page_nav(tasks_key, tasks_page)
+            tasks_panel()
 
     elif page == 'Validar':
         if not is_validator:
             st.warning('Apenas validadores podem validar tarefas.')
         else:
-            st.subheader('Tarefas pendentes')
-            pending = list_tasks(validated=False)
-            if not pending:
-                st.info('Nenhuma tarefa pendente.')
-            for t in pending:
-                assignee = user_map[t.child_id].name if t.child_id in user_map else t.child_id
-                col1, col2 = st.columns([3,1])
-                col1.write(f"{t.name} | {t.points} ({'R$' if t.conversion_type=='money' else 'h'}) | Para: {assignee}")
-                if col2.button('Validar', key=f'val_{t.id}'):
-                    try:
-                        validate_task(t.id, current_user.id)
-                        st.success('Tarefa validada.')
-                        safe_rerun()
-                    except Exception as exc:
-                        logging.exception('Erro ao validar tarefa')
-                        st.error(f'Falha ao validar tarefa: {exc}')
+            @fragment
+            def validation_panel():
+                # Validar reexecuta só a lista de pendentes
+                st.subheader('Tarefas pendentes')
+                show_flash('val')
+                pending = list_tasks(validated=False)
+                if not pending:
+                    st.info('Nenhuma tarefa pendente.')
+                else:
+                    pending_by_id = {t.id: t for t in pending}
+                    # Tarefas já validadas saem da seleção guardada
+                    if 'val_selected' in st.session_state:
+                        st.session_state.val_selected = [i for i in st.session_state.val_selected if i in pending_by_id]
+
+                    def fmt_task(task_id):
+                        t = pending_by_id[task_id]
+                        assignee = user_map[t.child_id].name if t.child_id in user_map else t.child_id
+                        return f"{t.name} | {t.points} pts ({'R$' if t.conversion_type=='money' else 'h'}) | Para: {assignee}"
+
+                    # Ações em lote: um único UPDATE por clique (validate_tasks)
+                    col_sel, col_btn = st.columns([3,1])
+                    selected = col_sel.multiselect('Selecionar tarefas', options=list(pending_by_id), format_func=fmt_task, key='val_selected')
+                    if col_btn.button('Validar selecionadas', disabled=not selected):
+                        try:
+                            done = validate_tasks(selected, current_user.id)
+                            flash('val', f'{len(done)} tarefa(s) validada(s).')
+                            rerun_fragment()
+                        except Exception as exc:
+                            logging.exception('Erro ao validar tarefas selecionadas')
+                            st.error(f'Falha ao validar tarefas: {exc}')
+
+                    pending_children = sorted({t.child_id for t in pending}, key=lambda cid: user_map[cid].name if cid in user_map else str(cid))
+                    col_child, col_all = st.columns([3,1])
+                    child_target = col_child.selectbox('Criança', options=pending_children, format_func=lambda cid: user_map[cid].name if cid in user_map else str(cid), key='val_child')
+                    if col_all.button('Validar todas desta criança'):
+                        try:
+                            done = validate_tasks([t.id for t in pending if t.child_id == child_target], current_user.id)
+                            flash('val', f'{len(done)} tarefa(s) validada(s).')
+                            rerun_fragment()
+                        except Exception as exc:
+                            logging.exception('Erro ao validar tarefas da criança')
+                            st.error(f'Falha ao validar tarefas: {exc}')
+
+                    st.markdown('---')
+                for t in pending:
+                    assignee = user_map[t.child_id].name if t.child_id in user_map else t.child_id
+                    col1, col2 = st.columns([3,1])
+                    col1.write(f"{t.name} | {t.points} pts ({'R$' if t.conversion_type=='money' else 'h'}) | Para: {assignee}")
+                    if col2.button('Validar', key=f'val_{t.id}'):
+                        try:
+                            validate_task(t.id, current_user.id)
+                            flash('val', 'Tarefa validada.')
+                            rerun_fragment()
+                        except Exception as exc:
+                            logging.exception('Erro ao validar tarefa')
+                            st.error(f'Falha ao validar tarefa: {exc}')
+            validation_panel()
 
     elif page == 'Débitos':
         if not (is_validator or is_child):
             st.warning('Apenas validadores ou crianças podem registrar débitos.')
         else:
-            st.subheader('Registrar débito')
-            users_children = [u for u in users if 'child' in (u.roles or '')]
-            # filtro para visualização/seleção: children list + Todos
-            options = [None] + [u.id for u in users_children]
-            def fmt_deb(uid):
-                if uid is None:
-                    return 'Todos'
-                return user_map[uid].name
-            default_deb = current_user.id if is_child and not is_validator else None
-            view_filter = st.selectbox('Filtrar débitos por criança', options=options, format_func=fmt_deb, index=options.index(default_deb) if default_deb in options else 0)
-
-            # Form para registrar débito (se child: só para si; se validator: pode escolher)
-            if is_child and not is_validator:
-                target = current_user.id
-                st.write(f'Débito será registrado para: {current_user.name}')
-            else:
-                target = st.selectbox('Criança (alvo do débito)', options=[u.id for u in users_children], format_func=lambda id: user_map[id].name)
-            amount_money = st.number_input('Valor (R$)', min_value=0.0, step=0.5, key='deb_money')
-            amount_hours = st.number_input('Horas', min_value=0.0, step=0.1, key='deb_hours')
-            reason = st.text_input('Motivo', key='deb_reason')
-            if st.button('Confirmar débito'):
-                try:
-                    create_debit(user_id=target, points=0, money=amount_money or None, hours=amount_hours or None, reason=reason, performed_by_id=current_user.id)
-                    st.success('Débito registrado.')
-                except Exception as exc:
-                    logging.exception('Falha ao registrar débito')
-                    st.error(f'Erro ao registrar débito: {exc}')
-
-            # Mostrar débitos conforme filtro
-            st.markdown('---')
-            st.subheader('Débitos registrados')
-            debs = list_debits(user_id=view_filter)
-            if not debs:
-                st.info('Nenhum débito encontrado para o filtro selecionado.')
-            else:
-                for d in debs:
-                    who = user_map[d.user_id].name if d.user_id in user_map else d.user_id
-                    by = user_map[d.performed_by_id].name if d.performed_by_id in user_map else d.performed_by_id
-                    parts = []
-                    if d.money_amount:
-                        parts.append(f"R$ {d.money_amount:.2f}")
-                    if d.hours_amount:
-                        parts.append(f"{d.hours_amount:.2f} h")
-                    pts = ', '.join(parts) if parts else '—'
-                    cols = st.columns([8,2])
-                    cols[0].write(f"{d.id} | Para: {who} | Valor: {pts} | Por: {by} | Motivo: {d.reason or '-'} | {d.created_at}")
-                    if is_validator:
-                        if cols[1].button('Excluir', key=f'del_deb_{d.id}'):
-                            try:
-                                ok = delete_debit(d.id)
-                                if ok:
-                                    st.success('✅ Débito excluído com sucesso.')
-                                else:
-                                    st.error('❌ Falha ao excluir débito.')
-                            except Exception as exc:
-                                logging.exception('Erro ao excluir débito')
-                                st.error(f'❌ Erro: {str(exc)}')
+            @fragment
+            def debits_panel():
+                # Registro, exclusão e paginação reexecutam só este bloco
+                st.subheader('Registrar débito')
+                users_children = list_children()
+                # filtro para visualização/seleção: children list + Todos
+                options = [None] + [u.id for u in users_children]
+                def fmt_deb(uid):
+                    if uid is None:
+                        return 'Todos'
+                    return user_map[uid].name
+                default_deb = current_user.id if is_child and not is_validator else None
+                view_filter = st.selectbox('Filtrar débitos por criança', options=options, format_func=fmt_deb, index=options.index(default_deb) if default_deb in options else 0)
+
+                # Form para registrar débito (se child: só para si; se validator: pode escolher)
+                if is_child and not is_validator:
+                    target = current_user.id
+                    st.write(f'Débito será registrado para: {current_user.name}')
+                else:
+                    target = st.selectbox('Criança (alvo do débito)', options=[u.id for u in users_children], format_func=lambda id: user_map[id].name)
+                amount_money = st.number_input('Valor (R$)', min_value=0.0, step=0.5, key='deb_money')
+                amount_hours = st.number_input('Horas', min_value=0.0, step=0.1, key='deb_hours')
+                reason = st.text_input('Motivo', key='deb_reason')
+                if st.button('Confirmar débito'):
+                    try:
+                        create_debit(user_id=target, points=0, money=amount_money or None, hours=amount_hours or None, reason=reason, performed_by_id=current_user.id)
+                        st.success('Débito registrado.')
+                    except Exception as exc:
+                        logging.exception('Falha ao registrar débito')
+                        st.error(f'Erro ao registrar débito: {exc}')
+
+                # Mostrar débitos conforme filtro
+                st.markdown('---')
+                st.subheader('Débitos registrados')
+                debits_key = f'debits_pages_{view_filter}'
+                debs = list_debits(user_id=view_filter, limit=PAGE_SIZE, cursor=page_cursor(debits_key))
+                if not debs:
+                    st.info('Nenhum débito encontrado para o filtro selecionado.')
+                else:
+                    render_debit_page(debs, debits_key, is_validator)
+                render_page_nav(debits_key, debs)
+            debits_panel()
 
     elif page == 'Usuários':
         if not is_validator:
@@ -448,17 +620,16 @@ def main():
                             st.error('❌ Nome, e-mail e senha são obrigatórios.')
                         else:
                             new_user = create_user(name=name, email=email, roles=role, password=password)
-                            photo_uploaded = True
                             if photo_file is not None:
+                                # Enviada em segundo plano; uma foto inválida não desfaz o usuário
                                 try:
-                                    save_user_photo(new_user.id, photo_file.read(), photo_file.name)
-                                except Exception as e:
-                                    photo_uploaded = False
-                                    st.warning(f'⚠️ Usuário criado, mas erro ao fazer upload da foto: {str(e)}')
-                            if photo_uploaded:
-                                st.success('✅ Usuário criado com sucesso!')
+                                    enqueue_user_photo(new_user.id, photo_file.read())
+                                    st.success('✅ Usuário criado! A foto está sendo enviada e aparecerá em instantes.')
+                                except Exception as photo_exc:
+                                    logging.exception('Erro ao enviar a foto do usuário %s', new_user.id)
+                                    st.warning(f'⚠️ Usuário criado, mas erro ao fazer upload da foto: {str(photo_exc)}')
                             else:
-                                st.success('✅ Usuário criado (foto não foi salva).')
+                                st.success('✅ Usuário criado com sucesso!')
                     except Exception as e:
                         logging.exception('Erro ao criar usuário')
                         st.error(f'❌ Erro ao criar usuário: {str(e)}')
@@ -466,9 +637,11 @@ def main():
             st.subheader('Lista de usuários')
             for u in list_users():
                 cols_main = st.columns([1,4,1])
-                photo_url = photo_or_placeholder(u)
+                photo_url = photo_or_placeholder(u, 80)
                 if photo_url:
                     cols_main[0].image(photo_url, width=80)
+                elif photo_upload_pending(u.id):
+                    cols_main[0].caption('Enviando foto…')
                 else:
                     cols_main[0].write('Sem foto')
                 cols_main[1].write(f"{u.name} | {u.email or 'sem e-mail'} | {u.roles}")
@@ -485,7 +658,7 @@ def main():
                                 new_pwd = st.text_input('Nova senha (deixe em branco para manter)', type='password', key=f'edit_pwd_{u.id}')
                                 st.markdown('---')
                                 st.markdown('**Foto do usuário:**')
-                                edit_photo_url = photo_or_placeholder(u)
+                                edit_photo_url = photo_or_placeholder(u, 80)
                                 if edit_photo_url:
                                     st.image(edit_photo_url, width=80, caption='Foto atual')
                                 else:
@@ -497,11 +670,11 @@ def main():
                                     try:
                                         from services import update_user_full
                                         update_user_full(u.id, new_name, new_email, new_role, new_pwd if new_pwd else None)
-                                        # Atualizar foto se foi enviada
+                                        # Atualizar foto se foi enviada (envio em segundo plano)
                                         if new_photo is not None:
                                             try:
-                                                save_user_photo(u.id, new_photo.read(), new_photo.name)
-                                                st.success('✅ Usuário e foto atualizados com sucesso!')
+                                                enqueue_user_photo(u.id, new_photo.read())
+                                                st.success('✅ Usuário atualizado! A nova foto aparecerá em instantes.')
                                             except Exception as photo_exc:
                                                 st.warning(f'⚠️ Usuário atualizado, mas erro na foto: {str(photo_exc)}')
                                         else:
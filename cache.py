@@ -0,0 +1,215 @@
+"""
+Cache de leituras do services.py chaveado por versão de dados por tabela.
+
+Cada função de escrita do services chama ``tables_changed(...)`` com as tabelas
+que alterou; a versão dessas tabelas é incrementada após o commit (db.on_commit),
+então a sessão que escreveu já lê os dados novos na chamada seguinte
+(read-your-writes) e uma escrita desfeita não invalida nada. Leituras feitas
+dentro de transaction() não usam o cache, pois podem depender de escritas
+ainda não confirmadas.
+
+O cache é do processo (compartilhado entre as sessões do Streamlit), mas as
+versões também ficam no banco: tables_changed incrementa, na mesma transação
+da escrita, um contador por tabela em app_meta (chave ``cache_version:<tabela>``).
+Cada processo confere esses contadores no máximo uma vez a cada
+GESTAO_READ_CACHE_SYNC segundos (uma consulta pequena) e invalida as tabelas
+que outro processo alterou (scripts/, outra instância do app).
+
+Configuração:
+- GESTAO_READ_CACHE_SIZE: entradas (padrão 256; 0 desliga o cache)
+- GESTAO_READ_CACHE_SYNC: segundos entre conferências das versões no banco
+  (padrão 2; 0 confere a cada leitura)
+"""
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Tuple
+
+from db import _get_int_setting, get_db_kind, in_transaction, on_commit, pooled_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_META_PREFIX = "cache_version:"
+
+_lock = threading.Lock()
+_versions: Dict[str, int] = {}
+_entries: "OrderedDict[tuple, object]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "syncs": 0, "remote_changes": 0}
+_max_entries = None
+
+# Último contador de app_meta visto por tabela e quando ele foi conferido
+_shared_seen: Dict[str, str] = {}
+_sync_lock = threading.Lock()
+_last_sync = 0.0
+_sync_interval = None
+
+
+def _capacity() -> int:
+    global _max_entries
+    if _max_entries is None:
+        _max_entries = max(0, _get_int_setting("GESTAO_READ_CACHE_SIZE", 256))
+    return _max_entries
+
+
+def _interval() -> float:
+    global _sync_interval
+    if _sync_interval is None:
+        _sync_interval = float(max(0, _get_int_setting("GESTAO_READ_CACHE_SYNC", 2)))
+    return _sync_interval
+
+
+def sync_shared_versions(force: bool = False):
+    """Invalida as tabelas cujo contador em app_meta mudou desde a última conferência.
+
+    Chamada por table_version(); fora de ``force`` roda no máximo uma vez por
+    GESTAO_READ_CACHE_SYNC segundos e nunca dentro de transaction().
+    """
+    global _last_sync
+    if in_transaction():
+        return
+    now = time.monotonic()
+    if not force and now - _last_sync < _interval():
+        return
+    if not _sync_lock.acquire(blocking=force):
+        return  # outra thread já está conferindo
+    try:
+        _last_sync = now
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT key, value FROM app_meta WHERE key LIKE '{_META_PREFIX}%'")
+            rows = cur.fetchall()
+            cur.close()
+    except Exception:
+        # Banco ainda sem app_meta (antes das migrações) ou indisponível
+        logger.debug("Versões compartilhadas do cache indisponíveis", exc_info=True)
+        return
+    finally:
+        _sync_lock.release()
+    changed = []
+    with _lock:
+        _stats["syncs"] += 1
+        for row in rows:
+            key, value = (row["key"], row["value"]) if isinstance(row, dict) else (row[0], row[1])
+            table = key[len(_META_PREFIX):]
+            if _shared_seen.get(table) != value:
+                _shared_seen[table] = value
+                changed.append(table)
+        for table in changed:
+            _versions[table] = _versions.get(table, 0) + 1
+        _stats["remote_changes"] += len(changed)
+
+
+def table_version(table: str) -> int:
+    sync_shared_versions()
+    return _versions.get(table, 0)
+
+
+def bump(*tables: str):
+    """Incrementa na hora a versão das tabelas (prefira tables_changed)."""
+    with _lock:
+        for table in tables:
+            _versions[table] = _versions.get(table, 0) + 1
+
+
+def tables_changed(*tables: str):
+    """Marca as tabelas como alteradas a partir do commit da transação corrente.
+
+    Incrementa também o contador das tabelas em app_meta, na mesma transação
+    (ou numa transação própria, quando chamada fora de uma), para que os
+    outros processos vejam a escrita.
+    """
+    names = sorted(set(tables))  # ordem fixa: evita deadlock entre escritores
+    mark = "%s" if get_db_kind() == "pg" else "?"
+    cast = "BIGINT" if get_db_kind() == "pg" else "INTEGER"
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO app_meta (key, value) VALUES "
+            + ", ".join(f"({mark}, '1')" for _ in names)
+            + f" ON CONFLICT (key) DO UPDATE SET value = CAST(CAST(app_meta.value AS {cast}) + 1 AS TEXT)"
+            " RETURNING key, value",
+            tuple(_META_PREFIX + table for table in names),
+        )
+        rows = cur.fetchall()
+        cur.close()
+        seen = {}
+        for row in rows:
+            key, value = (row["key"], row["value"]) if isinstance(row, dict) else (row[0], row[1])
+            seen[key[len(_META_PREFIX):]] = value
+        on_commit(functools.partial(_committed, tables, seen))
+
+
+def _committed(tables: Tuple[str, ...], seen: Dict[str, str]):
+    bump(*tables)
+    with _lock:
+        _shared_seen.update(seen)  # a própria escrita já foi invalidada acima
+
+
+def cached_read(*tables: str) -> Callable:
+    """Decorador para leituras cujo resultado depende só de ``tables`` e dos argumentos.
+
+    O valor guardado é compartilhado entre chamadas: quem chama não deve
+    alterá-lo (listas são devolvidas como cópia rasa).
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if in_transaction() or not _capacity():
+                return _bypass(fn, args, kwargs)
+            versions = tuple(table_version(table) for table in tables)
+            key = (fn.__qualname__, args, tuple(sorted(kwargs.items())), versions)
+            try:
+                with _lock:
+                    value = _entries.get(key, _MISSING)
+                    if value is not _MISSING:
+                        _entries.move_to_end(key)
+                        _stats["hits"] += 1
+            except TypeError:  # argumento não hashable
+                return _bypass(fn, args, kwargs)
+            if value is _MISSING:
+                value = fn(*args, **kwargs)
+                with _lock:
+                    _stats["misses"] += 1
+                    _entries[key] = value
+                    while len(_entries) > _capacity():
+                        _entries.popitem(last=False)
+                        _stats["evictions"] += 1
+            return list(value) if isinstance(value, list) else value
+
+        wrapper.uncached = fn
+        return wrapper
+
+    return decorator
+
+
+_MISSING = object()
+
+
+def _bypass(fn: Callable, args: Tuple, kwargs: dict):
+    with _lock:
+        _stats["bypassed"] += 1
+    return fn(*args, **kwargs)
+
+
+def clear(tables: Iterable[str] = ()):
+    """Esvazia o cache; com ``tables``, invalida só as leituras dessas tabelas."""
+    if tables:
+        bump(*tables)
+        return
+    with _lock:
+        _entries.clear()
+
+
+def cache_stats() -> Dict[str, float]:
+    """Contadores de acertos/faltas, entradas em uso e versões por tabela."""
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_ratio": _stats["hits"] / lookups if lookups else 0.0,
+            "entries": len(_entries),
+            "max_entries": _capacity(),
+            "versions": dict(_versions),
+        }
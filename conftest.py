@@ -0,0 +1,17 @@
+"""Configuração do pytest: usa um banco SQLite temporário quando GESTAO_DB não está definido."""
+import os
+import tempfile
+
+if not (os.environ.get("GESTAO_DB") or os.environ.get("DATABASE_URL")):
+    _tmpdir = tempfile.mkdtemp(prefix="gestaoinfantil_test_")
+    os.environ["GESTAO_DB"] = "sqlite:///" + os.path.join(_tmpdir, "test.db")
+
+# KDF barato nos testes (o custo de produção fica em passwords._params)
+os.environ.setdefault("GESTAO_PASSWORD_SCRYPT_N", "1024")
+os.environ.setdefault("GESTAO_PASSWORD_PBKDF2_ITERATIONS", "1000")
+# Testes que contam consultas não devem cruzar com a conferência periódica das
+# versões do cache; test_services força essa conferência quando precisa dela
+os.environ.setdefault("GESTAO_READ_CACHE_SYNC", "3600")
+
+# scripts/ e os testes de Supabase são utilitários manuais executados no import
+collect_ignore = ["scripts", "test_supabase_config.py", "test_supabase_read.py"]
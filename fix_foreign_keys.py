@@ -1,6 +1,11 @@
 """
 Script para corrigir foreign keys quebradas no banco SQLite.
 As tabelas tasks e debits estão com FK apontando para users_old em vez de users.
+
+Esse estado vinha do antigo scripts/upgrade_sqlite_safe.py (removido), que
+renomeava users com as foreign keys desligadas. Só serve para bancos locais
+antigos: os criados por init_db já nascem com as FKs certas, e os índices que o
+upgrade criava foram substituídos pela migração 1 (access_path_indexes).
 """
 import sqlite3
 import os
@@ -1,7 +1,7 @@
 Param(
     [string]$Db = $env:GESTAO_DB
 )
-Write-Host "Running DB migration (init_db)..."
+Write-Host "Running DB migration (init_db + versioned migrations)..."
 if ($Db) { Write-Host "Using GESTAO_DB=$Db" }
-python -c "from db import init_db; init_db()"
+python scripts/migrate.py
 Write-Host "Migration complete."
@@ -1,8 +1,8 @@
 #!/usr/bin/env bash
 set -euo pipefail
-echo "Running DB migration (init_db)"
+echo "Running DB migration (init_db + versioned migrations)"
 if [ -n "${GESTAO_DB-}" ]; then
   echo "Using GESTAO_DB=${GESTAO_DB}"
 fi
-python -c "from db import init_db; init_db()"
+python scripts/migrate.py
 echo "Migration complete."
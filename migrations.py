@@ -0,0 +1,546 @@
+"""Versioned schema migrations for SQLite and Postgres.
+
+init_db() creates the base tables; every later schema change is a numbered
+Migration appended to MIGRATIONS. Applied versions are recorded in the
+schema_version table and each migration runs in its own transaction, so a
+failure leaves the database at the previous version.
+
+Migrations marked ``transactional=False`` run in autocommit mode on Postgres,
+which allows online operations such as CREATE INDEX CONCURRENTLY and batched
+backfills that commit per batch instead of holding one long lock.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from db import HISTORY_INDEXES, INDEXES, PAGINATION_INDEXES, IndexSpec, get_db_kind, pooled_connection
+
+logger = logging.getLogger(__name__)
+
+# Chave do pg_advisory_lock que serializa execuções concorrentes do runner
+_PG_LOCK_KEY = 724_310_001
+
+
+class MigrationContext:
+    """Helpers handed to each migration; hide the SQLite/Postgres differences."""
+
+    def __init__(self, conn, kind: str, transactional: bool):
+        self.conn = conn
+        self.kind = kind
+        self.transactional = transactional
+
+    def execute(self, pg_sql: str, sqlite_sql: Optional[str] = None, params=()):
+        """Executa SQL; ``sqlite_sql`` substitui ``pg_sql`` no SQLite quando a sintaxe difere."""
+        if self.kind == "sqlite":
+            return self.conn.execute(sqlite_sql or pg_sql, params)
+        cur = self.conn.cursor()
+        cur.execute(pg_sql, params)
+        rowcount = cur.rowcount
+        cur.close()
+        return rowcount
+
+    def create_index(self, spec: IndexSpec):
+        """Cria o índice; no Postgres fora de transação usa CREATE INDEX CONCURRENTLY."""
+        if self.kind == "sqlite":
+            where = f" WHERE {spec.where_sqlite}" if spec.where_sqlite else ""
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {spec.name} ON {spec.table} ({spec.columns}){where}")
+            return
+        where = f" WHERE {spec.where_pg}" if spec.where_pg else ""
+        concurrently = "" if self.transactional else " CONCURRENTLY"
+        cur = self.conn.cursor()
+        if not self.transactional:
+            # Um CREATE INDEX CONCURRENTLY interrompido deixa um índice inválido para trás
+            cur.execute(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = %s AND NOT i.indisvalid",
+                (spec.name,),
+            )
+            if cur.fetchone():
+                logger.warning("Removendo índice inválido %s antes de recriar", spec.name)
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {spec.name}")
+        cur.execute(f"CREATE INDEX{concurrently} IF NOT EXISTS {spec.name} ON {spec.table} ({spec.columns}){where}")
+        cur.close()
+
+    def backfill(self, table: str, set_sql: str, where_sql: str, batch_size: int = 1000) -> int:
+        """Atualiza ``table`` em lotes de ``batch_size`` linhas até ``where_sql`` não casar mais nenhuma.
+
+        Fora de transação cada lote é confirmado separadamente, mantendo os
+        bloqueios curtos e sem trafegar as linhas pelo cliente.
+        """
+        sql = (
+            f"UPDATE {table} SET {set_sql} WHERE id IN "
+            f"(SELECT id FROM {table} WHERE {where_sql} LIMIT {int(batch_size)})"
+        )
+        total = 0
+        while True:
+            if self.kind == "sqlite":
+                updated = self.conn.execute(sql).rowcount
+            else:
+                updated = self.execute(sql)
+            total += max(updated, 0)
+            if not self.transactional:
+                self.conn.commit()
+            if updated < batch_size:
+                break
+        logger.info("Backfill de %s: %s linha(s) atualizadas", table, total)
+        return total
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[MigrationContext], None]
+    transactional: bool = True
+
+
+def _m0001_access_path_indexes(ctx: MigrationContext):
+    for spec in INDEXES:
+        ctx.create_index(spec)
+
+
+def _m0002_app_meta(ctx: MigrationContext):
+    ctx.execute("CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+
+def _m0003_pagination_indexes(ctx: MigrationContext):
+    for spec in PAGINATION_INDEXES:
+        ctx.create_index(spec)
+
+
+_BALANCES_PG = [
+    """
+    CREATE TABLE IF NOT EXISTS balances (
+        user_id INTEGER PRIMARY KEY,
+        earned_money DOUBLE PRECISION NOT NULL DEFAULT 0,
+        earned_hours DOUBLE PRECISION NOT NULL DEFAULT 0,
+        debited_money DOUBLE PRECISION NOT NULL DEFAULT 0,
+        debited_hours DOUBLE PRECISION NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE OR REPLACE FUNCTION balances_apply(
+        p_user INTEGER, p_money DOUBLE PRECISION, p_hours DOUBLE PRECISION,
+        p_deb_money DOUBLE PRECISION, p_deb_hours DOUBLE PRECISION
+    ) RETURNS void AS $$
+    BEGIN
+        IF p_user IS NULL OR (p_money = 0 AND p_hours = 0 AND p_deb_money = 0 AND p_deb_hours = 0) THEN
+            RETURN;
+        END IF;
+        INSERT INTO balances (user_id, earned_money, earned_hours, debited_money, debited_hours)
+        SELECT p_user, p_money, p_hours, p_deb_money, p_deb_hours
+        WHERE EXISTS (SELECT 1 FROM users WHERE id = p_user)
+        ON CONFLICT (user_id) DO UPDATE SET
+            earned_money = balances.earned_money + EXCLUDED.earned_money,
+            earned_hours = balances.earned_hours + EXCLUDED.earned_hours,
+            debited_money = balances.debited_money + EXCLUDED.debited_money,
+            debited_hours = balances.debited_hours + EXCLUDED.debited_hours;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION tasks_balance_trg() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.validated THEN
+            PERFORM balances_apply(
+                OLD.child_id,
+                CASE WHEN OLD.conversion_type = 'money' THEN -OLD.points ELSE 0 END,
+                CASE WHEN OLD.conversion_type = 'hours' THEN -OLD.points ELSE 0 END,
+                0, 0);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.validated THEN
+            PERFORM balances_apply(
+                NEW.child_id,
+                CASE WHEN NEW.conversion_type = 'money' THEN NEW.points ELSE 0 END,
+                CASE WHEN NEW.conversion_type = 'hours' THEN NEW.points ELSE 0 END,
+                0, 0);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION debits_balance_trg() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM balances_apply(OLD.user_id, 0, 0,
+                -COALESCE(OLD.money_amount, 0), -COALESCE(OLD.hours_amount, 0));
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM balances_apply(NEW.user_id, 0, 0,
+                COALESCE(NEW.money_amount, 0), COALESCE(NEW.hours_amount, 0));
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS tasks_balance ON tasks",
+    """
+    CREATE TRIGGER tasks_balance
+    AFTER INSERT OR DELETE OR UPDATE OF validated, points, conversion_type, child_id ON tasks
+    FOR EACH ROW EXECUTE FUNCTION tasks_balance_trg()
+    """,
+    "DROP TRIGGER IF EXISTS debits_balance ON debits",
+    """
+    CREATE TRIGGER debits_balance
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, money_amount, hours_amount ON debits
+    FOR EACH ROW EXECUTE FUNCTION debits_balance_trg()
+    """,
+]
+
+
+def _sqlite_balance_upsert(user: str, money: str, hours: str, deb_money: str, deb_hours: str, when: str = "1") -> str:
+    return f"""
+        INSERT INTO balances (user_id, earned_money, earned_hours, debited_money, debited_hours)
+        SELECT {user}, {money}, {hours}, {deb_money}, {deb_hours}
+        WHERE ({when}) AND EXISTS (SELECT 1 FROM users WHERE id = {user})
+        ON CONFLICT (user_id) DO UPDATE SET
+            earned_money = earned_money + excluded.earned_money,
+            earned_hours = earned_hours + excluded.earned_hours,
+            debited_money = debited_money + excluded.debited_money,
+            debited_hours = debited_hours + excluded.debited_hours;
+    """
+
+
+def _sqlite_task_delta(row: str, sign: str) -> tuple:
+    return (
+        f"CASE WHEN {row}.conversion_type = 'money' THEN {sign}{row}.points ELSE 0 END",
+        f"CASE WHEN {row}.conversion_type = 'hours' THEN {sign}{row}.points ELSE 0 END",
+    )
+
+
+_BALANCES_SQLITE = [
+    """
+    CREATE TABLE IF NOT EXISTS balances (
+        user_id INTEGER PRIMARY KEY,
+        earned_money REAL NOT NULL DEFAULT 0,
+        earned_hours REAL NOT NULL DEFAULT 0,
+        debited_money REAL NOT NULL DEFAULT 0,
+        debited_hours REAL NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE TRIGGER IF NOT EXISTS tasks_balance_ins AFTER INSERT ON tasks WHEN NEW.validated BEGIN"
+    + _sqlite_balance_upsert("NEW.child_id", *_sqlite_task_delta("NEW", ""), "0", "0") + "END",
+    "CREATE TRIGGER IF NOT EXISTS tasks_balance_del AFTER DELETE ON tasks WHEN OLD.validated BEGIN"
+    + _sqlite_balance_upsert("OLD.child_id", *_sqlite_task_delta("OLD", "-"), "0", "0") + "END",
+    "CREATE TRIGGER IF NOT EXISTS tasks_balance_upd AFTER UPDATE OF validated, points, conversion_type, child_id ON tasks BEGIN"
+    + _sqlite_balance_upsert("OLD.child_id", *_sqlite_task_delta("OLD", "-"), "0", "0", when="OLD.validated")
+    + _sqlite_balance_upsert("NEW.child_id", *_sqlite_task_delta("NEW", ""), "0", "0", when="NEW.validated") + "END",
+    "CREATE TRIGGER IF NOT EXISTS debits_balance_ins AFTER INSERT ON debits BEGIN"
+    + _sqlite_balance_upsert("NEW.user_id", "0", "0", "COALESCE(NEW.money_amount, 0)", "COALESCE(NEW.hours_amount, 0)") + "END",
+    "CREATE TRIGGER IF NOT EXISTS debits_balance_del AFTER DELETE ON debits BEGIN"
+    + _sqlite_balance_upsert("OLD.user_id", "0", "0", "-COALESCE(OLD.money_amount, 0)", "-COALESCE(OLD.hours_amount, 0)") + "END",
+    "CREATE TRIGGER IF NOT EXISTS debits_balance_upd AFTER UPDATE OF user_id, money_amount, hours_amount ON debits BEGIN"
+    + _sqlite_balance_upsert("OLD.user_id", "0", "0", "-COALESCE(OLD.money_amount, 0)", "-COALESCE(OLD.hours_amount, 0)")
+    + _sqlite_balance_upsert("NEW.user_id", "0", "0", "COALESCE(NEW.money_amount, 0)", "COALESCE(NEW.hours_amount, 0)") + "END",
+]
+
+# Saldos iniciais calculados no servidor (sem trafegar linhas pelo cliente)
+_BALANCES_BACKFILL = """
+    INSERT INTO balances (user_id, earned_money, earned_hours, debited_money, debited_hours)
+    SELECT u.id,
+        COALESCE((SELECT SUM(t.points) FROM tasks t
+                  WHERE t.child_id = u.id AND t.validated = {true} AND t.conversion_type = 'money'), 0),
+        COALESCE((SELECT SUM(t.points) FROM tasks t
+                  WHERE t.child_id = u.id AND t.validated = {true} AND t.conversion_type = 'hours'), 0),
+        COALESCE((SELECT SUM(d.money_amount) FROM debits d WHERE d.user_id = u.id), 0),
+        COALESCE((SELECT SUM(d.hours_amount) FROM debits d WHERE d.user_id = u.id), 0)
+    FROM users u
+    WHERE NOT EXISTS (SELECT 1 FROM balances b WHERE b.user_id = u.id)
+"""
+
+
+def _m0004_balances(ctx: MigrationContext):
+    statements = _BALANCES_PG if ctx.kind == "pg" else _BALANCES_SQLITE
+    for sql in statements:
+        ctx.execute(sql)
+    ctx.execute(_BALANCES_BACKFILL.format(true="TRUE" if ctx.kind == "pg" else "1"))
+
+
+def _m0005_history_indexes(ctx: MigrationContext):
+    for spec in HISTORY_INDEXES:
+        ctx.create_index(spec)
+
+
+def _rate_lookup(kind: str, column: str, ts: str) -> str:
+    """Taxa da conversão em vigor no instante ``ts`` (1 quando não há versão)."""
+    if kind == "pg":
+        cond, order = f"c.effective_from <= {ts}", "c.effective_from DESC"
+    else:
+        cond, order = _sqlite_effective("c.effective_from", ts)
+    return (
+        f"COALESCE((SELECT c.{column} FROM conversions c WHERE {cond} "
+        f"ORDER BY {order}, c.id DESC LIMIT 1), 1)"
+    )
+
+
+def _sqlite_effective(effective_from: str, ts: str) -> tuple:
+    """Condição ``effective_from <= ts`` e ordenação (mais recente primeiro) no SQLite.
+
+    julianday() aceita os vários formatos de texto, mas arredonda para
+    milissegundos; no empate o texto ISO (com 'T' ou ' ') decide, senão uma
+    versão criada no mesmo milissegundo da validação valeria para ela.
+    """
+    eff, at = f"julianday({effective_from})", f"julianday({ts})"
+    eff_text, at_text = f"replace({effective_from}, 'T', ' ')", f"replace({ts}, 'T', ' ')"
+    return (
+        f"({eff} < {at} OR ({eff} = {at} AND {eff_text} <= {at_text}))",
+        f"{eff} DESC, {eff_text} DESC",
+    )
+
+
+def _rated_task_delta(kind: str, row: str, sign: str) -> tuple:
+    ts = f"COALESCE({row}.validated_at, {row}.created_at)"
+    return (
+        f"CASE WHEN {row}.conversion_type = 'money' "
+        f"THEN {sign}{row}.points * {_rate_lookup(kind, 'money_per_point', ts)} ELSE 0 END",
+        f"CASE WHEN {row}.conversion_type = 'hours' "
+        f"THEN {sign}{row}.points * {_rate_lookup(kind, 'hours_per_point', ts)} ELSE 0 END",
+    )
+
+
+def _conversion_versions_pg() -> List[str]:
+    old_money, old_hours = _rated_task_delta("pg", "OLD", "-")
+    new_money, new_hours = _rated_task_delta("pg", "NEW", "")
+    return [
+        "ALTER TABLE conversions ADD COLUMN IF NOT EXISTS effective_from TIMESTAMP WITH TIME ZONE "
+        "NOT NULL DEFAULT '1970-01-01T00:00:00Z'",
+        "ALTER TABLE conversions ALTER COLUMN effective_from SET DEFAULT NOW()",
+        f"""
+        CREATE OR REPLACE FUNCTION tasks_balance_trg() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.validated THEN
+                PERFORM balances_apply(OLD.child_id, {old_money}, {old_hours}, 0, 0);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.validated THEN
+                PERFORM balances_apply(NEW.child_id, {new_money}, {new_hours}, 0, 0);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS tasks_balance ON tasks",
+        """
+        CREATE TRIGGER tasks_balance
+        AFTER INSERT OR DELETE OR UPDATE OF validated, validated_at, points, conversion_type, child_id ON tasks
+        FOR EACH ROW EXECUTE FUNCTION tasks_balance_trg()
+        """,
+    ]
+
+
+def _conversion_versions_sqlite() -> List[str]:
+    old = _rated_task_delta("sqlite", "OLD", "-")
+    new = _rated_task_delta("sqlite", "NEW", "")
+    return [
+        # ALTER TABLE do SQLite só aceita default constante; set_conversion informa a data
+        "ALTER TABLE conversions ADD COLUMN effective_from TEXT NOT NULL DEFAULT '1970-01-01 00:00:00'",
+        "DROP TRIGGER IF EXISTS tasks_balance_ins",
+        "DROP TRIGGER IF EXISTS tasks_balance_del",
+        "DROP TRIGGER IF EXISTS tasks_balance_upd",
+        "CREATE TRIGGER tasks_balance_ins AFTER INSERT ON tasks WHEN NEW.validated BEGIN"
+        + _sqlite_balance_upsert("NEW.child_id", *new, "0", "0") + "END",
+        "CREATE TRIGGER tasks_balance_del AFTER DELETE ON tasks WHEN OLD.validated BEGIN"
+        + _sqlite_balance_upsert("OLD.child_id", *old, "0", "0") + "END",
+        "CREATE TRIGGER tasks_balance_upd AFTER UPDATE OF validated, validated_at, points, conversion_type, child_id "
+        "ON tasks BEGIN"
+        + _sqlite_balance_upsert("OLD.child_id", *old, "0", "0", when="OLD.validated")
+        + _sqlite_balance_upsert("NEW.child_id", *new, "0", "0", when="NEW.validated") + "END",
+    ]
+
+
+def _m0006_conversion_versions(ctx: MigrationContext):
+    """Taxas de conversão versionadas por effective_from e aplicadas nos saldos.
+
+    Até aqui tasks.points guardava o próprio valor em R$/horas (o formulário
+    pedia 'Valor'). Para que nenhum saldo mude, num banco com tarefas:
+    - as tarefas pendentes têm points convertido pela taxa atual (serão
+      validadas depois e multiplicadas por ela);
+    - as conversões existentes passam a valer a partir desta migração e uma
+      versão identidade (1/1) cobre de 1970 até aqui, então tarefas já
+      validadas continuam valendo exatamente o que valiam.
+    Depois os saldos são recalculados pela taxa em vigor em cada validação.
+    """
+    statements = _conversion_versions_pg() if ctx.kind == "pg" else _conversion_versions_sqlite()
+    for sql in statements:
+        ctx.execute(sql)
+    true = "TRUE" if ctx.kind == "pg" else "1"
+    false = "FALSE" if ctx.kind == "pg" else "0"
+    legacy = "EXISTS (SELECT 1 FROM conversions) AND EXISTS (SELECT 1 FROM tasks)"
+    current_rate = (
+        "CASE WHEN tasks.conversion_type = 'money' "
+        "THEN (SELECT c.money_per_point FROM conversions c ORDER BY c.id DESC LIMIT 1) "
+        "ELSE (SELECT c.hours_per_point FROM conversions c ORDER BY c.id DESC LIMIT 1) END"
+    )
+    ctx.execute(
+        f"UPDATE tasks SET points = points / {current_rate} "
+        f"WHERE validated = {false} AND {current_rate} <> 0 AND EXISTS (SELECT 1 FROM conversions)"
+    )
+    ctx.execute(
+        f"UPDATE conversions SET effective_from = NOW() WHERE {legacy}",
+        f"UPDATE conversions SET effective_from = ? WHERE {legacy}",
+        () if ctx.kind == "pg" else (datetime.utcnow().isoformat(sep=" "),),
+    )
+    ctx.execute(
+        "INSERT INTO conversions (money_per_point, hours_per_point, effective_from) "
+        f"SELECT 1, 1, '1970-01-01T00:00:00Z' WHERE {legacy}",
+        "INSERT INTO conversions (money_per_point, hours_per_point, effective_from) "
+        f"SELECT 1, 1, '1970-01-01 00:00:00' WHERE {legacy}",
+    )
+    money = _rate_lookup(ctx.kind, "money_per_point", "COALESCE(t.validated_at, t.created_at)")
+    hours = _rate_lookup(ctx.kind, "hours_per_point", "COALESCE(t.validated_at, t.created_at)")
+    ctx.execute("DELETE FROM balances")
+    ctx.execute(
+        f"""
+        INSERT INTO balances (user_id, earned_money, earned_hours, debited_money, debited_hours)
+        SELECT u.id,
+            COALESCE((SELECT SUM(t.points * {money}) FROM tasks t
+                      WHERE t.child_id = u.id AND t.validated = {true} AND t.conversion_type = 'money'), 0),
+            COALESCE((SELECT SUM(t.points * {hours}) FROM tasks t
+                      WHERE t.child_id = u.id AND t.validated = {true} AND t.conversion_type = 'hours'), 0),
+            COALESCE((SELECT SUM(d.money_amount) FROM debits d WHERE d.user_id = u.id), 0),
+            COALESCE((SELECT SUM(d.hours_amount) FROM debits d WHERE d.user_id = u.id), 0)
+        FROM users u
+        """
+    )
+
+
+# Nunca renumere ou altere uma migração já publicada; acrescente uma nova.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "access_path_indexes", _m0001_access_path_indexes, transactional=False),
+    Migration(2, "app_meta", _m0002_app_meta),
+    Migration(3, "pagination_indexes", _m0003_pagination_indexes, transactional=False),
+    Migration(4, "balances", _m0004_balances),
+    Migration(5, "history_indexes", _m0005_history_indexes, transactional=False),
+    Migration(6, "conversion_versions", _m0006_conversion_versions),
+]
+
+
+def _ensure_version_table(conn, kind: str):
+    if kind == "sqlite":
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+            "applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        conn.commit()
+        return
+    cur = conn.cursor()
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+        "applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW())"
+    )
+    cur.close()
+    conn.commit()
+
+
+def _applied_versions(conn, kind: str) -> Dict[int, str]:
+    if kind == "sqlite":
+        rows = conn.execute("SELECT version, applied_at FROM schema_version").fetchall()
+        return {row["version"]: row["applied_at"] for row in rows}
+    cur = conn.cursor()
+    cur.execute("SELECT version, applied_at FROM schema_version")
+    rows = cur.fetchall()
+    cur.close()
+    return {
+        (row["version"] if isinstance(row, dict) else row[0]): (row["applied_at"] if isinstance(row, dict) else row[1])
+        for row in rows
+    }
+
+
+def _record(ctx: MigrationContext, migration: Migration):
+    ctx.execute(
+        "INSERT INTO schema_version (version, name) VALUES (%s, %s)",
+        "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+        (migration.version, migration.name),
+    )
+
+
+def _apply_sqlite(conn, migration: Migration) -> bool:
+    # BEGIN IMMEDIATE serializa processos concorrentes; a versão é conferida de novo já com o lock
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if migration.version in _applied_versions(conn, "sqlite"):
+            conn.rollback()
+            return False
+        ctx = MigrationContext(conn, "sqlite", transactional=True)
+        migration.apply(ctx)
+        _record(ctx, migration)
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _apply_pg(conn, migration: Migration) -> bool:
+    if migration.version in _applied_versions(conn, "pg"):
+        conn.rollback()
+        return False
+    if migration.transactional:
+        ctx = MigrationContext(conn, "pg", transactional=True)
+        try:
+            migration.apply(ctx)
+            _record(ctx, migration)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return True
+    conn.rollback()
+    conn.autocommit = True
+    try:
+        migration.apply(MigrationContext(conn, "pg", transactional=False))
+    finally:
+        conn.autocommit = False
+    # Operações online devem ser idempotentes: se falharem antes do registro, rodam de novo
+    _record(MigrationContext(conn, "pg", transactional=True), migration)
+    conn.commit()
+    return True
+
+
+def migrate(target: Optional[int] = None) -> List[int]:
+    """Aplica, em ordem, as migrações pendentes até ``target`` (ou todas). Retorna as versões aplicadas."""
+    kind = get_db_kind()
+    applied = []
+    with pooled_connection() as conn:
+        _ensure_version_table(conn, kind)
+        if kind == "pg":
+            cur = conn.cursor()
+            cur.execute("SELECT pg_advisory_lock(%s)", (_PG_LOCK_KEY,))
+            cur.close()
+            conn.commit()
+        try:
+            for migration in MIGRATIONS:
+                if target is not None and migration.version > target:
+                    break
+                done = _apply_sqlite(conn, migration) if kind == "sqlite" else _apply_pg(conn, migration)
+                if done:
+                    logger.info("Migração %04d_%s aplicada", migration.version, migration.name)
+                    applied.append(migration.version)
+        finally:
+            if kind == "pg":
+                conn.rollback()
+                cur = conn.cursor()
+                cur.execute("SELECT pg_advisory_unlock(%s)", (_PG_LOCK_KEY,))
+                cur.close()
+                conn.commit()
+    return applied
+
+
+def migration_status() -> List[Dict[str, object]]:
+    """Lista cada migração conhecida com a data em que foi aplicada (ou None)."""
+    kind = get_db_kind()
+    with pooled_connection() as conn:
+        _ensure_version_table(conn, kind)
+        done = _applied_versions(conn, kind)
+    return [
+        {"version": m.version, "name": m.name, "applied_at": done.get(m.version)}
+        for m in MIGRATIONS
+    ]
+
+
+def current_version() -> int:
+    done = [row["version"] for row in migration_status() if row["applied_at"] is not None]
+    return max(done, default=0)
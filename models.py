@@ -4,8 +4,8 @@ These lightweight dataclasses replace the previous SQLAlchemy models so that the
 rest of the application can continue to interact with plain Python objects even
 though persistence is now handled via the sqlite3 module directly.
 """
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
 
 
 @dataclass
@@ -23,6 +23,7 @@ class Conversion:
     id: int
     money_per_point: float
     hours_per_point: float
+    effective_from: Optional[str] = None
 
 
 @dataclass
@@ -49,3 +50,17 @@ class Debit:
     reason: Optional[str]
     performed_by_id: int
     created_at: str
+
+
+@dataclass
+class IngestReport:
+    table: str
+    rows_read: int = 0
+    inserted: int = 0
+    rejected: List[Tuple[int, str]] = field(default_factory=list)  # (linha, motivo)
+    seconds: float = 0.0
+    method: str = ""
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.inserted / self.seconds if self.seconds > 0 else 0.0
@@ -0,0 +1,228 @@
+"""
+Hash de senhas com KDF salgado (scrypt, ou PBKDF2-SHA256 quando o OpenSSL não
+oferece scrypt) executado num pool limitado de threads.
+
+Formatos armazenados em users.password_hash:
+- ``scrypt$<n>$<r>$<p>$<salt b64>$<hash b64>``
+- ``pbkdf2_sha256$<iterações>$<salt b64>$<hash b64>``
+- legado: SHA-256 hexadecimal sem salt (aceito na verificação e trocado pelo
+  formato atual no próximo login bem-sucedido, ver needs_rehash()).
+
+Configuração (variáveis de ambiente ou st.secrets):
+- GESTAO_PASSWORD_SCRYPT_N (padrão 16384), GESTAO_PASSWORD_SCRYPT_R (8),
+  GESTAO_PASSWORD_SCRYPT_P (1)
+- GESTAO_PASSWORD_PBKDF2_ITERATIONS (padrão 600000)
+- GESTAO_PASSWORD_WORKERS: threads do pool (padrão min(4, CPUs))
+- GESTAO_PASSWORD_QUEUE: máximo de cálculos pendentes (padrão 32)
+- GESTAO_PASSWORD_QUEUE_TIMEOUT: segundos de espera por vaga (padrão 10)
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+from db import _get_int_setting
+
+logger = logging.getLogger(__name__)
+
+_SALT_BYTES = 16
+_KEY_BYTES = 32
+
+
+class PasswordQueueFull(RuntimeError):
+    """O pool de hash está saturado e não abriu vaga dentro do timeout."""
+
+
+@lru_cache(maxsize=1)
+def _params() -> Dict[str, int]:
+    return {
+        "n": _get_int_setting("GESTAO_PASSWORD_SCRYPT_N", 16384),
+        "r": _get_int_setting("GESTAO_PASSWORD_SCRYPT_R", 8),
+        "p": _get_int_setting("GESTAO_PASSWORD_SCRYPT_P", 1),
+        "iterations": _get_int_setting("GESTAO_PASSWORD_PBKDF2_ITERATIONS", 600_000),
+    }
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode()
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=_KEY_BYTES
+    )
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, dklen=_KEY_BYTES)
+
+
+def _derive(password: str) -> str:
+    params = _params()
+    salt = secrets.token_bytes(_SALT_BYTES)
+    if hasattr(hashlib, "scrypt"):
+        n, r, p = params["n"], params["r"], params["p"]
+        return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+    iterations = params["iterations"]
+    return f"pbkdf2_sha256${iterations}${_b64(salt)}${_b64(_pbkdf2(password, salt, iterations))}"
+
+
+def _is_legacy(stored: str) -> bool:
+    return len(stored) == 64 and "$" not in stored
+
+
+def _check(password: str, stored: str) -> bool:
+    if _is_legacy(stored):
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(candidate, stored)
+    parts = stored.split("$")
+    try:
+        if parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            salt, expected = base64.b64decode(parts[4]), base64.b64decode(parts[5])
+            return hmac.compare_digest(_scrypt(password, salt, n, r, p), expected)
+        if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            salt, expected = base64.b64decode(parts[2]), base64.b64decode(parts[3])
+            return hmac.compare_digest(_pbkdf2(password, salt, int(parts[1])), expected)
+    except (ValueError, TypeError):
+        pass
+    logger.warning("Formato de hash de senha desconhecido")
+    return False
+
+
+class KdfExecutor:
+    """Pool limitado para o cálculo de KDF, com fila de tamanho máximo.
+
+    Cada chamada ocupa uma vaga de ``max_pending`` enquanto espera ou roda; se
+    não houver vaga em ``timeout`` segundos, levanta PasswordQueueFull em vez
+    de acumular trabalho sem limite durante uma rajada de logins.
+    """
+
+    def __init__(self, workers: int, max_pending: int, timeout: float):
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="kdf")
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._peak_pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._queue_wait = 0.0
+        self._run_time = 0.0
+
+    def run(self, fn: Callable, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._rejected += 1
+            raise PasswordQueueFull(f"{self.max_pending} cálculos de senha pendentes")
+        submitted_at = time.monotonic()
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+            self._peak_pending = max(self._peak_pending, self._pending)
+
+        def task():
+            started = time.monotonic()
+            try:
+                return fn(*args)
+            finally:
+                finished = time.monotonic()
+                with self._lock:
+                    self._queue_wait += started - submitted_at
+                    self._run_time += finished - started
+
+        try:
+            return self._executor.submit(task).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            completed = self._completed
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "peak_pending": self._peak_pending,
+                "submitted": self._submitted,
+                "completed": completed,
+                "rejected": self._rejected,
+                "queue_wait": self._queue_wait,
+                "avg_queue_wait": self._queue_wait / completed if completed else 0.0,
+                "avg_run_time": self._run_time / completed if completed else 0.0,
+            }
+
+
+_EXECUTOR: Optional[KdfExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_executor() -> KdfExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = KdfExecutor(
+                    workers=_get_int_setting("GESTAO_PASSWORD_WORKERS", min(4, os.cpu_count() or 1)),
+                    max_pending=_get_int_setting("GESTAO_PASSWORD_QUEUE", 32),
+                    timeout=float(_get_int_setting("GESTAO_PASSWORD_QUEUE_TIMEOUT", 10)),
+                )
+    return _EXECUTOR
+
+
+def hash_password(password: str) -> str:
+    """Hash salgado no formato atual, calculado no pool de KDF."""
+    return _get_executor().run(_derive, password or "")
+
+
+def verify_password(password: str, stored: Optional[str]) -> bool:
+    """Confere a senha contra o hash armazenado (atual ou legado)."""
+    if not stored:
+        return False
+    return _get_executor().run(_check, password or "", stored)
+
+
+def needs_rehash(stored: str) -> bool:
+    """True para hashes legados ou calculados com custo diferente do configurado."""
+    if not stored or _is_legacy(stored):
+        return True
+    parts = stored.split("$")
+    params = _params()
+    if parts[0] == "scrypt":
+        if not hasattr(hashlib, "scrypt"):
+            return False
+        return parts[1:4] != [str(params["n"]), str(params["r"]), str(params["p"])]
+    if parts[0] == "pbkdf2_sha256":
+        return hasattr(hashlib, "scrypt") or parts[1] != str(params["iterations"])
+    return True
+
+
+@lru_cache(maxsize=1)
+def _dummy_hash() -> str:
+    return _derive(secrets.token_hex(8))
+
+
+def burn_verification(password: str):
+    """Gasta o mesmo custo de uma verificação real (usuário inexistente).
+
+    Evita que o tempo de resposta do login revele quais e-mails existem.
+    """
+    verify_password(password, _dummy_hash())
+
+
+def hasher_stats() -> Dict[str, float]:
+    """Métricas do pool de KDF: vagas, pendências, rejeições e tempos médios."""
+    return _get_executor().stats()
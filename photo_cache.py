@@ -0,0 +1,277 @@
+"""
+Cache em disco (LRU limitado por tamanho) das fotos remotas, chaveado pela URL.
+
+Uma foto baixada fica em memória e em disco e é servida sem nenhuma requisição
+enquanto estiver fresca (max-age do Cache-Control da resposta, ou
+GESTAO_PHOTO_CACHE_TTL). Vencido o prazo, revalida com If-None-Match /
+If-Modified-Since: um 304 renova o prazo sem baixar o corpo. Se a rede falhar,
+a cópia antiga continua sendo servida.
+
+Configuração (variáveis de ambiente ou st.secrets):
+- GESTAO_PHOTO_CACHE_DIR: diretório (padrão .cache/photos)
+- GESTAO_PHOTO_CACHE_MB: limite do disco (padrão 100)
+- GESTAO_PHOTO_CACHE_MEMORY_MB: limite em memória (padrão 16)
+- GESTAO_PHOTO_CACHE_TTL: segundos de frescor sem Cache-Control (padrão 3600)
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from db import _get_int_setting, _get_setting
+
+logger = logging.getLogger(__name__)
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class PhotoCache:
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 100 * 1024 * 1024,
+        max_memory_bytes: int = 16 * 1024 * 1024,
+        default_ttl: float = 3600.0,
+        session=None,
+        timeout=(3, 10),
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.default_ttl = default_ttl
+        self.timeout = timeout
+        if session is None:
+            import requests  # adiado: só quem exibe fotos remotas paga o import
+
+            session = requests.Session()
+        self._session = session
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (bytes, meta)
+        self._memory_bytes = 0
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "revalidated": 0,
+            "misses": 0,
+            "errors": 0,
+            "stale_served": 0,
+            "evictions": 0,
+            "bytes_downloaded": 0,
+            "bytes_saved": 0,
+        }
+        os.makedirs(directory, exist_ok=True)
+        self._disk_bytes = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in os.listdir(directory)
+            if name.endswith(".bin")
+        )
+
+    # -- arquivos -------------------------------------------------------------
+
+    def _key(self, url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _paths(self, key: str) -> tuple:
+        base = os.path.join(self.directory, key)
+        return base + ".bin", base + ".json"
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, encoding="utf-8") as fh:
+                meta = json.load(fh)
+            with open(data_path, "rb") as fh:
+                data = fh.read()
+            os.utime(data_path)  # LRU pelo mtime
+        except (OSError, ValueError):
+            # Ausente, corrompido ou removido por outro processo: falta
+            return None
+        return data, meta
+
+    def _replace_file(self, path: str, payload, mode: str):
+        # Escrita atômica: nunca deixa um arquivo truncado para outro processo ler
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, mode) as fh:
+                fh.write(payload)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _write_disk(self, key: str, data: bytes, meta: dict):
+        data_path, meta_path = self._paths(key)
+        previous = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        self._replace_file(data_path, data, "wb")
+        self._replace_file(meta_path, json.dumps(meta), "w")
+        self._disk_bytes += len(data) - previous
+        self._evict_disk()
+
+    def _write_meta(self, key: str, meta: dict):
+        _, meta_path = self._paths(key)
+        try:
+            self._replace_file(meta_path, json.dumps(meta), "w")
+        except OSError:
+            logger.warning("Falha ao gravar metadados do cache de fotos", exc_info=True)
+
+    def _evict_disk(self):
+        if self._disk_bytes <= self.max_bytes:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name[:-4]))
+        for _, size, key in sorted(entries):
+            if self._disk_bytes <= self.max_bytes:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._disk_bytes -= size
+            self._forget_memory(key)
+            self._stats["evictions"] += 1
+
+    # -- memória --------------------------------------------------------------
+
+    def _remember(self, key: str, data: bytes, meta: dict):
+        self._forget_memory(key)
+        if len(data) > self.max_memory_bytes:
+            return
+        self._memory[key] = (data, meta)
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (old, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+
+    def _forget_memory(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry:
+            self._memory_bytes -= len(entry[0])
+
+    # -- API ------------------------------------------------------------------
+
+    def _fresh_until(self, response) -> float:
+        match = _MAX_AGE_RE.search(response.headers.get("Cache-Control", ""))
+        ttl = float(match.group(1)) if match else self.default_ttl
+        return time.time() + ttl
+
+    def get(self, url: str) -> Optional[bytes]:
+        """Bytes da foto, do cache quando possível; None se não der para obter."""
+        key = self._key(url)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                self._memory.move_to_end(key)
+                source = "memory_hits"
+            else:
+                entry = self._read_disk(key)
+                source = "disk_hits"
+                if entry:
+                    self._remember(key, *entry)
+            if entry and entry[1].get("fresh_until", 0) > time.time():
+                self._stats[source] += 1
+                self._stats["bytes_saved"] += len(entry[0])
+                return entry[0]
+
+        headers = {}
+        if entry:
+            if entry[1].get("etag"):
+                headers["If-None-Match"] = entry[1]["etag"]
+            if entry[1].get("last_modified"):
+                headers["If-Modified-Since"] = entry[1]["last_modified"]
+        try:
+            response = self._session.get(url, headers=headers, timeout=self.timeout)
+        except OSError:  # requests.RequestException herda de IOError
+            logger.warning("Falha ao baixar foto %s", url, exc_info=True)
+            with self._lock:
+                self._stats["errors"] += 1
+                if entry:
+                    self._stats["stale_served"] += 1
+                    return entry[0]
+            return None
+
+        with self._lock:
+            if response.status_code == 304 and entry:
+                data, meta = entry
+                meta = dict(meta, fresh_until=self._fresh_until(response))
+                self._write_meta(key, meta)
+                self._remember(key, data, meta)
+                self._stats["revalidated"] += 1
+                self._stats["bytes_saved"] += len(data)
+                return data
+            if not response.ok:
+                self._stats["errors"] += 1
+                if entry:
+                    self._stats["stale_served"] += 1
+                    return entry[0]
+                return None
+            data = response.content
+            meta = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "fresh_until": self._fresh_until(response),
+            }
+            self._stats["misses"] += 1
+            self._stats["bytes_downloaded"] += len(data)
+            try:
+                self._write_disk(key, data, meta)
+            except OSError:
+                logger.warning("Falha ao gravar foto no cache em disco", exc_info=True)
+            self._remember(key, data, meta)
+            return data
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"] + self._stats["revalidated"]
+            lookups = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "disk_bytes": self._disk_bytes,
+                "memory_bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_CACHE: Optional[PhotoCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_photo_cache() -> PhotoCache:
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = PhotoCache(
+                    _get_setting("GESTAO_PHOTO_CACHE_DIR", os.path.join(".cache", "photos")),
+                    max_bytes=_get_int_setting("GESTAO_PHOTO_CACHE_MB", 100) * 1024 * 1024,
+                    max_memory_bytes=_get_int_setting("GESTAO_PHOTO_CACHE_MEMORY_MB", 16) * 1024 * 1024,
+                    default_ttl=float(_get_int_setting("GESTAO_PHOTO_CACHE_TTL", 3600)),
+                )
+    return _CACHE
+
+
+def fetch_photo(url: str) -> Optional[bytes]:
+    return get_photo_cache().get(url)
+
+
+def photo_cache_stats() -> Dict[str, float]:
+    """Acertos (memória, disco, revalidação 304), faltas, taxa de acerto e bytes economizados."""
+    return get_photo_cache().stats()
@@ -0,0 +1,85 @@
+"""
+Miniaturas das fotos de usuário.
+
+save_user_photo decodifica a imagem enviada, aplica a orientação EXIF, descarta
+os metadados e gera versões quadradas de tamanho fixo (RENDITION_SIZES). Todas
+são gravadas com o mesmo prefixo e o sufixo ``_<tamanho>px.<ext>``; a coluna
+users.photo guarda a maior, e rendition_for() troca o sufixo pela menor versão
+que cobre a largura pedida.
+"""
+import io
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+# Pillow é importado só ao gerar miniaturas: rendition_for() roda a cada
+# página e não precisa dele
+RENDITION_SIZES = (64, 128, 256)
+
+# Limite de pixels da imagem enviada (protege contra "bombas" de descompressão)
+MAX_SOURCE_PIXELS = 40_000_000
+
+_RENDITION_RE = re.compile(r"_(\d+)px\.(webp|jpg)$")
+
+
+def _output_format() -> Tuple[str, str, str]:
+    """(formato Pillow, extensão, content-type): WebP quando disponível, senão JPEG."""
+    from PIL import features
+
+    if features.check("webp"):
+        return "WEBP", "webp", "image/webp"
+    return "JPEG", "jpg", "image/jpeg"
+
+
+def make_renditions(data: bytes) -> Dict[int, Tuple[bytes, str, str]]:
+    """Gera as versões da foto: {tamanho: (bytes, extensão, content-type)}.
+
+    Levanta ValueError se os bytes não forem uma imagem válida.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            if source.width * source.height > MAX_SOURCE_PIXELS:
+                raise ValueError("Imagem grande demais")
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as exc:
+        raise ValueError(f"Arquivo de imagem inválido: {exc}") from exc
+
+    fmt, ext, mime = _output_format()
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha and fmt == "WEBP" else "RGB")
+
+    renditions = {}
+    for size in RENDITION_SIZES:
+        thumb = ImageOps.fit(image, (size, size), method=Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        # Imagem nova: nenhum EXIF/ICC/XMP do original é copiado
+        if fmt == "WEBP":
+            thumb.save(out, format=fmt, quality=85, method=4)
+        else:
+            thumb.save(out, format=fmt, quality=85, optimize=True, progressive=True)
+        renditions[size] = (out.getvalue(), ext, mime)
+    return renditions
+
+
+def rendition_name(base: str, size: int, ext: str) -> str:
+    return f"{base}_{size}px.{ext}"
+
+
+def rendition_for(path: Optional[str], width: int) -> Optional[str]:
+    """URL/caminho da menor versão com lado >= ``width`` (ou a maior existente).
+
+    Fotos antigas, sem o sufixo de tamanho, são devolvidas como estão.
+    """
+    if not path:
+        return path
+    match = _RENDITION_RE.search(path)
+    if not match:
+        return path
+    size = next((s for s in RENDITION_SIZES if s >= width), RENDITION_SIZES[-1])
+    candidate = path[: match.start()] + f"_{size}px.{match.group(2)}"
+    if candidate.startswith(("http://", "https://")) or os.path.exists(candidate):
+        return candidate
+    return path
@@ -0,0 +1,54 @@
+"""
+Importa tarefas ou débitos em lote a partir de CSV (com cabeçalho) ou NDJSON.
+
+Executar:
+  python scripts/bulk_ingest.py tasks historico_tarefas.csv
+  python scripts/bulk_ingest.py debits debitos.ndjson --batch-size 5000
+
+Colunas de tasks: name, points (ou amount), conversion_type, child_id, submitted_by_id,
+validator_id, validated, created_at, validated_at.
+Colunas de debits: user_id, points_deducted, money_amount, hours_amount, reason,
+performed_by_id, created_at.
+"""
+import argparse
+import csv
+import json
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from db import init_db
+from services import bulk_ingest
+
+
+def read_rows(path: Path):
+    """Lê o arquivo linha a linha (sem carregar tudo em memória)."""
+    with path.open(encoding="utf-8-sig", newline="") as fh:
+        if path.suffix.lower() in (".ndjson", ".jsonl"):
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(fh)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Importa tarefas ou débitos em lote.")
+    parser.add_argument("table", choices=["tasks", "debits"])
+    parser.add_argument("path", type=Path, help="arquivo .csv ou .ndjson/.jsonl")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    init_db()
+    report = bulk_ingest(args.table, read_rows(args.path), batch_size=args.batch_size)
+    print(f"Tabela: {report.table} (método: {report.method})")
+    print(f"Lidas: {report.rows_read} | Inseridas: {report.inserted} | Rejeitadas: {report.rows_read - report.inserted}")
+    print(f"Tempo: {report.seconds:.2f}s | Vazão: {report.rows_per_second:,.0f} linhas/s")
+    for line_no, reason in report.rejected[:20]:
+        print(f"  linha {line_no}: {reason}")
+    if len(report.rejected) > 20:
+        print(f"  ... e mais {report.rows_read - report.inserted - 20} rejeição(ões)")
+    return 0 if report.inserted == report.rows_read else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
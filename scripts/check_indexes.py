@@ -0,0 +1,28 @@
+"""
+Verifica se o planner usa os índices criados por init_db para as consultas de services.py.
+
+Executar: python scripts/check_indexes.py  (usa GESTAO_DB; sai com código 1 se algum índice não for usado)
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from db import init_db, check_index_usage
+
+
+def main() -> int:
+    init_db()
+    results = check_index_usage()
+    missing = 0
+    for result in results:
+        status = "OK  " if result["used"] else "FALTA"
+        print(f"[{status}] {result['index']}: {result['sql']}")
+        for line in result["plan"].splitlines():
+            print(f"        {line}")
+        if not result["used"]:
+            missing += 1
+    print(f"{len(results) - missing} índice(s) usados, {missing} não usados")
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""
+Aplica as migrações versionadas de migrations.py ao banco configurado em GESTAO_DB.
+
+Executar:
+  python scripts/migrate.py            # cria tabelas base e aplica migrações pendentes
+  python scripts/migrate.py --status   # lista migrações e quando foram aplicadas
+  python scripts/migrate.py --target 3 # cria tabelas base e aplica apenas até a versão 3
+"""
+import argparse
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from db import init_db
+from migrations import migration_status
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--status", action="store_true", help="apenas mostra o estado das migrações")
+    parser.add_argument("--target", type=int, default=None, help="versão máxima a aplicar")
+    args = parser.parse_args()
+
+    if not args.status:
+        # Mesmo caminho com ou sem --target: tabelas base antes das migrações
+        init_db(args.target)
+    for row in migration_status():
+        applied = row["applied_at"] or "pendente"
+        print(f"{row['version']:04d}_{row['name']}: {applied}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+"""
+Reconcilia a tabela balances com o recálculo a partir de tasks/debits.
+
+Executar: python scripts/reconcile_balances.py [--fix]
+(usa GESTAO_DB; sai com código 1 se houver divergência não corrigida)
+"""
+import argparse
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services import bootstrap, reconcile_balances
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fix", action="store_true", help="regrava os saldos divergentes")
+    args = parser.parse_args()
+
+    bootstrap()
+    drift = reconcile_balances(fix=args.fix)
+    for entry in drift:
+        fields = ", ".join(
+            f"{name}: {have:.2f} -> {want:.2f}" for name, (have, want) in entry["fields"].items()
+        )
+        print(f"[DIVERGE] usuário {entry['user_id']}: {fields}")
+    if not drift:
+        print("Saldos consistentes com as linhas brutas")
+    elif args.fix:
+        print(f"{len(drift)} saldo(s) corrigido(s)")
+    return 1 if drift and not args.fix else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Mede o custo de importar app.py (python -X importtime) e falha se passar do orçamento.
+
+Executar: python scripts/startup_benchmark.py [--runs 3] [--budget-ms 1500]
+          [--baseline startup_baseline.json --max-regression 0.2] [--save-baseline ARQ]
+(sai com código 1 se um módulo proibido for importado, se o tempo passar do
+orçamento ou se regredir mais que --max-regression em relação à linha de base)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Dependências pesadas que só as páginas que as usam devem carregar
+DEFAULT_FORBIDDEN = ("pandas", "plotly.express", "requests")
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Linhas de ``-X importtime`` em [{"module", "self_us", "cumulative_us", "depth"}]."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # cabeçalho
+        name = parts[2].rstrip()
+        stripped = name.lstrip(" ")
+        entries.append({
+            "module": stripped,
+            "self_us": int(parts[0]),
+            "cumulative_us": int(parts[1]),
+            "depth": (len(name) - len(stripped) - 1) // 2,
+        })
+    return entries
+
+
+def summarize(entries: List[Dict], module: str, forbidden=DEFAULT_FORBIDDEN, top: int = 10) -> Dict:
+    """Tempo total do import de ``module``, maiores pacotes por tempo próprio e proibidos carregados."""
+    total = next((e["cumulative_us"] for e in entries if e["module"] == module and e["depth"] == 0), None)
+    if total is None:
+        raise ValueError(f"{module} não aparece na saída de -X importtime")
+    by_package = defaultdict(int)
+    for entry in entries:
+        by_package[entry["module"].split(".")[0]] += entry["self_us"]
+    loaded = {e["module"] for e in entries}
+    return {
+        "module": module,
+        "total_ms": total / 1000,
+        "modules": len(entries),
+        "top_packages": sorted(
+            ({"package": name, "self_ms": us / 1000} for name, us in by_package.items()),
+            key=lambda item: item["self_ms"],
+            reverse=True,
+        )[:top],
+        "forbidden": sorted(
+            name for name in forbidden if any(m == name or m.startswith(name + ".") for m in loaded)
+        ),
+    }
+
+
+def measure(module: str = "app", runs: int = 3, forbidden=DEFAULT_FORBIDDEN) -> Dict:
+    """Importa ``module`` em ``runs`` processos novos e devolve o resumo do mais rápido."""
+    best = None
+    for _ in range(max(1, runs)):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT,
+            env={**os.environ, "PYTHONPATH": str(ROOT)},
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"falha ao importar {module}:\n{proc.stderr[-2000:]}")
+        summary = summarize(parse_importtime(proc.stderr), module, forbidden)
+        if best is None or summary["total_ms"] < best["total_ms"]:
+            best = summary
+    best["runs"] = max(1, runs)
+    return best
+
+
+def check(summary: Dict, budget_ms: float = None, baseline_ms: float = None, max_regression: float = 0.2) -> List[str]:
+    """Lista de violações do orçamento (vazia se tudo certo)."""
+    problems = [f"módulo pesado importado no carregamento: {name}" for name in summary["forbidden"]]
+    if budget_ms is not None and summary["total_ms"] > budget_ms:
+        problems.append(f"import de {summary['module']} levou {summary['total_ms']:.0f} ms (orçamento {budget_ms:.0f} ms)")
+    if baseline_ms is not None and summary["total_ms"] > baseline_ms * (1 + max_regression):
+        problems.append(
+            f"import de {summary['module']} levou {summary['total_ms']:.0f} ms, "
+            f"{summary['total_ms'] / baseline_ms - 1:.0%} acima da linha de base ({baseline_ms:.0f} ms)"
+        )
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=3, help="processos medidos (usa o mais rápido)")
+    parser.add_argument("--budget-ms", type=float, help="tempo máximo absoluto de import")
+    parser.add_argument("--baseline", help="JSON salvo com --save-baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="fração tolerada acima da linha de base")
+    parser.add_argument("--save-baseline", help="grava o resultado como nova linha de base")
+    parser.add_argument("--json", action="store_true", help="imprime o resumo em JSON")
+    args = parser.parse_args()
+
+    summary = measure(args.module, args.runs)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"import {summary['module']}: {summary['total_ms']:.0f} ms "
+              f"({summary['modules']} módulos, melhor de {summary['runs']})")
+        for item in summary["top_packages"]:
+            print(f"  {item['package']:<24} {item['self_ms']:8.1f} ms")
+
+    baseline_ms = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline_ms = json.load(fh)["total_ms"]
+    problems = check(summary, args.budget_ms, baseline_ms, args.max_regression)
+    for problem in problems:
+        print(f"[FALHA] {problem}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as fh:
+            json.dump({"module": summary["module"], "total_ms": summary["total_ms"]}, fh, indent=2)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
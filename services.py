@@ -1,14 +1,14 @@
 
 from typing import Optional
-import requests
 import os
+import threading
 
 # Configurações do Supabase Storage
 # Lê de st.secrets (Streamlit Cloud) ou variáveis de ambiente (local)
 def get_supabase_config():
-    supabase_url = "https://qusavydxnnctnrqfwoua.supabase.co"
+    supabase_url = os.environ.get("SUPABASE_URL", "https://qusavydxnnctnrqfwoua.supabase.co")
     supabase_key = ""
-    supabase_bucket = "user-photos"
+    supabase_bucket = os.environ.get("SUPABASE_BUCKET", "user-photos")
     
     try:
         import streamlit as st
@@ -33,47 +33,100 @@ def get_supabase_config():
     
     return supabase_url, supabase_key, supabase_bucket
 
-SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET = get_supabase_config()
+_SUPABASE_NAMES = ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_BUCKET")
+_supabase_settings = None
 
 
+def supabase_settings():
+    """(url, key, bucket) do Storage, resolvidos no primeiro uso e não no import:
+    o login não espera a leitura das secrets do Supabase."""
+    global _supabase_settings
+    if _supabase_settings is None:
+        _supabase_settings = get_supabase_config()
+    return _supabase_settings
 
-def upload_photo_supabase(user_id: int, file_bytes: bytes, original_filename: str) -> str:
-    if not SUPABASE_KEY:
+
+def __getattr__(name):
+    # Compatibilidade: services.SUPABASE_URL/KEY/BUCKET continuam disponíveis
+    if name in _SUPABASE_NAMES:
+        return supabase_settings()[_SUPABASE_NAMES.index(name)]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_STORAGE = None
+_UPLOAD_QUEUE = None
+_STORAGE_LOCK = threading.Lock()
+
+
+def get_storage() -> "SupabaseStorage":
+    """Cliente do Storage compartilhado pelo processo (uma sessão keep-alive)."""
+    global _STORAGE
+    url, key, bucket = supabase_settings()
+    if not key:
         raise ValueError("❌ SUPABASE_KEY não configurada! Configure as secrets no Streamlit Cloud em: Manage app > Secrets")
-    
+    if _STORAGE is None:
+        with _STORAGE_LOCK:
+            if _STORAGE is None:
+                _STORAGE = SupabaseStorage(
+                    url,
+                    key,
+                    bucket,
+                    timeout=(
+                        _get_int_setting("GESTAO_STORAGE_CONNECT_TIMEOUT", 5),
+                        _get_int_setting("GESTAO_STORAGE_READ_TIMEOUT", 30),
+                    ),
+                    retries=_get_int_setting("GESTAO_STORAGE_RETRIES", 3),
+                )
+    return _STORAGE
+
+
+def _get_upload_queue() -> "UploadQueue":
+    global _UPLOAD_QUEUE
+    if _UPLOAD_QUEUE is None:
+        with _STORAGE_LOCK:
+            if _UPLOAD_QUEUE is None:
+                _UPLOAD_QUEUE = UploadQueue(_get_int_setting("GESTAO_PHOTO_UPLOAD_WORKERS", 2), "photo-upload")
+    return _UPLOAD_QUEUE
+
+
+def upload_photo_supabase(user_id: int, file_bytes: bytes, original_filename: str) -> str:
     ext = os.path.splitext(original_filename)[1].lower() or ".jpg"
     fname = _safe_filename(f"user_{user_id}_{int(time.time())}{ext}")
-    path = f"users/{fname}"
-    # Upload do arquivo
-    url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET}/{path}"
-    headers = {
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "application/octet-stream"
-    }
-    headers["x-upsert"] = "true"
-    try:
-        resp = requests.put(url, headers=headers, data=file_bytes)
-        if not resp.ok:
-            error_msg = f"Erro HTTP {resp.status_code}: {resp.text}"
-            print(f"[Supabase Upload] {error_msg}")
-            # Adicionar dica específica se for erro 403
-            if resp.status_code == 403:
-                raise ValueError(f"❌ Erro de permissão no Supabase Storage. Verifique: 1) A SUPABASE_KEY nas secrets do Streamlit Cloud está correta (deve ser a service_role key), 2) O bucket '{SUPABASE_BUCKET}' existe no Supabase Storage, 3) As policies do bucket permitem upload.")
-            raise ValueError(f"Erro ao fazer upload: {error_msg}")
-        resp.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        print(f"[Supabase Upload] Falha ao enviar foto: {e}")
-        print(f"URL: {url}")
-        print(f"Headers: {{'Authorization': 'Bearer ...', 'Content-Type': 'application/octet-stream', 'x-upsert': 'true'}}")
-        print(f"Tamanho do arquivo: {len(file_bytes)} bytes")
-        raise
-    # Gera URL pública
-    public_url = f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{path}"
-    return public_url
+    return get_storage().put(f"users/{fname}", file_bytes, "application/octet-stream")
+
+
+def upload_photo_renditions(user_id: int, renditions: dict) -> str:
+    """Envia todas as versões da foto ({tamanho: (bytes, ext, mime)}) como uma operação.
+
+    Os envios rodam em paralelo na sessão compartilhada do Storage; se algum
+    falhar, os já enviados são removidos e o erro é propagado. Devolve a URL
+    pública da maior versão (a que fica em users.photo).
+    """
+    storage = get_storage()
+    base = f"users/user_{user_id}_{time.time_ns()}"
+    paths = {size: rendition_name(base, size, ext) for size, (_, ext, _) in renditions.items()}
+
+    def put(size):
+        data, _, mime = renditions[size]
+        return storage.put(paths[size], data, mime, cache_control="max-age=31536000, immutable")
+
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        futures = [pool.submit(put, size) for size in paths]
+        errors = [f.exception() for f in futures if f.exception() is not None]
+    if errors:
+        try:
+            storage.delete(paths.values())
+        except (StorageError, OSError):  # requests.RequestException herda de IOError
+            logger.warning("Falha ao remover envios parciais: %s", list(paths.values()))
+        raise errors[0]
+    return storage.public_url(paths[max(paths)])
+
+
 def get_user_by_id(user_id: int) -> "Optional[User]":
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
+    if not in_transaction():
+        return _USER_DIRECTORY.by_id(user_id)
+    with pooled_connection() as conn:
+        if get_db_kind() == "pg":
             cur = conn.cursor()
             cur.execute("SELECT * FROM users WHERE id = %s", (user_id,))
             row = cur.fetchone()
@@ -84,89 +137,71 @@ def get_user_by_id(user_id: int) -> "Optional[User]":
             row = cur.fetchone()
             cur.close()
         return _row_to_user(row)
-    finally:
-        conn.close()
 def update_user_full(user_id: int, name: str, email: str, roles: str, password: str = None) -> "Optional[User]":
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
-            cur = conn.cursor()
-            if password:
-                cur.execute("UPDATE users SET name = %s, email = %s, roles = %s, password_hash = %s WHERE id = %s",
-                            (name, email, roles, hash_password(password), user_id))
-            else:
-                cur.execute("UPDATE users SET name = %s, email = %s, roles = %s WHERE id = %s",
-                            (name, email, roles, user_id))
-            conn.commit()
-            cur.close()
-        else:
-            cur = conn.cursor()
-            if password:
-                cur.execute("UPDATE users SET name = ?, email = ?, roles = ?, password_hash = ? WHERE id = ?",
-                            (name, email, roles, hash_password(password), user_id))
-            else:
-                cur.execute("UPDATE users SET name = ?, email = ?, roles = ? WHERE id = ?",
-                            (name, email, roles, user_id))
-            conn.commit()
-            cur.close()
-        # Retorna o usuário atualizado
-        return get_user_by_id(user_id)
-    finally:
-        conn.close()
+    if password:
+        row = _execute_returning(
+            "UPDATE users SET name = %s, email = %s, roles = %s, password_hash = %s WHERE id = %s RETURNING *",
+            (name, email, roles, hash_password(password), user_id),
+            tables=("users",),
+        )
+    else:
+        row = _execute_returning(
+            "UPDATE users SET name = %s, email = %s, roles = %s WHERE id = %s RETURNING *",
+            (name, email, roles, user_id),
+            tables=("users",),
+        )
+    return _row_to_user(row)
 def delete_debit(debit_id: int) -> bool:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
+    with transaction() as conn:
+        tables_changed("debits", "balances")
+        if get_db_kind() == "pg":
             cur = conn.cursor()
             cur.execute("DELETE FROM debits WHERE id = %s", (debit_id,))
             deleted = cur.rowcount > 0
             cur.close()
-            conn.commit()
             return deleted
         else:
             cursor = conn.execute("DELETE FROM debits WHERE id = ?", (debit_id,))
-            conn.commit()
             return cursor.rowcount > 0
-    finally:
-        conn.close()
 def delete_task(task_id: int) -> bool:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
+    with transaction() as conn:
+        tables_changed("tasks", "balances")
+        if get_db_kind() == "pg":
             cur = conn.cursor()
             cur.execute("DELETE FROM tasks WHERE id = %s", (task_id,))
             deleted = cur.rowcount > 0
             cur.close()
-            conn.commit()
             return deleted
         else:
             cursor = conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-            conn.commit()
             return cursor.rowcount > 0
-    finally:
-        conn.close()
 """Serviços (CRUD) e lógica do domínio utilizando sqlite3 explicitamente."""
-import hashlib
+import base64
+import csv
+import io
+import itertools
+import json
 import logging
 import os
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 from models import User
 
-from db import get_db_kind, get_connection
-from models import Conversion, Debit, Task, User
-
-# Alias para compatibilidade - sempre "pg" pois só suportamos Postgres
-DB_KIND = "pg"
+from db import (_get_int_setting, bootstrap_lock, get_backend, get_db_kind, in_transaction, init_db, on_commit,
+                pooled_connection, transaction)
+from models import Conversion, Debit, IngestReport, Task, User
+from cache import cached_read, table_version, tables_changed
+from migrations import _sqlite_effective
+from passwords import burn_verification, hash_password, needs_rehash, verify_password
+from photos import make_renditions, rendition_name
+from storage import StorageError, SupabaseStorage, UploadQueue
 
 logger = logging.getLogger(__name__)
 
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256((password or "").encode()).hexdigest()
-
-
 def _row_to_user(row) -> Optional[User]:
     if not row:
         return None
@@ -219,100 +254,142 @@ def _row_to_conversion(row) -> Optional[Conversion]:
         id=row["id"],
         money_per_point=float(row["money_per_point"]),
         hours_per_point=float(row["hours_per_point"]),
+        effective_from=row["effective_from"],
     )
 
 
-def create_user(name: str, email: str = None, roles: str = "child", password: str = None) -> User:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
+def _execute_returning(sql: str, params, tables: Tuple[str, ...] = ()):
+    """Executa um INSERT/UPDATE ... RETURNING * e devolve a linha afetada (ou None).
+
+    Uma ida ao banco por mutação: ``sql`` usa placeholders %s, convertidos para ?
+    no SQLite (>= 3.35, que também aceita RETURNING e os literais TRUE/FALSE).
+    ``tables`` são marcadas como alteradas (cache.tables_changed) na mesma
+    transação da escrita.
+    """
+    with transaction() as conn:
+        if tables:
+            tables_changed(*tables)
+        if get_db_kind() == "pg":
             cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO users (name, email, roles, password_hash) VALUES (%s, %s, %s, %s) RETURNING id",
-                (name, email, roles, hash_password(password) if password else None),
-            )
-            row_id = cur.fetchone()
-            user_id = row_id.get("id") if isinstance(row_id, dict) else row_id[0]
-            cur.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-            fetched = cur.fetchone()
+            cur.execute(sql, params)
+            row = cur.fetchone()
             cur.close()
-            conn.commit()
-            return _row_to_user(fetched)
-        cursor = conn.execute(
-            "INSERT INTO users (name, email, roles, password_hash) VALUES (?, ?, ?, ?)",
-            (name, email, roles, hash_password(password) if password else None),
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-        row = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
-        return _row_to_user(row)
-    finally:
-        conn.close()
+            return row
+        # fetchall() conclui o comando antes do commit da transação
+        rows = conn.execute(sql.replace("%s", "?"), params).fetchall()
+        return rows[0] if rows else None
+
+
+def create_user(name: str, email: str = None, roles: str = "child", password: str = None) -> User:
+    """Cria o usuário; a foto é enviada depois, com enqueue_user_photo()."""
+    row = _execute_returning(
+        "INSERT INTO users (name, email, roles, password_hash) VALUES (%s, %s, %s, %s) RETURNING *",
+        (name, email, roles, hash_password(password) if password else None),
+        tables=("users",),
+    )
+    return _row_to_user(row)
+
+
+class _UserDirectory:
+    """Cache de usuários do processo: id -> User, e-mail (minúsculo) -> User e crianças.
+
+    Carregado numa única consulta e recarregado só quando a versão da tabela
+    users (cache.table_version) muda; as escritas em users chamam
+    tables_changed("users"), que incrementa a versão após o commit. Leituras
+    dentro de transaction() consultam o banco diretamente, pois podem precisar
+    enxergar escritas ainda não confirmadas. Os objetos User devolvidos são
+    compartilhados e não devem ser alterados.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_version = -1
+        self._users: List[User] = []
+        self._by_id: Dict[int, User] = {}
+        self._by_email: Dict[str, User] = {}
+        self._children: List[User] = []
+
+    def _ensure_loaded(self):
+        if self._loaded_version == table_version("users"):
+            return
+        with self._lock:
+            version = table_version("users")
+            if self._loaded_version == version:
+                return
+            users = _query_users()
+            by_email = {}
+            for user in users:
+                if user.email:
+                    by_email.setdefault(user.email.lower(), user)
+            self._users = users
+            self._by_id = {user.id: user for user in users}
+            self._by_email = by_email
+            self._children = [user for user in users if "child" in (user.roles or "")]
+            # Uma invalidação durante a consulta força nova carga na próxima leitura
+            self._loaded_version = version
+
+    def users(self) -> List[User]:
+        self._ensure_loaded()
+        return list(self._users)
+
+    def children(self) -> List[User]:
+        self._ensure_loaded()
+        return list(self._children)
+
+    def by_id(self, user_id: int) -> Optional[User]:
+        self._ensure_loaded()
+        return self._by_id.get(user_id)
+
+    def by_email(self, email: str) -> Optional[User]:
+        self._ensure_loaded()
+        return self._by_email.get(email.lower())
+
+
+_USER_DIRECTORY = _UserDirectory()
+
+
+def _query_users() -> List[User]:
+    return [_row_to_user(row) for row in _fetch_all("SELECT * FROM users ORDER BY id")]
 
 
 def list_users() -> List[User]:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM users ORDER BY id")
-            rows = cur.fetchall()
-            cur.close()
-        else:
-            rows = conn.execute("SELECT * FROM users ORDER BY id").fetchall()
-        return [_row_to_user(row) for row in rows]
-    finally:
-        conn.close()
+    if in_transaction():
+        return _query_users()
+    return _USER_DIRECTORY.users()
+
+
+def list_children() -> List[User]:
+    """Usuários com papel 'child', do cache de usuários."""
+    if in_transaction():
+        return [user for user in _query_users() if "child" in (user.roles or "")]
+    return _USER_DIRECTORY.children()
 
 
 def update_user_email(user_id: int, new_email: str) -> Optional[User]:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
-            cur = conn.cursor()
-            cur.execute("UPDATE users SET email = %s WHERE id = %s", (new_email, user_id))
-            cur.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-            row = cur.fetchone()
-            cur.close()
-            conn.commit()
-            return _row_to_user(row)
-        conn.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
-        conn.commit()
-        row = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
-        return _row_to_user(row)
-    finally:
-        conn.close()
+    row = _execute_returning(
+        "UPDATE users SET email = %s WHERE id = %s RETURNING *", (new_email, user_id), tables=("users",)
+    )
+    return _row_to_user(row)
 
 
 def update_user_password(user_id: int, new_password: str) -> Optional[User]:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
-            cur = conn.cursor()
-            cur.execute("UPDATE users SET password_hash = %s WHERE id = %s", (hash_password(new_password), user_id))
-            cur.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-            row = cur.fetchone()
-            cur.close()
-            conn.commit()
-            if row:
-                logger.info("Senha atualizada para user_id=%s", user_id)
-            return _row_to_user(row)
-        conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (hash_password(new_password), user_id))
-        conn.commit()
-        row = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
-        if row:
-            logger.info("Senha atualizada para user_id=%s", user_id)
-        return _row_to_user(row)
-    finally:
-        conn.close()
+    row = _execute_returning(
+        "UPDATE users SET password_hash = %s WHERE id = %s RETURNING *",
+        (hash_password(new_password), user_id),
+        tables=("users",),
+    )
+    if row:
+        logger.info("Senha atualizada para user_id=%s", user_id)
+    return _row_to_user(row)
 
 
 def get_user_by_email(email: str) -> Optional[User]:
     if not email:
         return None
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
+    if not in_transaction():
+        return _USER_DIRECTORY.by_email(email)
+    with pooled_connection() as conn:
+        if get_db_kind() == "pg":
             cur = conn.cursor()
             cur.execute("SELECT * FROM users WHERE LOWER(email) = LOWER(%s)", (email,))
             row = cur.fetchone()
@@ -320,28 +397,31 @@ def get_user_by_email(email: str) -> Optional[User]:
             return _row_to_user(row)
         row = conn.execute("SELECT * FROM users WHERE LOWER(email) = LOWER(?)", (email,)).fetchone()
         return _row_to_user(row)
-    finally:
-        conn.close()
 
 
 def delete_user(user_id: int) -> bool:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
+    with transaction() as conn:
+        tables_changed("users", "tasks", "debits", "balances")
+        if get_db_kind() == "pg":
+            # CTEs de escrita: tarefas, débitos e usuário removidos num único comando
             cur = conn.cursor()
             cur.execute(
-                "DELETE FROM tasks WHERE child_id = %s OR submitted_by_id = %s OR validator_id = %s",
-                (user_id, user_id, user_id),
-            )
-            cur.execute(
-                "DELETE FROM debits WHERE user_id = %s OR performed_by_id = %s",
-                (user_id, user_id),
+                """
+                WITH del_tasks AS (
+                    DELETE FROM tasks WHERE child_id = %s OR submitted_by_id = %s OR validator_id = %s
+                ), del_debits AS (
+                    DELETE FROM debits WHERE user_id = %s OR performed_by_id = %s
+                ), del_balance AS (
+                    DELETE FROM balances WHERE user_id = %s
+                )
+                DELETE FROM users WHERE id = %s
+                """,
+                (user_id, user_id, user_id, user_id, user_id, user_id, user_id),
             )
-            cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
             deleted = cur.rowcount > 0
             cur.close()
-            conn.commit()
             return deleted
+        # SQLite não aceita CTEs de escrita
         conn.execute(
             "DELETE FROM tasks WHERE child_id = ? OR submitted_by_id = ? OR validator_id = ?",
             (user_id, user_id, user_id),
@@ -350,187 +430,327 @@ def delete_user(user_id: int) -> bool:
             "DELETE FROM debits WHERE user_id = ? OR performed_by_id = ?",
             (user_id, user_id),
         )
+        conn.execute("DELETE FROM balances WHERE user_id = ?", (user_id,))
         cursor = conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
-        conn.commit()
         return cursor.rowcount > 0
-    finally:
-        conn.close()
 
 
 def authenticate_user(email: str, password: str) -> Optional[User]:
     usr = get_user_by_email(email)
     if not usr or not usr.password_hash:
+        burn_verification(password)
         return None
-    if usr.password_hash == hash_password(password):
-        return usr
-    return None
+    if not verify_password(password, usr.password_hash):
+        return None
+    if needs_rehash(usr.password_hash):
+        # Hash legado (SHA-256) ou custo antigo: regrava no formato atual. A
+        # condição no hash antigo evita sobrescrever uma troca de senha concorrente.
+        try:
+            row = _execute_returning(
+                "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s RETURNING *",
+                (hash_password(password), usr.id, usr.password_hash),
+                tables=("users",),
+            )
+            if row:
+                usr = _row_to_user(row)
+        except Exception:
+            logger.exception("Falha ao atualizar o hash da senha do usuário %s", usr.id)
+    return usr
 
 
 def create_task(name: str, amount: float, conversion_type: str, child_id: int, submitted_by_id: int, validator_id: int = None) -> Task:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
-            cur = conn.cursor()
-            cur.execute(
-                """
-                INSERT INTO tasks (name, points, conversion_type, child_id, submitted_by_id, validator_id, validated)
-                VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id
-                """,
-                (name, float(amount), conversion_type, child_id, submitted_by_id, validator_id, False),
-            )
-            row_id = cur.fetchone()
-            task_id = row_id.get("id") if isinstance(row_id, dict) else row_id[0]
-            cur.execute("SELECT * FROM tasks WHERE id = %s", (task_id,))
-            row = cur.fetchone()
-            cur.close()
-        else:
-            cursor = conn.execute(
-                """
-                INSERT INTO tasks (name, points, conversion_type, child_id, submitted_by_id, validator_id, validated)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (name, float(amount), conversion_type, child_id, submitted_by_id, validator_id, 0),
-            )
-            conn.commit()
-            task_id = cursor.lastrowid
-            row = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
-        task = _row_to_task(row)
-        if task:
-            logger.info(
-                "Tarefa criada id=%s nome=%s child=%s valor=%s tipo=%s",
-                task.id,
-                task.name,
-                child_id,
-                task.points,
-                conversion_type,
-            )
-        if DB_KIND == "pg":
-            conn.commit()
-        return task
-    finally:
-        conn.close()
+    row = _execute_returning(
+        """
+        INSERT INTO tasks (name, points, conversion_type, child_id, submitted_by_id, validator_id, validated)
+        VALUES (%s, %s, %s, %s, %s, %s, FALSE) RETURNING *
+        """,
+        (name, float(amount), conversion_type, child_id, submitted_by_id, validator_id),
+        tables=("tasks",),
+    )
+    task = _row_to_task(row)
+    if task:
+        logger.info(
+            "Tarefa criada id=%s nome=%s child=%s valor=%s tipo=%s",
+            task.id,
+            task.name,
+            child_id,
+            task.points,
+            conversion_type,
+        )
+    return task
 
 
-def list_tasks(validated: bool = None) -> List[Task]:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
+def _fetch_all(sql: str, params=()) -> list:
+    """SELECT com placeholders %s (convertidos para ? no SQLite)."""
+    with pooled_connection() as conn:
+        if get_db_kind() == "pg":
             cur = conn.cursor()
-            if validated is None:
-                cur.execute("SELECT * FROM tasks ORDER BY created_at DESC")
-            else:
-                cur.execute("SELECT * FROM tasks WHERE validated = %s ORDER BY created_at DESC", (validated,))
+            cur.execute(sql, params)
             rows = cur.fetchall()
             cur.close()
+            return rows
+        return conn.execute(sql.replace("%s", "?"), params).fetchall()
+
+
+def _encode_cursor(created_at, row_id: int) -> str:
+    value = created_at.isoformat() if hasattr(created_at, "isoformat") else str(created_at)
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return created_at, int(row_id)
+    except Exception as exc:
+        raise ValueError("Cursor de paginação inválido") from exc
+
+
+def next_page_cursor(items: list, limit: Optional[int]) -> Optional[str]:
+    """Cursor opaco para a página seguinte a ``items`` (None se esta foi a última)."""
+    if not limit or len(items) < limit:
+        return None
+    last = items[-1]
+    return _encode_cursor(last.created_at, last.id)
+
+
+def _db_timestamp(value):
+    """Datas de filtro: datetime no Postgres, texto 'YYYY-MM-DD HH:MM:SS' no SQLite."""
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return value if get_db_kind() == "pg" else value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _keyset_query(table: str, conditions: List[str], params: list, start, end, limit, cursor) -> tuple:
+    """Monta o SELECT paginado por (created_at, id) DESC com filtros já em SQL."""
+    conditions = list(conditions)
+    params = list(params)
+    if start is not None:
+        conditions.append("created_at >= %s")
+        params.append(_db_timestamp(start))
+    if end is not None:
+        conditions.append("created_at < %s")
+        params.append(_db_timestamp(end))
+    if cursor:
+        created_at, row_id = _decode_cursor(cursor)
+        conditions.append("(created_at, id) < (%s, %s)")
+        params.extend([created_at, row_id])
+    sql = f"SELECT * FROM {table}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY created_at DESC, id DESC"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return sql, params
+
+
+@cached_read("tasks")
+def list_tasks(
+    validated: bool = None,
+    child_id: int = None,
+    status: str = None,
+    start=None,
+    end=None,
+    limit: int = None,
+    cursor: str = None,
+) -> List[Task]:
+    """Tarefas mais recentes primeiro, filtradas e paginadas no banco.
+
+    ``status`` ('pending'/'validated') é um atalho para ``validated``;
+    ``start``/``end`` limitam created_at (início inclusivo, fim exclusivo).
+    Com ``limit``, use next_page_cursor() no resultado para obter ``cursor``
+    da página seguinte.
+    """
+    if status is not None:
+        if status not in ("pending", "validated"):
+            raise ValueError(f"status inválido: {status!r}")
+        validated = status == "validated"
+    conditions, params = [], []
+    if validated is not None:
+        # Literais (e não parâmetros) para o planner casar com o índice parcial idx_tasks_pending
+        if get_db_kind() == "pg":
+            conditions.append("validated = TRUE" if validated else "validated = FALSE")
         else:
-            if validated is None:
-                rows = conn.execute("SELECT * FROM tasks ORDER BY created_at DESC").fetchall()
-            else:
-                rows = conn.execute(
-                    "SELECT * FROM tasks WHERE validated = ? ORDER BY created_at DESC",
-                    (1 if validated else 0,),
-                ).fetchall()
-        return [_row_to_task(row) for row in rows]
-    finally:
-        conn.close()
+            conditions.append("validated = 1" if validated else "validated = 0")
+    if child_id is not None:
+        conditions.append("child_id = %s")
+        params.append(child_id)
+    sql, params = _keyset_query("tasks", conditions, params, start, end, limit, cursor)
+    return [_row_to_task(row) for row in _fetch_all(sql, params)]
 
 
 def validate_task(task_id: int, validator_id: int) -> Optional[Task]:
-    conn = get_connection()
-    try:
-        now = datetime.utcnow()
-        if DB_KIND == "pg":
+    now = datetime.utcnow()
+    row = _execute_returning(
+        "UPDATE tasks SET validated = TRUE, validator_id = %s, validated_at = %s WHERE id = %s RETURNING *",
+        (validator_id, now if get_db_kind() == "pg" else now.isoformat(), task_id),
+        tables=("tasks", "balances"),
+    )
+    task = _row_to_task(row)
+    if task:
+        logger.info("Tarefa validada id=%s por=%s", task.id, validator_id)
+    return task
+
+
+def validate_tasks(task_ids: List[int], validator_id: int) -> List[Task]:
+    """Valida várias tarefas pendentes num único UPDATE e devolve as que mudaram.
+
+    Tarefas já validadas (ou inexistentes) são ignoradas, então repetir a
+    chamada com os mesmos ids é inofensivo.
+    """
+    ids = sorted({int(task_id) for task_id in task_ids or []})
+    if not ids:
+        return []
+    now = datetime.utcnow()
+    with transaction() as conn:
+        tables_changed("tasks", "balances")
+        if get_db_kind() == "pg":
             cur = conn.cursor()
             cur.execute(
-                "UPDATE tasks SET validated = TRUE, validator_id = %s, validated_at = %s WHERE id = %s",
-                (validator_id, now, task_id),
+                "UPDATE tasks SET validated = TRUE, validator_id = %s, validated_at = %s "
+                "WHERE id = ANY(%s) AND validated = FALSE RETURNING *",
+                (validator_id, now, ids),
             )
-            cur.execute("SELECT * FROM tasks WHERE id = %s", (task_id,))
-            row = cur.fetchone()
+            rows = cur.fetchall()
             cur.close()
         else:
-            conn.execute(
-                "UPDATE tasks SET validated = 1, validator_id = ?, validated_at = ? WHERE id = ?",
-                (validator_id, now.isoformat(), task_id),
-            )
-            conn.commit()
-            row = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
-        task = _row_to_task(row)
-        if task:
-            logger.info("Tarefa validada id=%s por=%s", task.id, validator_id)
-        if DB_KIND == "pg":
-            conn.commit()
-        return task
-    finally:
-        conn.close()
+            placeholders = ", ".join("?" for _ in ids)
+            rows = conn.execute(
+                f"UPDATE tasks SET validated = 1, validator_id = ?, validated_at = ? "
+                f"WHERE id IN ({placeholders}) AND validated = 0 RETURNING *",
+                (validator_id, now.isoformat(), *ids),
+            ).fetchall()
+    tasks = [_row_to_task(row) for row in rows]
+    logger.info("Tarefas validadas em lote: %s de %s por=%s", len(tasks), len(ids), validator_id)
+    return tasks
+
+
+def _delete_many(table: str, ids: List[int]) -> int:
+    """DELETE de vários ids num único comando; devolve quantas linhas saíram."""
+    ids = sorted({int(row_id) for row_id in ids or []})
+    if not ids:
+        return 0
+    with transaction() as conn:
+        tables_changed(table, "balances")
+        if get_db_kind() == "pg":
+            cur = conn.cursor()
+            cur.execute(f"DELETE FROM {table} WHERE id = ANY(%s)", (ids,))
+            deleted = cur.rowcount
+            cur.close()
+        else:
+            placeholders = ", ".join("?" for _ in ids)
+            deleted = conn.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids).rowcount
+    logger.info("Exclusão em lote em %s: %s de %s", table, deleted, len(ids))
+    return deleted
+
+
+def delete_tasks(task_ids: List[int]) -> int:
+    return _delete_many("tasks", task_ids)
+
+
+def delete_debits(debit_ids: List[int]) -> int:
+    return _delete_many("debits", debit_ids)
 
 
 def ensure_conversion_exists(conn) -> Conversion:
-    if DB_KIND == "pg":
+    """Garante uma versão inicial da taxa de conversão (usada só no seed)."""
+    if get_db_kind() == "pg":
         cur = conn.cursor()
-        cur.execute("SELECT * FROM conversions LIMIT 1")
-        row = cur.fetchone()
-        if row:
-            cur.close()
-            return _row_to_conversion(row)
-        cur.execute("INSERT INTO conversions (money_per_point, hours_per_point) VALUES (%s, %s) RETURNING id", (0.5, 0.1))
-        conn.commit()
-        cur.execute("SELECT * FROM conversions LIMIT 1")
+        cur.execute("SELECT * FROM conversions ORDER BY id LIMIT 1")
         row = cur.fetchone()
         cur.close()
-        return _row_to_conversion(row)
-    row = conn.execute("SELECT * FROM conversions LIMIT 1").fetchone()
+    else:
+        row = conn.execute("SELECT * FROM conversions ORDER BY id LIMIT 1").fetchone()
     if row:
         return _row_to_conversion(row)
-    conn.execute("INSERT INTO conversions (money_per_point, hours_per_point) VALUES (?, ?)", (0.5, 0.1))
-    conn.commit()
-    row = conn.execute("SELECT * FROM conversions LIMIT 1").fetchone()
+    row = _execute_returning(
+        "INSERT INTO conversions (money_per_point, hours_per_point) VALUES (%s, %s) RETURNING *",
+        (0.5, 0.1),
+    )
     return _row_to_conversion(row)
 
 
-def get_conversion() -> Conversion:
-    conn = get_connection()
-    try:
-        return ensure_conversion_exists(conn)
-    finally:
-        conn.close()
+def _rate_sql(column: str, ts: str) -> str:
+    """Subconsulta da taxa em vigor no instante ``ts`` (1 quando não há versão).
+
+    No SQLite as datas são texto em formatos variados, então a comparação é
+    feita por julianday().
+    """
+    if get_db_kind() == "pg":
+        cond, order = f"c.effective_from <= {ts}", "c.effective_from DESC"
+    else:
+        cond, order = _sqlite_effective("c.effective_from", ts)
+    return (
+        f"COALESCE((SELECT c.{column} FROM conversions c WHERE {cond} "
+        f"ORDER BY {order}, c.id DESC LIMIT 1), 1)"
+    )
+
+
+# Taxa atual em cache no processo; set_conversion invalida após o commit
+_conversion_cache: Optional[Conversion] = None
+_conversion_lock = threading.Lock()
+
+# Taxa implícita quando nenhuma versão está em vigor (igual ao COALESCE de _rate_sql)
+_IDENTITY_CONVERSION = Conversion(id=None, money_per_point=1.0, hours_per_point=1.0)
+
+
+def _load_conversion(at=None) -> Conversion:
+    if at is None:
+        at = datetime.utcnow()
+    if get_db_kind() == "pg":
+        cond, order = "effective_from <= %s", "effective_from DESC"
+        params = (_db_timestamp(at),)
+    else:
+        if isinstance(at, datetime):
+            at = at.isoformat()  # precisão de microssegundos, como effective_from
+        cond, order = _sqlite_effective("effective_from", "%s")
+        params = (_db_timestamp(at),) * 3
+    rows = _fetch_all(f"SELECT * FROM conversions WHERE {cond} ORDER BY {order}, id DESC LIMIT 1", params)
+    return _row_to_conversion(rows[0]) if rows else _IDENTITY_CONVERSION
+
+
+def get_conversion(at=None) -> Conversion:
+    """Taxa de conversão em vigor agora (do cache) ou no instante ``at``."""
+    global _conversion_cache
+    if at is not None:
+        return _load_conversion(at)
+    cached = _conversion_cache
+    if cached is not None:
+        return cached
+    with _conversion_lock:
+        if _conversion_cache is None:
+            _conversion_cache = _load_conversion()
+        return _conversion_cache
+
+
+def _invalidate_conversion_cache():
+    global _conversion_cache
+    with _conversion_lock:
+        _conversion_cache = None
 
 
 def set_conversion(money_per_point: float, hours_per_point: float) -> Conversion:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
-            cur = conn.cursor()
-            cur.execute("SELECT id FROM conversions LIMIT 1")
-            row = cur.fetchone()
-            if row:
-                cur.execute(
-                    "UPDATE conversions SET money_per_point = %s, hours_per_point = %s WHERE id = %s",
-                    (money_per_point, hours_per_point, row["id"]),
-                )
-            else:
-                cur.execute(
-                    "INSERT INTO conversions (money_per_point, hours_per_point) VALUES (%s, %s)",
-                    (money_per_point, hours_per_point),
-                )
-            cur.close()
-            conn.commit()
-            return ensure_conversion_exists(conn)
-        row = conn.execute("SELECT id FROM conversions LIMIT 1").fetchone()
-        if row:
-            conn.execute(
-                "UPDATE conversions SET money_per_point = ?, hours_per_point = ? WHERE id = ?",
-                (money_per_point, hours_per_point, row["id"]),
+    """Cria uma nova versão da taxa, em vigor a partir de agora.
+
+    Tarefas já validadas continuam convertidas pela taxa da sua validação.
+    """
+    with transaction():
+        if get_db_kind() == "pg":
+            row = _execute_returning(
+                "INSERT INTO conversions (money_per_point, hours_per_point) VALUES (%s, %s) RETURNING *",
+                (money_per_point, hours_per_point),
             )
         else:
-            conn.execute(
-                "INSERT INTO conversions (money_per_point, hours_per_point) VALUES (?, ?)",
-                (money_per_point, hours_per_point),
+            # Mesmo relógio e precisão de validated_at (validate_task)
+            row = _execute_returning(
+                "INSERT INTO conversions (money_per_point, hours_per_point, effective_from) "
+                "VALUES (%s, %s, %s) RETURNING *",
+                (money_per_point, hours_per_point, datetime.utcnow().isoformat()),
             )
-        conn.commit()
-        return ensure_conversion_exists(conn)
-    finally:
-        conn.close()
+        tables_changed("conversions")
+        on_commit(_invalidate_conversion_cache)
+        return _row_to_conversion(row)
 
 
 def create_debit(
@@ -541,121 +761,417 @@ def create_debit(
     reason: str = None,
     performed_by_id: int = None,
 ) -> Debit:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
-            cur = conn.cursor()
-            cur.execute(
-                """
-                INSERT INTO debits (user_id, points_deducted, money_amount, hours_amount, reason, performed_by_id)
-                VALUES (%s, %s, %s, %s, %s, %s) RETURNING id
-                """,
-                (user_id, points or 0, money, hours, reason, performed_by_id),
-            )
-            row_id = cur.fetchone()
-            debit_id = row_id.get("id") if isinstance(row_id, dict) else row_id[0]
-            cur.execute("SELECT * FROM debits WHERE id = %s", (debit_id,))
-            row = cur.fetchone()
-            cur.close()
-            conn.commit()
-            return _row_to_debit(row)
-        cursor = conn.execute(
-            """
-            INSERT INTO debits (user_id, points_deducted, money_amount, hours_amount, reason, performed_by_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (user_id, points or 0, money, hours, reason, performed_by_id),
-        )
-        conn.commit()
-        debit_id = cursor.lastrowid
-        row = conn.execute("SELECT * FROM debits WHERE id = ?", (debit_id,)).fetchone()
-        return _row_to_debit(row)
-    finally:
-        conn.close()
+    row = _execute_returning(
+        """
+        INSERT INTO debits (user_id, points_deducted, money_amount, hours_amount, reason, performed_by_id)
+        VALUES (%s, %s, %s, %s, %s, %s) RETURNING *
+        """,
+        (user_id, points or 0, money, hours, reason, performed_by_id),
+        tables=("debits", "balances"),
+    )
+    return _row_to_debit(row)
+
+
+@cached_read("debits")
+def list_debits(user_id: int = None, start=None, end=None, limit: int = None, cursor: str = None) -> List[Debit]:
+    """Débitos mais recentes primeiro; mesmos filtros/paginação de list_tasks()."""
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append("user_id = %s")
+        params.append(user_id)
+    sql, params = _keyset_query("debits", conditions, params, start, end, limit, cursor)
+    return [_row_to_debit(row) for row in _fetch_all(sql, params)]
+
+
+def _report_entry(user: User, earned_money, earned_hours, deb_money, deb_hours) -> Dict[str, float]:
+    earned_money = float(earned_money or 0)
+    earned_hours = float(earned_hours or 0)
+    deb_money = float(deb_money or 0)
+    deb_hours = float(deb_hours or 0)
+    return {
+        "user": user,
+        "money": round(earned_money - deb_money, 2),
+        "hours": round(earned_hours - deb_hours, 2),
+        "earned_money": earned_money,
+        "earned_hours": earned_hours,
+        "debited_money": deb_money,
+        "debited_hours": deb_hours,
+    }
 
 
-def list_debits(user_id: int = None) -> List[Debit]:
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
-            cur = conn.cursor()
-            if user_id is None:
-                cur.execute("SELECT * FROM debits ORDER BY created_at DESC")
-            else:
-                cur.execute("SELECT * FROM debits WHERE user_id = %s ORDER BY created_at DESC", (user_id,))
-            rows = cur.fetchall()
-            cur.close()
+@cached_read("users", "balances")
+def get_report() -> List[Dict[str, float]]:
+    """Saldos por usuário: usuários do cache e uma leitura da tabela balances."""
+    balances = {row["user_id"]: row for row in _fetch_all("SELECT * FROM balances")}
+    report = []
+    for user in list_users():
+        row = balances.get(user.id)
+        if row is None:
+            report.append(_report_entry(user, 0, 0, 0, 0))
         else:
-            if user_id is None:
-                rows = conn.execute("SELECT * FROM debits ORDER BY created_at DESC").fetchall()
-            else:
-                rows = conn.execute(
-                    "SELECT * FROM debits WHERE user_id = ? ORDER BY created_at DESC",
-                    (user_id,),
-                ).fetchall()
-        return [_row_to_debit(row) for row in rows]
-    finally:
-        conn.close()
-
+            report.append(_report_entry(user, row["earned_money"], row["earned_hours"],
+                                        row["debited_money"], row["debited_hours"]))
+    return report
+
+
+# Recalcula os saldos a partir das linhas brutas numa única consulta: tarefas
+# (convertidas pela taxa em vigor na validação) e débitos pré-agregados com
+# agregação condicional (FILTER, SQLite >= 3.30) e juntados aos usuários e aos
+# saldos armazenados
+_RAW_BALANCES_SQL = """
+    SELECT u.id AS user_id,
+        COALESCE(t.earned_money, 0) AS earned_money,
+        COALESCE(t.earned_hours, 0) AS earned_hours,
+        COALESCE(d.debited_money, 0) AS debited_money,
+        COALESCE(d.debited_hours, 0) AS debited_hours,
+        b.earned_money AS stored_earned_money,
+        b.earned_hours AS stored_earned_hours,
+        b.debited_money AS stored_debited_money,
+        b.debited_hours AS stored_debited_hours
+    FROM users u
+    LEFT JOIN (
+        SELECT t.child_id,
+            SUM(t.points * {money_rate}) FILTER (WHERE t.conversion_type = 'money') AS earned_money,
+            SUM(t.points * {hours_rate}) FILTER (WHERE t.conversion_type = 'hours') AS earned_hours
+        FROM tasks t
+        WHERE t.validated = {true}
+        GROUP BY t.child_id
+    ) t ON t.child_id = u.id
+    LEFT JOIN (
+        SELECT user_id, SUM(money_amount) AS debited_money, SUM(hours_amount) AS debited_hours
+        FROM debits
+        GROUP BY user_id
+    ) d ON d.user_id = u.id
+    LEFT JOIN balances b ON b.user_id = u.id
+    ORDER BY u.id
+"""
+
+# Instante que define a taxa de uma tarefa (mesmo critério dos triggers)
+_TASK_RATE_TS = "COALESCE(t.validated_at, t.created_at)"
+
+_BALANCE_FIELDS = ("earned_money", "earned_hours", "debited_money", "debited_hours")
+
+
+def reconcile_balances(fix: bool = False, tolerance: float = 1e-6) -> List[Dict[str, object]]:
+    """Compara a tabela balances com o recálculo a partir das linhas brutas.
+
+    Devolve uma entrada por usuário divergente (valores armazenados x esperados).
+    Com fix=True, regrava os saldos divergentes na mesma transação da leitura.
+    """
+    true = "TRUE" if get_db_kind() == "pg" else "1"
+    with transaction():
+        drift = []
+        sql = _RAW_BALANCES_SQL.format(
+            true=true,
+            money_rate=_rate_sql("money_per_point", _TASK_RATE_TS),
+            hours_rate=_rate_sql("hours_per_point", _TASK_RATE_TS),
+        )
+        for row in _fetch_all(sql):
+            diffs = {}
+            for field in _BALANCE_FIELDS:
+                have = float(row["stored_" + field] or 0)
+                want = float(row[field])
+                if abs(have - want) > tolerance:
+                    diffs[field] = (have, want)
+            if diffs:
+                drift.append({"user_id": row["user_id"], "fields": diffs})
+                if fix:
+                    tables_changed("balances")
+                    _execute_returning(
+                        """
+                        INSERT INTO balances (user_id, earned_money, earned_hours, debited_money, debited_hours)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (user_id) DO UPDATE SET
+                            earned_money = EXCLUDED.earned_money,
+                            earned_hours = EXCLUDED.earned_hours,
+                            debited_money = EXCLUDED.debited_money,
+                            debited_hours = EXCLUDED.debited_hours
+                        RETURNING *
+                        """,
+                        (row["user_id"],) + tuple(float(row[field]) for field in _BALANCE_FIELDS),
+                    )
+        return drift
+
+
+# Expressões de truncamento por período: date_trunc no Postgres, funções de
+# data no SQLite (semanas começam na segunda-feira nos dois)
+_HISTORY_BUCKETS = {
+    "pg": {
+        "day": "date_trunc('day', {col})::date",
+        "week": "date_trunc('week', {col})::date",
+        "month": "date_trunc('month', {col})::date",
+    },
+    "sqlite": {
+        "day": "date({col})",
+        "week": "date({col}, 'weekday 0', '-6 days')",
+        "month": "date({col}, 'start of month')",
+    },
+}
+
+_HISTORY_FIELDS = ("earned_money", "earned_hours", "debited_money", "debited_hours")
+
+
+def _timestamp_range(column: str, start, end) -> Tuple[List[str], list]:
+    """Condições ``start <= column < end`` (qualquer lado pode ser None).
+
+    No SQLite as datas são texto e validated_at usa 'T' como separador, então a
+    comparação de texto com 'YYYY-MM-DD HH:MM:SS' erra no dia do limite. O
+    filtro exato é feito por julianday(); o de texto, só pelo dia, mantém o
+    índice da coluna utilizável.
+    """
+    conditions, params = [], []
+    if get_db_kind() == "pg":
+        if start is not None:
+            conditions.append(f"{column} >= %s")
+            params.append(_db_timestamp(start))
+        if end is not None:
+            conditions.append(f"{column} < %s")
+            params.append(_db_timestamp(end))
+        return conditions, params
+    if start is not None:
+        conditions += [f"{column} >= date(%s)", f"julianday({column}) >= julianday(%s)"]
+        params += [_db_timestamp(start)] * 2
+    if end is not None:
+        conditions += [f"{column} < date(%s, '+1 day')", f"julianday({column}) < julianday(%s)"]
+        params += [_db_timestamp(end)] * 2
+    return conditions, params
+
+
+@cached_read("tasks", "debits", "conversions")
+def get_balance_history(child_id: int = None, bucket: str = "week", start=None, end=None) -> Dict[str, list]:
+    """Ganhos e débitos por período, agregados no banco.
+
+    Ganhos contam na data de validação da tarefa, convertidos pela taxa em
+    vigor nessa data; débitos na data de criação.
+    ``start``/``end`` limitam essas datas (início inclusivo, fim exclusivo).
+    Devolve arrays paralelos (period, child_id, earned_*, debited_*, money,
+    hours), ordenados por período e criança, prontos para o plotly.
+    """
+    kind = get_db_kind()
+    if bucket not in _HISTORY_BUCKETS[kind]:
+        raise ValueError(f"bucket inválido: {bucket!r} (use day, week ou month)")
+    trunc = _HISTORY_BUCKETS[kind][bucket]
+    true = "TRUE" if kind == "pg" else "1"
+
+    task_conditions, task_params = [f"t.validated = {true}"], []
+    debit_conditions, debit_params = [], []
+    if child_id is not None:
+        task_conditions.append("t.child_id = %s")
+        task_params.append(child_id)
+        debit_conditions.append("user_id = %s")
+        debit_params.append(child_id)
+    for column, conditions, params in (
+        ("t.validated_at", task_conditions, task_params),
+        ("created_at", debit_conditions, debit_params),
+    ):
+        range_conditions, range_params = _timestamp_range(column, start, end)
+        conditions.extend(range_conditions)
+        params.extend(range_params)
+    debit_where = (" WHERE " + " AND ".join(debit_conditions)) if debit_conditions else ""
+
+    rows = _fetch_all(
+        f"""
+        SELECT period, user_id,
+            SUM(earned_money) AS earned_money, SUM(earned_hours) AS earned_hours,
+            SUM(debited_money) AS debited_money, SUM(debited_hours) AS debited_hours
+        FROM (
+            SELECT {trunc.format(col="t.validated_at")} AS period, t.child_id AS user_id,
+                CASE WHEN t.conversion_type = 'money'
+                    THEN t.points * {_rate_sql("money_per_point", _TASK_RATE_TS)} ELSE 0 END AS earned_money,
+                CASE WHEN t.conversion_type = 'hours'
+                    THEN t.points * {_rate_sql("hours_per_point", _TASK_RATE_TS)} ELSE 0 END AS earned_hours,
+                0 AS debited_money, 0 AS debited_hours
+            FROM tasks t WHERE {" AND ".join(task_conditions)}
+            UNION ALL
+            SELECT {trunc.format(col="created_at")}, user_id, 0, 0,
+                COALESCE(money_amount, 0), COALESCE(hours_amount, 0)
+            FROM debits{debit_where}
+        ) h
+        GROUP BY period, user_id
+        ORDER BY period, user_id
+        """,
+        task_params + debit_params,
+    )
 
-def get_report() -> List[Dict[str, float]]:
-    conn = get_connection()
-    try:
-        users = list_users()
-        if DB_KIND == "pg":
+    history = {"period": [], "child_id": []}
+    history.update({field: [] for field in _HISTORY_FIELDS + ("money", "hours")})
+    for row in rows:
+        period = row["period"]
+        history["period"].append(period.isoformat() if hasattr(period, "isoformat") else str(period))
+        history["child_id"].append(row["user_id"])
+        for field in _HISTORY_FIELDS:
+            history[field].append(float(row[field] or 0))
+        history["money"].append(round(history["earned_money"][-1] - history["debited_money"][-1], 2))
+        history["hours"].append(round(history["earned_hours"][-1] - history["debited_hours"][-1], 2))
+    return history
+
+
+# Colunas aceitas pela ingestão em lote, na ordem usada no COPY/INSERT
+_INGEST_COLUMNS = {
+    "tasks": ("name", "points", "conversion_type", "child_id", "submitted_by_id", "validator_id",
+              "validated", "created_at", "validated_at"),
+    "debits": ("user_id", "points_deducted", "money_amount", "hours_amount", "reason",
+               "performed_by_id", "created_at"),
+}
+_INGEST_USER_FKS = {
+    "tasks": ("child_id", "submitted_by_id", "validator_id"),
+    "debits": ("user_id", "performed_by_id"),
+}
+# Rejeições guardadas no relatório (as demais são apenas contadas)
+_MAX_REJECTIONS_KEPT = 1000
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _opt_float(value) -> Optional[float]:
+    return None if _blank(value) else float(value)
+
+
+def _opt_int(value) -> Optional[int]:
+    return None if _blank(value) else int(float(value))
+
+
+def _as_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "t", "sim", "s", "yes", "y")
+    return bool(value)
+
+
+def _normalize_ingest_row(table: str, raw: Dict, user_ids: set, now: str) -> tuple:
+    """Converte uma linha CSV/NDJSON em tupla na ordem de _INGEST_COLUMNS; ValueError se inválida."""
+    if table == "tasks":
+        name = (raw.get("name") or "").strip()
+        if not name:
+            raise ValueError("name vazio")
+        points = raw.get("points", raw.get("amount"))
+        if _blank(points):
+            raise ValueError("points vazio")
+        conversion_type = (raw.get("conversion_type") or "").strip()
+        if conversion_type not in ("money", "hours"):
+            raise ValueError(f"conversion_type inválido: {conversion_type!r}")
+        child_id = _opt_int(raw.get("child_id"))
+        submitted_by_id = _opt_int(raw.get("submitted_by_id"))
+        values = {
+            "name": name,
+            "points": float(points),
+            "conversion_type": conversion_type,
+            "child_id": child_id,
+            "submitted_by_id": submitted_by_id if submitted_by_id is not None else child_id,
+            "validator_id": _opt_int(raw.get("validator_id")),
+            "validated": _as_bool(raw.get("validated")),
+            "created_at": None if _blank(raw.get("created_at")) else str(raw["created_at"]).strip(),
+            "validated_at": None if _blank(raw.get("validated_at")) else str(raw["validated_at"]).strip(),
+        }
+        required = ("child_id",)
+    else:
+        values = {
+            "user_id": _opt_int(raw.get("user_id")),
+            "points_deducted": _opt_int(raw.get("points_deducted")) or 0,
+            "money_amount": _opt_float(raw.get("money_amount")),
+            "hours_amount": _opt_float(raw.get("hours_amount")),
+            "reason": None if _blank(raw.get("reason")) else str(raw["reason"]),
+            "performed_by_id": _opt_int(raw.get("performed_by_id")),
+            "created_at": None if _blank(raw.get("created_at")) else str(raw["created_at"]).strip(),
+        }
+        required = ("user_id",)
+    for column in required:
+        if values[column] is None:
+            raise ValueError(f"{column} vazio")
+    for column in _INGEST_USER_FKS[table]:
+        if values[column] is not None and values[column] not in user_ids:
+            raise ValueError(f"{column}={values[column]} não existe em users")
+    if values["created_at"] is None:
+        values["created_at"] = now
+    return tuple(values[column] for column in _INGEST_COLUMNS[table])
+
+
+def _copy_batch(cur, table: str, batch: List[tuple]):
+    """Envia um lote via COPY FROM STDIN (CSV em memória; campo vazio sem aspas = NULL)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in batch:
+        writer.writerow(["" if v is None else ("t" if v is True else "f" if v is False else v) for v in row])
+    buf.seek(0)
+    columns = ", ".join(_INGEST_COLUMNS[table])
+    cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _insert_batch(conn, table: str, batch: List[tuple]):
+    """Envia um lote como um único INSERT com várias linhas em VALUES."""
+    columns = _INGEST_COLUMNS[table]
+    if get_db_kind() == "pg":
+        row_sql = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        params = [value for row in batch for value in row]
+        cur = conn.cursor()
+        cur.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([row_sql] * len(batch)), params)
+        cur.close()
+        return
+    row_sql = "(" + ", ".join(["?"] * len(columns)) + ")"
+    # SQLite limita o número de parâmetros por comando (32766 a partir da 3.32)
+    per_statement = max(1, 32000 // len(columns))
+    for start in range(0, len(batch), per_statement):
+        chunk = batch[start:start + per_statement]
+        params = [value for row in chunk for value in row]
+        conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([row_sql] * len(chunk)), params)
+
+
+def bulk_ingest(table: str, rows: Iterable[Dict], batch_size: int = 1000) -> IngestReport:
+    """Insere em lote linhas de tarefas ou débitos (dicts com as colunas de _INGEST_COLUMNS).
+
+    As chaves estrangeiras para users são validadas contra o conjunto de ids
+    carregado uma única vez; linhas inválidas vão para ``report.rejected`` e
+    não interrompem a carga. O envio usa COPY FROM STDIN no psycopg2 e INSERTs
+    com várias linhas no pg8000/SQLite, tudo numa única transação.
+    """
+    if table not in _INGEST_COLUMNS:
+        raise ValueError(f"Tabela não suportada para ingestão: {table}")
+    use_copy = get_backend().capabilities.copy
+    report = IngestReport(table=table, method="copy" if use_copy else "insert")
+    started = time.perf_counter()
+    now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    with transaction() as conn:
+        if get_db_kind() == "pg":
             cur = conn.cursor()
-            cur.execute(
-                "SELECT child_id, SUM(points) AS total FROM tasks WHERE validated = TRUE AND conversion_type = 'money' GROUP BY child_id"
-            )
-            money_rows = cur.fetchall()
-            cur.execute(
-                "SELECT child_id, SUM(points) AS total FROM tasks WHERE validated = TRUE AND conversion_type = 'hours' GROUP BY child_id"
-            )
-            hours_rows = cur.fetchall()
-            cur.execute("SELECT user_id, SUM(money_amount) AS total FROM debits GROUP BY user_id")
-            deb_money_rows = cur.fetchall()
-            cur.execute("SELECT user_id, SUM(hours_amount) AS total FROM debits GROUP BY user_id")
-            deb_hours_rows = cur.fetchall()
+            cur.execute("SELECT id FROM users")
+            user_ids = {row["id"] if isinstance(row, dict) else row[0] for row in cur.fetchall()}
             cur.close()
         else:
-            money_rows = conn.execute(
-                "SELECT child_id, SUM(points) AS total FROM tasks WHERE validated = 1 AND conversion_type = 'money' GROUP BY child_id"
-            ).fetchall()
-            hours_rows = conn.execute(
-                "SELECT child_id, SUM(points) AS total FROM tasks WHERE validated = 1 AND conversion_type = 'hours' GROUP BY child_id"
-            ).fetchall()
-            deb_money_rows = conn.execute(
-                "SELECT user_id, SUM(money_amount) AS total FROM debits GROUP BY user_id"
-            ).fetchall()
-            deb_hours_rows = conn.execute(
-                "SELECT user_id, SUM(hours_amount) AS total FROM debits GROUP BY user_id"
-            ).fetchall()
-
-        money_map = {row["child_id"]: float(row["total"] or 0) for row in money_rows}
-        hours_map = {row["child_id"]: float(row["total"] or 0) for row in hours_rows}
-        deb_money_map = {row["user_id"]: float(row["total"] or 0) for row in deb_money_rows}
-        deb_hours_map = {row["user_id"]: float(row["total"] or 0) for row in deb_hours_rows}
-
-        report = []
-        for user in users:
-            earned_money = money_map.get(user.id, 0.0)
-            earned_hours = hours_map.get(user.id, 0.0)
-            deb_money = deb_money_map.get(user.id, 0.0)
-            deb_hours = deb_hours_map.get(user.id, 0.0)
-            report.append(
-                {
-                    "user": user,
-                    "money": round(earned_money - deb_money, 2),
-                    "hours": round(earned_hours - deb_hours, 2),
-                    "earned_money": earned_money,
-                    "earned_hours": earned_hours,
-                    "debited_money": deb_money,
-                    "debited_hours": deb_hours,
-                }
-            )
-        return report
-    finally:
-        conn.close()
+            user_ids = {row[0] for row in conn.execute("SELECT id FROM users").fetchall()}
+        tables_changed(table, "balances")
+        copy_cur = conn.cursor() if use_copy else None
+        batch: List[tuple] = []
+
+        def flush():
+            if not batch:
+                return
+            if use_copy:
+                _copy_batch(copy_cur, table, batch)
+            else:
+                _insert_batch(conn, table, batch)
+            report.inserted += len(batch)
+            batch.clear()
+
+        for line_no, raw in enumerate(rows, start=1):
+            report.rows_read += 1
+            try:
+                batch.append(_normalize_ingest_row(table, raw, user_ids, now))
+            except (ValueError, TypeError) as exc:
+                if len(report.rejected) < _MAX_REJECTIONS_KEPT:
+                    report.rejected.append((line_no, str(exc)))
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+        if copy_cur is not None:
+            copy_cur.close()
+    report.seconds = time.perf_counter() - started
+    logger.info(
+        "Ingestão em %s: %s inseridas, %s rejeitadas, %.0f linhas/s (%s)",
+        table, report.inserted, report.rows_read - report.inserted, report.rows_per_second, report.method,
+    )
+    return report
 
 
 UPLOADS_DIR = os.environ.get("GESTAO_UPLOADS", "uploads")
@@ -672,29 +1188,91 @@ def _safe_filename(name: str) -> str:
 
 
 def save_user_photo(user_id: int, file_bytes: bytes, original_filename: str) -> str:
-    # Salva no Supabase Storage e obtém URL pública
-    url = upload_photo_supabase(user_id, file_bytes, original_filename)
-    conn = get_connection()
+    """Gera as miniaturas (photos.RENDITION_SIZES), envia todas ao Supabase
+    Storage e grava em users.photo a URL da maior. Bloqueia até o fim do envio;
+    na interface prefira enqueue_user_photo()."""
+    url = upload_photo_renditions(user_id, make_renditions(file_bytes))
+    _set_user_photo(user_id, url)
+    return url
+
+
+# user_id -> ficha do envio mais recente; só ele grava em users.photo
+_photo_tickets: Dict[int, int] = {}
+_photo_ticket_seq = itertools.count(1)
+
+
+def _prepare_photo(file_bytes: bytes) -> dict:
+    # Falhas previsíveis (imagem inválida, Storage não configurado) aparecem
+    # para quem chamou, antes de qualquer trabalho em segundo plano
+    renditions = make_renditions(file_bytes)
+    get_storage()
+    return renditions
+
+
+def _queue_photo(user_id: int, renditions: dict) -> Future:
+    with _STORAGE_LOCK:
+        ticket = next(_photo_ticket_seq)
+        _photo_tickets[user_id] = ticket
+    return _get_upload_queue().submit(_finish_photo_upload, user_id, renditions, ticket)
+
+
+def _finish_photo_upload(user_id: int, renditions: dict, ticket: int) -> Optional[str]:
     try:
-        if DB_KIND == "pg":
+        url = upload_photo_renditions(user_id, renditions)
+    finally:
+        with _STORAGE_LOCK:
+            latest = _photo_tickets.get(user_id) == ticket
+            if latest:
+                del _photo_tickets[user_id]
+    if not latest:
+        logger.info("Foto do usuário %s substituída por um envio mais recente", user_id)
+        return None
+    _set_user_photo(user_id, url)
+    return url
+
+
+def enqueue_user_photo(user_id: int, file_bytes: bytes) -> Future:
+    """Gera as miniaturas na hora (ValueError para imagem inválida) e envia ao
+    Storage em segundo plano; users.photo é atualizado quando o envio termina.
+
+    Se outra foto do mesmo usuário for enfileirada antes disso, só a mais
+    recente é gravada.
+    """
+    return _queue_photo(user_id, _prepare_photo(file_bytes))
+
+
+def photo_upload_pending(user_id: int) -> bool:
+    """True enquanto houver uma foto do usuário na fila de envio."""
+    return user_id in _photo_tickets
+
+
+def wait_for_photo_uploads(timeout: Optional[float] = None) -> bool:
+    """Espera a fila de envio de fotos esvaziar (scripts e testes)."""
+    return _get_upload_queue().wait(timeout)
+
+
+def photo_upload_stats() -> Dict[str, int]:
+    """Contadores da fila de envio de fotos: pendentes, concluídos e falhas."""
+    return _get_upload_queue().stats()
+
+
+def _set_user_photo(user_id: int, url: str):
+    with transaction() as conn:
+        tables_changed("users")
+        if get_db_kind() == "pg":
             cur = conn.cursor()
             cur.execute("UPDATE users SET photo = %s WHERE id = %s", (url, user_id))
-            conn.commit()
             cur.close()
         else:
             cur = conn.cursor()
             cur.execute("UPDATE users SET photo = ? WHERE id = ?", (url, user_id))
-            conn.commit()
             cur.close()
-    finally:
-        conn.close()
-    return url
 
 
 def seed_sample_data():
-    conn = get_connection()
-    try:
-        if DB_KIND == "pg":
+    with transaction() as conn:
+        tables_changed("users", "conversions")
+        if get_db_kind() == "pg":
             cur = conn.cursor()
             cur.execute("SELECT COUNT(1) FROM users")
             row = cur.fetchone()
@@ -718,7 +1296,6 @@ def seed_sample_data():
                     (hash_password("123"), user_id),
                 )
             cur.close()
-            conn.commit()
             ensure_conversion_exists(conn)
         else:
             count = conn.execute("SELECT COUNT(1) FROM users").fetchone()[0]
@@ -732,7 +1309,6 @@ def seed_sample_data():
                         ("Ana", "ana@example.com", "child", hash_password("123")),
                     ],
                 )
-            conn.commit()
 
             users_no_pwd = conn.execute(
                 "SELECT id FROM users WHERE password_hash IS NULL OR password_hash = ''"
@@ -742,12 +1318,8 @@ def seed_sample_data():
                     "UPDATE users SET password_hash = ? WHERE id = ?",
                     (hash_password("123"), row["id"]),
                 )
-            if users_no_pwd:
-                conn.commit()
 
             ensure_conversion_exists(conn)
-    finally:
-        conn.close()
 
     ensure_uploads_dir()
 
@@ -756,3 +1328,79 @@ def seed_sample_data():
             create_user(name="Administrador", email="admin@example.com", roles="validator", password="123")
     except Exception:
         pass
+
+
+# Incrementar quando seed_sample_data passar a inserir/ajustar dados diferentes
+SEED_VERSION = 1
+_BOOTSTRAP_KEY = "bootstrap"
+_bootstrapped = False
+_bootstrap_mutex = threading.Lock()
+
+
+def _bootstrap_fingerprint() -> str:
+    from migrations import MIGRATIONS
+    return f"schema={MIGRATIONS[-1].version};seed={SEED_VERSION}"
+
+
+def _read_bootstrap_fingerprint() -> Optional[str]:
+    try:
+        with pooled_connection() as conn:
+            if get_db_kind() == "pg":
+                cur = conn.cursor()
+                cur.execute("SELECT value FROM app_meta WHERE key = %s", (_BOOTSTRAP_KEY,))
+                row = cur.fetchone()
+                cur.close()
+            else:
+                row = conn.execute("SELECT value FROM app_meta WHERE key = ?", (_BOOTSTRAP_KEY,)).fetchone()
+    except Exception:
+        # Banco ainda sem a tabela app_meta: precisa do bootstrap completo
+        logger.info("Fingerprint de bootstrap indisponível; executando init_db/seed")
+        return None
+    if not row:
+        return None
+    return row["value"] if isinstance(row, dict) else row[0]
+
+
+def _write_bootstrap_fingerprint(fingerprint: str):
+    with transaction() as conn:
+        if get_db_kind() == "pg":
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT INTO app_meta (key, value) VALUES (%s, %s) "
+                "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
+                (_BOOTSTRAP_KEY, fingerprint),
+            )
+            cur.close()
+        else:
+            conn.execute(
+                "INSERT INTO app_meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (_BOOTSTRAP_KEY, fingerprint),
+            )
+
+
+def bootstrap():
+    """Roda init_db() e seed_sample_data() no máximo uma vez por processo.
+
+    O fingerprint (versão do esquema + SEED_VERSION) fica gravado em app_meta:
+    se o banco já está nessa versão, basta uma leitura na primeira execução do
+    processo e nenhuma consulta nos reruns seguintes. O trabalho em si roda sob
+    db.bootstrap_lock(), para que processos concorrentes não semeiem em dobro.
+    """
+    global _bootstrapped
+    if _bootstrapped:
+        return
+    with _bootstrap_mutex:
+        if _bootstrapped:
+            return
+        fingerprint = _bootstrap_fingerprint()
+        if _read_bootstrap_fingerprint() != fingerprint:
+            with bootstrap_lock():
+                # Outro processo pode ter concluído enquanto esperávamos o lock
+                if _read_bootstrap_fingerprint() != fingerprint:
+                    logger.info("Executando bootstrap do banco (%s)", fingerprint)
+                    init_db()
+                    seed_sample_data()
+                    _write_bootstrap_fingerprint(fingerprint)
+        ensure_uploads_dir()
+        _bootstrapped = True
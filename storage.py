@@ -1,9 +1,161 @@
-"""Storage helpers were removed.
+"""
+Cliente do Supabase Storage e fila de envios em segundo plano.
+
+SupabaseStorage usa uma única requests.Session com keep-alive (pool de conexões
+HTTP reaproveitado entre envios), timeouts de conexão/leitura e novas tentativas
+limitadas com backoff exponencial para falhas de rede e respostas 429/5xx. Os
+envios usam x-upsert, então repetir um PUT é seguro.
 
-The S3 sync feature was reverted per project request. This module is a placeholder
-to avoid import errors; no-op functions are provided.
+UploadQueue roda os envios num pool de threads para que a página do Streamlit
+não fique presa esperando o Storage; quem enfileira recebe um Future.
+
+Configuração (variáveis de ambiente ou st.secrets):
+- GESTAO_STORAGE_CONNECT_TIMEOUT (padrão 5 s), GESTAO_STORAGE_READ_TIMEOUT (30 s)
+- GESTAO_STORAGE_RETRIES: novas tentativas por requisição (padrão 3)
+- GESTAO_PHOTO_UPLOAD_WORKERS: threads da fila de envio de fotos (padrão 2)
 """
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class StorageError(RuntimeError):
+    """O Storage recusou a operação (depois das novas tentativas)."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class SupabaseStorage:
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        bucket: str,
+        timeout=(5, 30),
+        retries: int = 3,
+        backoff: float = 0.5,
+        pool_size: int = 8,
+    ):
+        self.url = url.rstrip("/")
+        self.key = key
+        self.bucket = bucket
+        self.timeout = timeout
+        # requests/urllib3 só são carregados quando o primeiro cliente é criado
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=_RETRY_STATUS,
+            allowed_methods=frozenset({"GET", "PUT", "DELETE"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Authorization"] = f"Bearer {key}"
+
+    def object_url(self, path: str) -> str:
+        return f"{self.url}/storage/v1/object/{self.bucket}/{path}"
+
+    def public_url(self, path: str) -> str:
+        return f"{self.url}/storage/v1/object/public/{self.bucket}/{path}"
+
+    def put(self, path: str, data: bytes, content_type: str, cache_control: Optional[str] = None) -> str:
+        """Envia (ou substitui) o objeto e devolve a URL pública."""
+        headers = {"Content-Type": content_type, "x-upsert": "true"}
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+        resp = self.session.put(self.object_url(path), headers=headers, data=data, timeout=self.timeout)
+        if not resp.ok:
+            if resp.status_code == 403:
+                raise StorageError(
+                    f"❌ Erro de permissão no Supabase Storage. Verifique: 1) A SUPABASE_KEY está correta "
+                    f"(deve ser a service_role key), 2) O bucket '{self.bucket}' existe, "
+                    f"3) As policies do bucket permitem upload.",
+                    resp.status_code,
+                )
+            raise StorageError(f"Erro ao fazer upload ({path}): HTTP {resp.status_code}: {resp.text}", resp.status_code)
+        return self.public_url(path)
+
+    def delete(self, paths: Iterable[str]):
+        """Remove vários objetos numa requisição."""
+        resp = self.session.delete(
+            f"{self.url}/storage/v1/object/{self.bucket}",
+            json={"prefixes": list(paths)},
+            timeout=self.timeout,
+        )
+        if not resp.ok:
+            raise StorageError(f"Erro ao remover objetos: HTTP {resp.status_code}: {resp.text}", resp.status_code)
+
+    def close(self):
+        self.session.close()
+
+
+class UploadQueue:
+    """Pool de threads para envios em segundo plano, com contadores."""
+
+    def __init__(self, workers: int = 2, name: str = "upload"):
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+
+    def submit(self, fn: Callable, *args) -> Future:
+        future = self._executor.submit(fn, *args)
+        with self._lock:
+            self._submitted += 1
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Envio em segundo plano falhou", exc_info=future.exception())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Espera os envios pendentes; False se o timeout acabar antes."""
+        with self._lock:
+            pending = list(self._pending)
+        _, not_done = wait(pending, timeout=timeout)
+        return not not_done
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": len(self._pending),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+
 def download_db_from_s3(local_path: str) -> bool:  # pragma: no cover
+    # A sincronização do banco com S3 foi removida a pedido do projeto
     return False
 
 
@@ -0,0 +1,163 @@
+"""
+Servidor HTTP local que imita o Supabase Storage, para testar envios sem rede.
+
+Atende o subconjunto da API usado pelo app:
+- PUT    /storage/v1/object/<bucket>/<caminho>         (upload, exige Bearer)
+- DELETE /storage/v1/object/<bucket>  {"prefixes": [...]} (remoção em lote)
+- GET    /storage/v1/object/public/<bucket>/<caminho>  (leitura pública, com ETag)
+
+Falhas podem ser injetadas com fail_next() (respostas de erro) e ``delay``
+(atraso antes de responder, para simular um Storage lento).
+
+Uso local:
+    python supabase_standin.py --port 54321 --key dev
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_KEY=dev streamlit run app.py
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+_PREFIX = "/storage/v1/object/"
+
+
+class SupabaseStandIn:
+    def __init__(self, key: str = "test-key", bucket: str = "user-photos", host: str = "127.0.0.1", port: int = 0):
+        self.key = key
+        self.bucket = bucket
+        self.delay = 0.0
+        self.objects: Dict[str, Tuple[bytes, Dict[str, str]]] = {}
+        self.requests: List[Tuple[str, str]] = []
+        self._failures: List[int] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, count: int = 1, status: int = 503):
+        """As próximas ``count`` requisições de escrita respondem ``status``."""
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def start(self) -> "SupabaseStandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, como o Storage real
+
+            def _reply(self, status: int, body: bytes = b"", headers: Dict[str, str] = None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, status: int, payload):
+                self._reply(status, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def _write_allowed(self) -> bool:
+                with standin._lock:
+                    standin.requests.append((self.command, self.path))
+                    failure = standin._failures.pop(0) if standin._failures else None
+                if standin.delay:
+                    time.sleep(standin.delay)
+                if failure:
+                    self._json(failure, {"error": "falha injetada"})
+                    return False
+                if self.headers.get("Authorization") != f"Bearer {standin.key}":
+                    self._json(403, {"error": "Unauthorized"})
+                    return False
+                return True
+
+            def do_PUT(self):
+                data = self._body()
+                if not self._write_allowed():
+                    return
+                bucket, _, path = self.path[len(_PREFIX):].partition("/")
+                if not self.path.startswith(_PREFIX) or bucket != standin.bucket or not path:
+                    self._json(404, {"error": "Bucket not found"})
+                    return
+                meta = {
+                    "Content-Type": self.headers.get("Content-Type", "application/octet-stream"),
+                    "Cache-Control": self.headers.get("Cache-Control", "no-cache"),
+                    "ETag": f'"{hashlib.md5(data).hexdigest()}"',
+                }
+                with standin._lock:
+                    if path in standin.objects and self.headers.get("x-upsert") != "true":
+                        self._json(409, {"error": "Duplicate"})
+                        return
+                    standin.objects[path] = (data, meta)
+                self._json(200, {"Key": f"{bucket}/{path}"})
+
+            def do_DELETE(self):
+                body = self._body()
+                if not self._write_allowed():
+                    return
+                prefixes = json.loads(body or b"{}").get("prefixes", [])
+                with standin._lock:
+                    removed = [p for p in prefixes if standin.objects.pop(p, None) is not None]
+                self._json(200, [{"name": p} for p in removed])
+
+            def do_GET(self):
+                with standin._lock:
+                    standin.requests.append((self.command, self.path))
+                public = f"{_PREFIX}public/{standin.bucket}/"
+                entry = standin.objects.get(self.path[len(public):]) if self.path.startswith(public) else None
+                if entry is None:
+                    self._json(404, {"error": "Object not found"})
+                    return
+                data, meta = entry
+                if self.headers.get("If-None-Match") == meta["ETag"]:
+                    self._reply(304, headers={"ETag": meta["ETag"], "Cache-Control": meta["Cache-Control"]})
+                    return
+                self._reply(200, data, meta)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Supabase Storage local para testes")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--key", default="dev")
+    parser.add_argument("--bucket", default="user-photos")
+    args = parser.parse_args()
+    standin = SupabaseStandIn(args.key, args.bucket, port=args.port)
+    print(f"Supabase Storage local em {standin.url} (bucket {args.bucket})")
+    try:
+        standin._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
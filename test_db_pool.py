@@ -0,0 +1,122 @@
+"""
+Testes do pool de conexões (db.ConnectionPool e db.ThreadLocalConnections).
+
+Usa conexões sqlite3 em memória para exercitar o pool sem depender do Postgres.
+
+Executar: python -m pytest -q test_db_pool.py
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from db import ConnectionPool, PoolTimeout, ThreadLocalConnections, _resolve_sqlite_path
+
+
+def _connect():
+    return sqlite3.connect(":memory:", check_same_thread=False)
+
+
+def test_reuses_returned_connection():
+    pool = ConnectionPool(_connect, max_size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    again = pool.acquire()
+    assert again is conn
+    pool.release(again)
+    stats = pool.stats()
+    assert stats["created"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 1
+
+
+def test_waits_for_release_when_exhausted():
+    pool = ConnectionPool(_connect, max_size=1, timeout=2.0)
+    conn = pool.acquire()
+
+    def release_later():
+        time.sleep(0.05)
+        pool.release(conn)
+
+    threading.Thread(target=release_later).start()
+    second = pool.acquire()
+    assert second is conn
+    pool.release(second)
+    stats = pool.stats()
+    assert stats["waits"] == 1
+    assert stats["wait_time"] > 0
+
+
+def test_timeout_when_exhausted():
+    pool = ConnectionPool(_connect, max_size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    pool.release(conn)
+
+
+def test_discarded_connection_frees_slot():
+    pool = ConnectionPool(_connect, max_size=1)
+    conn = pool.acquire()
+    pool.release(conn, discard=True)
+    fresh = pool.acquire()
+    assert fresh is not conn
+    pool.release(fresh)
+    assert pool.stats()["created"] == 2
+    assert pool.stats()["closed"] == 1
+
+
+def test_stale_idle_connection_is_replaced():
+    pool = ConnectionPool(_connect, max_size=1, max_idle=0.0)
+    conn = pool.acquire()
+    pool.release(conn)
+    time.sleep(0.01)
+    fresh = pool.acquire()
+    assert fresh is not conn
+    pool.release(fresh)
+
+
+def test_thread_connections_closed_when_threads_exit():
+    opened = []
+
+    def connect():
+        conn = _connect()
+        opened.append(conn)
+        return conn
+
+    conns = ThreadLocalConnections(connect)
+
+    def work():
+        conn = conns.acquire()
+        assert conns.acquire() is conn  # checkout aninhado na mesma thread
+        conn.execute("SELECT 1")
+        conns.release(conn)
+        conns.release(conn)
+
+    # Uma thread por rerun, como o ScriptRunner do Streamlit
+    for _ in range(50):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+    stats = conns.stats()
+    assert stats["created"] == 50
+    assert stats["open"] <= 1
+    assert stats["closed"] >= 49
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute("SELECT 1")
+    conns.close_all()
+
+
+def test_sqlite_url_keeps_absolute_paths(tmp_path, monkeypatch):
+    target = tmp_path / "abs" / "test.db"
+    assert _resolve_sqlite_path("sqlite:///" + str(target)) == target.resolve()
+    monkeypatch.chdir(tmp_path)
+    assert _resolve_sqlite_path("sqlite:///rel/test.db") == (tmp_path / "rel" / "test.db").resolve()
+    assert _resolve_sqlite_path(str(target)) == target.resolve()
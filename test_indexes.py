@@ -0,0 +1,18 @@
+"""
+Checa se o planner usa os índices de db.INDEXES nos caminhos de acesso de services.py.
+
+Executar: python -m pytest -q test_indexes.py
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import HISTORY_INDEXES, INDEXES, PAGINATION_INDEXES, check_index_usage, init_db
+
+
+def test_every_access_path_uses_its_index():
+    init_db()
+    results = check_index_usage()
+    assert {r["index"] for r in results} <= {spec.name for spec in INDEXES + PAGINATION_INDEXES + HISTORY_INDEXES}
+    unused = [(r["index"], r["plan"]) for r in results if not r["used"]]
+    assert not unused, unused
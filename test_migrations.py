@@ -0,0 +1,129 @@
+"""
+Testes do runner de migrações (migrations.py) sobre o SQLite de teste.
+
+Executar: python -m pytest -q test_migrations.py
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import migrations
+from db import init_db, pooled_connection
+from migrations import Migration, migrate, migration_status
+
+
+def test_init_db_applies_all_migrations_once():
+    init_db()
+    assert all(row["applied_at"] for row in migration_status())
+    assert migrate() == []
+
+
+def test_failed_migration_is_rolled_back(monkeypatch):
+    init_db()
+    next_version = migrations.MIGRATIONS[-1].version + 1
+
+    def broken(ctx):
+        ctx.execute("CREATE TABLE mig_probe (id INTEGER PRIMARY KEY)")
+        raise RuntimeError("falha proposital")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [Migration(next_version, "broken", broken)])
+    with pytest.raises(RuntimeError):
+        migrate()
+    with pooled_connection() as conn:
+        probe = conn.execute("SELECT name FROM sqlite_master WHERE name = 'mig_probe'").fetchone()
+    assert probe is None
+    assert next_version not in [row["version"] for row in migration_status() if row["applied_at"]]
+
+
+def test_backfill_runs_in_batches(monkeypatch):
+    init_db()
+    with pooled_connection() as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS mig_fill (id INTEGER PRIMARY KEY, flag INTEGER)")
+        conn.execute("DELETE FROM mig_fill")
+        conn.executemany("INSERT INTO mig_fill (flag) VALUES (?)", [(0,)] * 25)
+        conn.commit()
+    next_version = migrations.MIGRATIONS[-1].version + 1
+    updated = []
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [
+        Migration(next_version, "fill", lambda ctx: updated.append(ctx.backfill("mig_fill", "flag = 1", "flag = 0", batch_size=10))),
+    ])
+    assert migrate() == [next_version]
+    assert updated == [25]
+    with pooled_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM mig_fill WHERE flag = 0").fetchone()[0] == 0
+        conn.execute("DELETE FROM schema_version WHERE version = ?", (next_version,))
+        conn.execute("DROP TABLE mig_fill")
+        conn.commit()
+
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    """Banco SQLite novo, parado na migração 5 (antes das taxas versionadas)."""
+    import db
+
+    monkeypatch.setenv("GESTAO_DB", "sqlite:///" + str(tmp_path / "legacy.db"))
+    for name, value in (("_DB_TARGET", None), ("_DB_KIND", None), ("_DB_PATH", None),
+                        ("_BACKEND", None), ("_initialized", False), ("_POOL", None)):
+        monkeypatch.setattr(db, name, value)
+    init_db(target=5)
+    yield
+    db._POOL.close_all()
+
+
+def test_init_db_with_target_creates_base_tables(legacy_db):
+    status = {row["version"]: row["applied_at"] for row in migration_status()}
+    assert all(status[v] for v in range(1, 6)) and not status[6]
+    with pooled_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+
+
+def _balance(conn, user_id):
+    row = conn.execute(
+        "SELECT earned_money, earned_hours, debited_money, debited_hours FROM balances WHERE user_id = ?",
+        (user_id,),
+    ).fetchone()
+    return tuple(round(value, 6) for value in row)
+
+
+def test_conversion_versions_keep_legacy_balances(legacy_db):
+    with pooled_connection() as conn:
+        child = conn.execute("INSERT INTO users (name, roles) VALUES ('Legado', 'child')").lastrowid
+        conn.execute("INSERT INTO conversions (money_per_point, hours_per_point) VALUES (0.5, 0.1)")
+        # Antes da migração 6 points guardava o valor em R$/horas
+        conn.executemany(
+            "INSERT INTO tasks (name, points, conversion_type, child_id, validated, validated_at) "
+            "VALUES (?, ?, ?, ?, 1, '2024-01-10 12:00:00')",
+            [("Lição", 10, "money", child), ("Quarto", 2, "hours", child)],
+        )
+        pending = conn.execute(
+            "INSERT INTO tasks (name, points, conversion_type, child_id) VALUES ('Louça', 5, 'money', ?)", (child,)
+        ).lastrowid
+        conn.execute(
+            "INSERT INTO debits (user_id, money_amount, hours_amount, created_at) VALUES (?, 8, 1, '2024-01-11 12:00:00')",
+            (child,),
+        )
+        conn.commit()
+        before = _balance(conn, child)
+    assert before == (10, 2, 8, 1)
+
+    assert migrate() == [m.version for m in migrations.MIGRATIONS if m.version >= 6]
+
+    with pooled_connection() as conn:
+        assert _balance(conn, child) == before
+        # A pendente foi convertida para pontos e vale o mesmo ao ser validada
+        assert conn.execute("SELECT points FROM tasks WHERE id = ?", (pending,)).fetchone()[0] == 10
+        conn.execute(
+            "UPDATE tasks SET validated = 1, validated_at = strftime('%Y-%m-%d %H:%M:%f', 'now', '+1 second') "
+            "WHERE id = ?",
+            (pending,),
+        )
+        conn.execute(
+            "INSERT INTO tasks (name, points, conversion_type, child_id, validated, validated_at) "
+            "VALUES ('Nova', 10, 'hours', ?, 1, strftime('%Y-%m-%d %H:%M:%f', 'now', '+1 second'))",
+            (child,),
+        )
+        conn.commit()
+        # Tarefas novas usam a taxa atual (10 pts * 0,1 h)
+        assert _balance(conn, child) == (15, 3, 8, 1)
@@ -0,0 +1,61 @@
+"""
+Testes do hash de senhas (passwords.py): formatos, hashes legados e o pool limitado.
+
+Executar: python -m pytest -q test_passwords.py
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import passwords
+from passwords import KdfExecutor, PasswordQueueFull, hash_password, needs_rehash, verify_password
+
+
+def test_hash_is_salted_and_verifies():
+    first, second = hash_password("123"), hash_password("123")
+    assert first != second
+    assert first.split("$")[0] in ("scrypt", "pbkdf2_sha256")
+    assert verify_password("123", first) and verify_password("123", second)
+    assert not verify_password("1234", first)
+    assert not needs_rehash(first)
+
+
+def test_legacy_sha256_verifies_and_needs_rehash():
+    legacy = hashlib.sha256(b"123").hexdigest()
+    assert verify_password("123", legacy)
+    assert not verify_password("456", legacy)
+    assert needs_rehash(legacy)
+
+
+def test_cost_change_requires_rehash(monkeypatch):
+    stored = hash_password("segredo")
+    params = dict(passwords._params())
+    params["n"] *= 2
+    params["iterations"] *= 2
+    monkeypatch.setattr(passwords, "_params", lambda: params)
+    assert needs_rehash(stored)
+    assert verify_password("segredo", stored)
+
+
+def test_executor_bounds_pending_work_and_reports_metrics():
+    executor = KdfExecutor(workers=1, max_pending=1, timeout=0.05)
+    release = threading.Event()
+    worker = threading.Thread(target=executor.run, args=(release.wait,))
+    worker.start()
+    time.sleep(0.02)
+    with pytest.raises(PasswordQueueFull):
+        executor.run(lambda: None)
+    release.set()
+    worker.join()
+    assert executor.run(lambda: 42) == 42
+    stats = executor.stats()
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 2
+    assert stats["peak_pending"] == 1
+    assert stats["pending"] == 0
@@ -0,0 +1,136 @@
+"""
+Testes do cache de fotos remotas (photo_cache.py) contra um servidor HTTP local.
+
+Executar: python -m pytest -q test_photo_cache.py
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import requests
+
+from photo_cache import PhotoCache
+
+PHOTO = b"\xff\xd8\xff" + b"x" * 1000
+
+
+class _PhotoHandler(BaseHTTPRequestHandler):
+    requests = []
+    max_age = 0
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.headers.get("If-None-Match")))
+        etag = f'"{self.path}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"max-age={type(self).max_age}")
+        self.send_header("Content-Length", str(len(PHOTO)))
+        self.end_headers()
+        self.wfile.write(PHOTO)
+
+    def log_message(self, *args):
+        pass
+
+
+class _OfflineSession(requests.Session):
+    def get(self, *args, **kwargs):
+        raise requests.ConnectionError("offline")
+
+
+@pytest.fixture
+def server():
+    _PhotoHandler.requests = []
+    _PhotoHandler.max_age = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _PhotoHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fresh_entries_make_no_requests(server, tmp_path):
+    _PhotoHandler.max_age = 3600
+    cache = PhotoCache(str(tmp_path))
+    url = f"{server}/a_64px.webp"
+    assert cache.get(url) == PHOTO
+    for _ in range(5):
+        assert cache.get(url) == PHOTO
+    assert len(_PhotoHandler.requests) == 1
+
+    # Outro processo (cache novo, mesmo diretório) serve do disco
+    assert PhotoCache(str(tmp_path)).get(url) == PHOTO
+    assert len(_PhotoHandler.requests) == 1
+
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["memory_hits"] == 5
+    assert stats["bytes_saved"] == 5 * len(PHOTO)
+    assert stats["hit_ratio"] == pytest.approx(5 / 6)
+
+
+def test_stale_entries_revalidate_with_etag(server, tmp_path):
+    cache = PhotoCache(str(tmp_path))  # max-age=0: sempre revalida
+    url = f"{server}/b_64px.webp"
+    assert cache.get(url) == PHOTO
+    assert cache.get(url) == PHOTO
+    assert _PhotoHandler.requests == [("/b_64px.webp", None), ("/b_64px.webp", '"/b_64px.webp"')]
+    stats = cache.stats()
+    assert stats["revalidated"] == 1 and stats["bytes_downloaded"] == len(PHOTO)
+
+
+def test_serves_stale_copy_when_offline(server, tmp_path):
+    cache = PhotoCache(str(tmp_path))
+    url = f"{server}/c_64px.webp"
+    assert cache.get(url) == PHOTO
+    cache._session = _OfflineSession()
+    assert cache.get(url) == PHOTO
+    assert cache.stats()["stale_served"] == 1
+    assert cache.get(f"{server}/nunca-vista.webp") is None
+
+
+def test_disk_is_bounded_lru(server, tmp_path):
+    _PhotoHandler.max_age = 3600
+    cache = PhotoCache(str(tmp_path), max_bytes=int(2.5 * len(PHOTO)))
+    urls = [f"{server}/{name}_64px.webp" for name in "def"]
+    cache.get(urls[0])
+    cache.get(urls[1])
+    os.utime(os.path.join(str(tmp_path), cache._key(urls[1]) + ".bin"), (1, 1))
+    os.utime(os.path.join(str(tmp_path), cache._key(urls[0]) + ".bin"), (2, 2))
+    cache.get(urls[2])
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["disk_bytes"] <= cache.max_bytes
+    remaining = {name[:-4] for name in os.listdir(str(tmp_path)) if name.endswith(".bin")}
+    assert remaining == {cache._key(urls[0]), cache._key(urls[2])}
+
+
+def test_file_removed_by_other_process_is_a_miss(server, tmp_path, monkeypatch):
+    _PhotoHandler.max_age = 3600
+    url = f"{server}/g_64px.webp"
+    PhotoCache(str(tmp_path)).get(url)
+    cache = PhotoCache(str(tmp_path))
+
+    def evicted(path, *args, **kwargs):  # outro processo removeu o arquivo após a leitura
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", evicted)
+    assert cache._read_disk(cache._key(url)) is None
+
+
+def test_metadata_is_replaced_atomically(server, tmp_path, monkeypatch):
+    url = f"{server}/h_64px.webp"
+    cache = PhotoCache(str(tmp_path))
+    cache.get(url)
+    replaced = []
+    real_replace = os.replace
+    monkeypatch.setattr(os, "replace", lambda src, dst: (replaced.append(dst), real_replace(src, dst)))
+    assert cache.get(url) == PHOTO  # max-age=0: revalida e regrava só os metadados
+    assert replaced == [os.path.join(str(tmp_path), cache._key(url) + ".json")]
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith(".tmp")]
@@ -0,0 +1,59 @@
+"""
+Testes das miniaturas de foto (photos.py).
+
+Executar: python -m pytest -q test_photos.py
+"""
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from PIL import Image
+
+from photos import RENDITION_SIZES, make_renditions, rendition_for
+
+
+def _jpeg_rotated_with_exif():
+    # 400x200 "deitada" (metade esquerda vermelha), com EXIF Orientation=6
+    # (girar 90° no sentido horário) e um campo de metadado
+    image = Image.new("RGB", (400, 200), "blue")
+    image.paste((255, 0, 0), (0, 0, 200, 200))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x010F] = "Câmera de teste"
+    out = io.BytesIO()
+    image.save(out, format="JPEG", exif=exif.tobytes())
+    return out.getvalue()
+
+
+def test_renditions_are_square_oriented_and_stripped():
+    renditions = make_renditions(_jpeg_rotated_with_exif())
+    assert sorted(renditions) == list(RENDITION_SIZES)
+    for size, (data, ext, mime) in renditions.items():
+        with Image.open(io.BytesIO(data)) as thumb:
+            assert thumb.size == (size, size)
+            assert thumb.format.lower() in ("webp", "jpeg") and mime.startswith("image/")
+            assert not thumb.getexif()
+            # Orientação aplicada: a metade vermelha foi para cima
+            rgb = thumb.convert("RGB")
+            top, bottom = rgb.getpixel((size // 2, 2)), rgb.getpixel((size // 2, size - 3))
+            assert top[0] > 200 and top[2] < 60
+            assert bottom[2] > 200 and bottom[0] < 60
+        assert len(data) < 30_000
+
+
+def test_invalid_image_raises_value_error():
+    with pytest.raises(ValueError):
+        make_renditions(b"isto nao e uma imagem")
+
+
+def test_rendition_for_picks_smallest_that_fits():
+    url = "https://x.supabase.co/storage/v1/object/public/b/users/user_1_5_256px.webp"
+    assert rendition_for(url, 60).endswith("user_1_5_64px.webp")
+    assert rendition_for(url, 90).endswith("user_1_5_128px.webp")
+    assert rendition_for(url, 500).endswith("user_1_5_256px.webp")
+    legacy = "https://x.supabase.co/storage/v1/object/public/b/users/user_1_5.jpg"
+    assert rendition_for(legacy, 60) == legacy
+    assert rendition_for(None, 60) is None
@@ -0,0 +1,454 @@
+"""
+Testes de comportamento do services.py sobre o SQLite de teste.
+
+Executar: python -m pytest -q test_services.py
+"""
+import hashlib
+import os
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+from contextlib import contextmanager
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import cache
+import services
+from db import pooled_connection, transaction
+
+
+@contextmanager
+def count_statements():
+    """Conta os comandos SQL executados na conexão SQLite da thread atual."""
+    statements = []
+    with pooled_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            yield statements
+        finally:
+            conn.set_trace_callback(None)
+
+
+def test_bootstrap_runs_once_per_process(monkeypatch):
+    monkeypatch.setattr(services, "_bootstrapped", False)
+    services.bootstrap()
+    assert services._read_bootstrap_fingerprint() == services._bootstrap_fingerprint()
+
+    # Novo processo com o banco já no fingerprint atual: só a leitura do fingerprint
+    monkeypatch.setattr(services, "_bootstrapped", False)
+    with count_statements() as statements:
+        services.bootstrap()
+    assert len(statements) == 1
+    assert "app_meta" in statements[0]
+
+    # Reruns seguintes: nenhuma consulta
+    with count_statements() as statements:
+        services.bootstrap()
+    assert statements == []
+
+
+def unique_email(prefix):
+    return f"{prefix}_{time.time_ns()}@test.com"
+
+
+def test_nested_service_calls_share_one_transaction():
+    email = unique_email("uow")
+    with count_statements() as statements:
+        with transaction():
+            user = services.create_user("Unidade", email, "child", "123")
+            services.update_user_full(user.id, "Unidade 2", email, "child")
+    assert sum(1 for s in statements if s.strip().upper() == "COMMIT") == 1
+    assert services.get_user_by_id(user.id).name == "Unidade 2"
+    services.delete_user(user.id)
+
+
+def test_transaction_rolls_back_every_step_on_error():
+    email = unique_email("uow_rollback")
+    with pytest.raises(RuntimeError):
+        with transaction():
+            services.create_user("Desfeito", email, "child", "123")
+            raise RuntimeError("falha no meio da operação")
+    assert services.get_user_by_email(email) is None
+
+
+def _data_statements(statements):
+    # Cada passo de trigger repete no trace o SQL do comando que o disparou
+    result = []
+    for s in statements:
+        if s.split()[0].upper() in ("BEGIN", "COMMIT", "ROLLBACK") or (result and result[-1] == s):
+            continue
+        result.append(s)
+    return result
+
+
+def _transactions(statements):
+    """Comandos de cada BEGIN ... COMMIT do trace; nada pode ficar fora de uma transação."""
+    result, current = [], None
+    for s in statements:
+        word = s.split()[0].upper()
+        if word == "BEGIN":
+            assert current is None, "BEGIN aninhado"
+            current = []
+        elif word in ("COMMIT", "ROLLBACK"):
+            assert current is not None and word == "COMMIT", f"{word} inesperado"
+            result.append(current)
+            current = None
+        else:
+            assert current is not None, f"comando fora de transação: {s}"
+            if not current or current[-1] != s:
+                current.append(s)
+    assert current is None, "transação não concluída"
+    return result
+
+
+def _single_write(tx, table):
+    """A transação tem só a escrita e o contador de versão de ``table`` no cache."""
+    return len(tx) == 2 and sum(f"'cache_version:{table}'" in s for s in tx) == 1
+
+
+def test_mutators_issue_a_single_statement():
+    email = unique_email("returning")
+    services.bootstrap()  # esquema e conversão inicial fora da contagem
+    with count_statements() as statements:
+        user = services.create_user("Um Comando", email, "child", "123")
+    [tx] = _transactions(statements)
+    assert _single_write(tx, "users")
+    assert user.id and user.email == email
+
+    with count_statements() as statements:
+        validator = services.create_user("Validador Um", unique_email("returning_val"), "validator", "123")
+        assert services.update_user_email(user.id, email).email == email
+        assert services.update_user_password(user.id, "456").id == user.id
+        assert services.update_user_full(user.id, "Um Comando 2", email, "child").name == "Um Comando 2"
+        task = services.create_task("Arrumar", 2, "money", user.id, user.id)
+        validated = services.validate_task(task.id, validator.id)
+        debit = services.create_debit(user.id, 0, money=1.0, performed_by_id=validator.id)
+        services.set_conversion(0.5, 0.1)  # INSERT de uma nova versão da taxa
+    txs = _transactions(statements)
+    assert [_single_write(tx, table) for tx, table in zip(txs, [
+        "users", "users", "users", "users", "tasks", "tasks", "debits", "conversions",
+    ])] == [True] * 8
+    assert len(txs) == 8
+    assert validated.validated and validated.validator_id == validator.id
+    assert debit.money_amount == 1.0
+
+    services.delete_user(user.id)
+    services.delete_user(validator.id)
+
+
+def test_validate_tasks_in_one_statement_skips_already_validated():
+    child = services.create_user("Lote", unique_email("lote"), "child", "123")
+    validator = services.create_user("Validador Lote", unique_email("lote_val"), "validator", "123")
+    tasks = [services.create_task(f"Tarefa {i}", 1, "money", child.id, child.id) for i in range(4)]
+    services.validate_task(tasks[0].id, validator.id)
+
+    with count_statements() as statements:
+        done = services.validate_tasks([t.id for t in tasks], validator.id)
+    [tx] = _transactions(statements)
+    assert _single_write(tx, "tasks")
+    assert sorted(t.id for t in done) == sorted(t.id for t in tasks[1:])
+    assert all(t.validated and t.validator_id == validator.id for t in done)
+    assert services.validate_tasks([t.id for t in tasks], validator.id) == []
+    assert services.validate_tasks([], validator.id) == []
+
+    services.delete_user(child.id)
+    services.delete_user(validator.id)
+
+
+def test_bulk_ingest_validates_foreign_keys_and_reports_throughput():
+    child = services.create_user("Importada", unique_email("ingest"), "child", "123")
+    rows = [
+        {"name": f"Histórico {i}", "points": "1.5", "conversion_type": "money", "child_id": str(child.id)}
+        for i in range(25)
+    ]
+    rows.append({"name": "Sem criança válida", "points": "1", "conversion_type": "money", "child_id": "999999"})
+    rows.append({"name": "Tipo inválido", "points": "1", "conversion_type": "pontos", "child_id": str(child.id)})
+
+    report = services.bulk_ingest("tasks", iter(rows), batch_size=10)
+    assert report.rows_read == 27
+    assert report.inserted == 25
+    assert [line for line, _ in report.rejected] == [26, 27]
+    assert report.rows_per_second > 0
+    assert len(services.list_tasks()) >= 25
+
+    debits = services.bulk_ingest("debits", [{"user_id": child.id, "money_amount": "2.5", "reason": "import"}])
+    assert debits.inserted == 1
+    assert services.list_debits(child.id)[0].money_amount == 2.5
+    services.delete_user(child.id)
+
+
+def test_keyset_pagination_walks_every_task_once():
+    child = services.create_user("Paginada", unique_email("pages"), "child", "123")
+    created = [services.create_task(f"Página {i}", 1, "hours", child.id, child.id) for i in range(5)]
+    services.validate_task(created[0].id, child.id)
+
+    seen, cursor = [], None
+    while True:
+        page = services.list_tasks(child_id=child.id, limit=2, cursor=cursor)
+        seen.extend(page)
+        cursor = services.next_page_cursor(page, 2)
+        if cursor is None:
+            break
+    assert sorted(t.id for t in seen) == sorted(t.id for t in created)
+    assert [(t.created_at, t.id) for t in seen] == sorted(((t.created_at, t.id) for t in seen), reverse=True)
+
+    assert {t.id for t in services.list_tasks(child_id=child.id, status="pending")} == {t.id for t in created[1:]}
+    assert services.list_tasks(child_id=child.id, start="2100-01-01") == []
+    services.delete_user(child.id)
+
+
+def test_balances_follow_every_write_and_reconcile():
+    services.set_conversion(2.0, 0.5)
+    child = services.create_user("Saldo", unique_email("saldo"), "child", "123")
+    parent = services.create_user("Responsável", unique_email("resp"), "parent", "123")
+    money = services.create_task("Arrumar", 10, "money", child.id, parent.id)
+    hours = services.create_task("Ler", 3, "hours", child.id, parent.id)
+    services.validate_tasks([money.id, hours.id], parent.id)
+    debit = services.create_debit(child.id, 4, 4.0, None, "Lanche", parent.id)
+
+    def balance():
+        return next(r for r in services.get_report() if r["user"].id == child.id)
+
+    entry = balance()
+    assert (entry["money"], entry["hours"]) == (16.0, 1.5)
+
+    # Nova taxa vale só para tarefas validadas depois dela
+    services.set_conversion(3.0, 1.0)
+    extra = services.create_task("Regar", 1, "money", child.id, parent.id)
+    services.validate_task(extra.id, parent.id)
+    assert balance()["earned_money"] == 23.0
+
+    services.delete_debit(debit.id)
+    services.delete_task(hours.id)
+    entry = balance()
+    assert (entry["money"], entry["hours"]) == (23.0, 0.0)
+    assert not [d for d in services.reconcile_balances() if d["user_id"] == child.id]
+
+    # Deriva artificial: detectada e corrigida pela reconciliação
+    with transaction() as conn:
+        conn.execute("UPDATE balances SET earned_money = 99 WHERE user_id = ?", (child.id,))
+    drift = [d for d in services.reconcile_balances(fix=True) if d["user_id"] == child.id]
+    assert drift[0]["fields"]["earned_money"] == (99.0, 23.0)
+    assert balance()["money"] == 23.0
+
+    # Remover o responsável apaga as tarefas que ele criou e ajusta o saldo da criança
+    services.delete_user(parent.id)
+    assert balance()["money"] == 0.0
+    services.delete_user(child.id)
+    with pooled_connection() as conn:
+        assert conn.execute("SELECT 1 FROM balances WHERE user_id = ?", (child.id,)).fetchone() is None
+
+
+def test_conversion_version_in_same_millisecond_is_not_retroactive():
+    services.bootstrap()
+    # julianday() arredonda os dois instantes para o mesmo milissegundo
+    with transaction() as conn:
+        older = conn.execute(
+            "INSERT INTO conversions (money_per_point, hours_per_point, effective_from) "
+            "VALUES (7, 7, '2090-01-01T00:00:00.000100')"
+        ).lastrowid
+        newer = conn.execute(
+            "INSERT INTO conversions (money_per_point, hours_per_point, effective_from) "
+            "VALUES (9, 9, '2090-01-01T00:00:00.000400')"
+        ).lastrowid
+    try:
+        assert services.get_conversion(at="2090-01-01T00:00:00.000300").id == older
+        assert services.get_conversion(at="2090-01-01 00:00:00.000400").id == newer
+    finally:
+        with transaction() as conn:
+            conn.execute("DELETE FROM conversions WHERE id IN (?, ?)", (older, newer))
+
+
+def test_current_conversion_is_cached_until_set_conversion_commits():
+    services.bootstrap()
+    services.get_conversion()
+    with count_statements() as statements:
+        cached = services.get_conversion()
+    assert statements == []
+
+    with pytest.raises(RuntimeError):
+        with transaction():
+            services.set_conversion(cached.money_per_point + 1, cached.hours_per_point)
+            raise RuntimeError("desfaz")
+    assert services.get_conversion() is cached
+
+    updated = services.set_conversion(cached.money_per_point + 1, cached.hours_per_point)
+    assert services.get_conversion().id == updated.id
+    assert services.get_conversion(at=datetime(1999, 1, 1)).id != updated.id
+
+
+def test_report_and_reconciliation_are_single_queries():
+    services.create_user("Relatório", unique_email("report"), "child", "123")
+    services.list_users()  # usuários vêm do cache; só balances é lido
+    with count_statements() as statements:
+        report = services.get_report()
+    assert len(_data_statements(statements)) == 1
+    assert report and all("money" in entry for entry in report)
+
+    with count_statements() as statements:
+        services.reconcile_balances()
+    assert len(_data_statements(statements)) == 1
+
+
+def test_balance_history_buckets_in_sql():
+    child = services.create_user("Histórico", unique_email("history"), "child", "123")
+    services.bulk_ingest("tasks", [
+        {"name": "Seg", "points": "2", "conversion_type": "money", "child_id": child.id,
+         "validated": "true", "validated_at": "2024-03-04 10:00:00"},
+        {"name": "Dom", "points": "3", "conversion_type": "money", "child_id": child.id,
+         "validated": "true", "validated_at": "2024-03-10 18:00:00"},
+        {"name": "Horas", "points": "1", "conversion_type": "hours", "child_id": child.id,
+         "validated": "true", "validated_at": "2024-03-11 09:00:00"},
+        {"name": "Pendente", "points": "50", "conversion_type": "money", "child_id": child.id},
+    ])
+    services.bulk_ingest("debits", [
+        {"user_id": child.id, "money_amount": "1", "created_at": "2024-03-12 08:00:00"},
+    ])
+
+    rate = services.get_conversion(at=datetime(2024, 3, 1))
+    weekly = services.get_balance_history(child.id, "week", start=datetime(2024, 1, 1), end=datetime(2024, 4, 1))
+    assert weekly["period"] == ["2024-03-04", "2024-03-11"]
+    assert weekly["earned_money"] == [5.0 * rate.money_per_point, 0.0]
+    assert weekly["earned_hours"] == [0.0, 1.0 * rate.hours_per_point]
+    assert weekly["money"] == [round(5.0 * rate.money_per_point, 2), -1.0]
+
+    monthly = services.get_balance_history(child.id, "month")
+    assert monthly["period"] == ["2024-03-01"]
+    assert monthly["money"] == [round(5.0 * rate.money_per_point - 1.0, 2)]
+    assert services.get_balance_history(child.id, "day", end=datetime(2024, 3, 5))["period"] == ["2024-03-04"]
+    with pytest.raises(ValueError):
+        services.get_balance_history(child.id, "year")
+
+    # Início em data (como o Dashboard passa): reruns repetem a chave do cache
+    misses = cache.cache_stats()["misses"]
+    for _ in range(3):
+        by_date = services.get_balance_history(child.id, "week", start=date(2024, 1, 1), end=date(2024, 4, 1))
+    assert by_date["period"] == weekly["period"]
+    assert cache.cache_stats()["misses"] == misses + 1
+    services.delete_user(child.id)
+
+
+def test_balance_history_bounds_match_any_timestamp_separator():
+    child = services.create_user("Limites", unique_email("bounds"), "child", "123")
+    services.bulk_ingest("tasks", [
+        {"name": name, "points": "1", "conversion_type": "money", "child_id": child.id,
+         "validated": "true", "validated_at": validated_at}
+        for name, validated_at in [
+            ("Véspera", "2024-05-05T23:59:59"),
+            ("Início", "2024-05-06T00:00:00.250"),
+            ("Manhã", "2024-05-06 09:00:00"),
+            ("Tarde", "2024-05-06T13:00:00"),
+        ]
+    ])
+    task = services.create_task("Hoje", 1, "money", child.id, child.id)
+    services.validate_task(task.id, child.id)  # validated_at com 'T', como o app grava
+
+    rate = services.get_conversion(at=datetime(2024, 5, 6)).money_per_point
+    day = services.get_balance_history(child.id, "day", start=date(2024, 5, 6), end=datetime(2024, 5, 6, 12))
+    assert day["period"] == ["2024-05-06"] and day["earned_money"] == [2 * rate]
+    afternoon = services.get_balance_history(child.id, "day", start=datetime(2024, 5, 6, 12), end=date(2024, 5, 7))
+    assert afternoon["earned_money"] == [rate]
+    today = services.get_balance_history(child.id, "day", start=date.today())
+    assert len(today["period"]) == 1 and today["earned_money"] == [services.get_conversion().money_per_point]
+    services.delete_user(child.id)
+
+
+def test_writes_from_another_process_invalidate_the_cache():
+    child = services.create_user("Outro Processo", unique_email("proc"), "child", "123")
+    assert services.list_tasks(child_id=child.id) == []
+    # Como scripts/bulk_ingest.py: outro processo escreve pelo services
+    subprocess.run(
+        [sys.executable, "-c",
+         f"import services; services.create_task('De fora', 1, 'money', {child.id}, {child.id})"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True,
+    )
+    assert services.list_tasks(child_id=child.id) == []  # ainda dentro do intervalo
+
+    cache.sync_shared_versions(force=True)
+    assert [t.name for t in services.list_tasks(child_id=child.id)] == ["De fora"]
+    remote = cache.cache_stats()["remote_changes"]
+    cache.sync_shared_versions(force=True)  # nada mudou: nada é invalidado
+    assert cache.cache_stats()["remote_changes"] == remote
+    services.delete_user(child.id)
+
+
+def test_login_upgrades_legacy_sha256_hash():
+    user = services.create_user("Legado", unique_email("legacy"), "child", None)
+    with transaction() as conn:
+        conn.execute("UPDATE users SET password_hash = ? WHERE id = ?",
+                     (hashlib.sha256(b"123").hexdigest(), user.id))
+    cache.bump("users")  # escrita fora do services
+    assert services.authenticate_user(user.email, "errada") is None
+    logged = services.authenticate_user(user.email, "123")
+    assert logged is not None and "$" in logged.password_hash
+    assert services.get_user_by_id(user.id).password_hash == logged.password_hash
+    assert services.authenticate_user(user.email, "123").password_hash == logged.password_hash
+    assert services.authenticate_user("ninguem@test.com", "123") is None
+    services.delete_user(user.id)
+
+
+def test_user_directory_serves_reruns_without_queries():
+    child = services.create_user("Diretório", unique_email("dir"), "child", "123")
+    services.list_users()
+    with count_statements() as statements:
+        assert child.id in {u.id for u in services.list_users()}
+        assert child.id in {u.id for u in services.list_children()}
+        assert services.get_user_by_id(child.id).name == "Diretório"
+        assert services.get_user_by_email(child.email.upper()).id == child.id
+    assert statements == []
+
+    # Escrita confirmada invalida; escrita desfeita não
+    services.update_user_full(child.id, "Diretório 2", child.email, "child")
+    assert services.get_user_by_id(child.id).name == "Diretório 2"
+    with pytest.raises(RuntimeError):
+        with transaction():
+            services.update_user_email(child.id, "outro@test.com")
+            assert services.get_user_by_email("outro@test.com").id == child.id
+            raise RuntimeError("desfaz")
+    services.list_users()
+    with count_statements() as statements:
+        assert services.get_user_by_email("outro@test.com") is None
+    assert statements == []
+
+    services.delete_user(child.id)
+    assert services.get_user_by_id(child.id) is None
+
+
+def test_read_cache_hits_until_a_write_bumps_the_table():
+    child = services.create_user("Cache", unique_email("cache"), "child", "123")
+    services.list_tasks(child_id=child.id)
+    before = cache.cache_stats()
+    with count_statements() as statements:
+        assert services.list_tasks(child_id=child.id) == []
+    assert statements == []
+    after = cache.cache_stats()
+    assert after["hits"] == before["hits"] + 1 and after["misses"] == before["misses"]
+
+    # Read-your-writes: a tarefa criada aparece na leitura seguinte
+    task = services.create_task("Cacheada", 1, "money", child.id, child.id)
+    assert [t.id for t in services.list_tasks(child_id=child.id)] == [task.id]
+    assert cache.cache_stats()["misses"] == after["misses"] + 1
+
+    # Dentro da transação a leitura vai ao banco e enxerga a escrita pendente
+    with transaction():
+        services.delete_task(task.id)
+        assert services.list_tasks(child_id=child.id) == []
+    assert services.list_tasks(child_id=child.id) == []
+    services.delete_user(child.id)
+
+
+def test_delete_many_removes_selected_rows_in_one_statement():
+    child = services.create_user("Lote", unique_email("lote"), "child", "123")
+    tasks = [services.create_task(f"T{i}", 1, "money", child.id, child.id) for i in range(3)]
+    debit = services.create_debit(child.id, 0, 1.0, None, "x", child.id)
+    with count_statements() as statements:
+        assert services.delete_tasks([tasks[0].id, tasks[1].id, 999999]) == 2
+    [tx] = _transactions(statements)
+    assert _single_write(tx, "tasks")
+    assert [t.id for t in services.list_tasks(child_id=child.id)] == [tasks[2].id]
+    assert services.delete_debits([debit.id]) == 1
+    assert services.delete_debits([]) == 0
+    services.delete_user(child.id)
@@ -0,0 +1,64 @@
+"""
+Testes do orçamento de inicialização (scripts/startup_benchmark.py).
+
+Executar: python -m pytest -q test_startup.py
+"""
+import logging
+import os
+import runpy
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+from startup_benchmark import check, measure, parse_importtime, summarize
+
+SAMPLE = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |        900 |     pandas.core
+import time:       500 |       1400 |   pandas
+import time:      2000 |       3520 | app
+"""
+
+
+def test_parse_and_summarize_importtime():
+    entries = parse_importtime(SAMPLE)
+    assert [(e["module"], e["depth"]) for e in entries] == [
+        ("_io", 1), ("pandas.core", 2), ("pandas", 1), ("app", 0),
+    ]
+    summary = summarize(entries, "app", forbidden=("pandas", "plotly.express"))
+    assert summary["total_ms"] == 3.52
+    assert summary["top_packages"][0] == {"package": "app", "self_ms": 2.0}
+    assert summary["top_packages"][1] == {"package": "pandas", "self_ms": 0.8}
+    assert summary["forbidden"] == ["pandas"]
+
+
+def test_check_reports_budget_and_regression():
+    summary = {"module": "app", "total_ms": 130.0, "forbidden": []}
+    assert check(summary, budget_ms=200, baseline_ms=120, max_regression=0.2) == []
+    problems = check(summary, budget_ms=100, baseline_ms=100, max_regression=0.2)
+    assert len(problems) == 2
+
+
+def test_app_import_defers_heavy_dependencies():
+    summary = measure("app", runs=1)
+    assert summary["forbidden"] == []
+
+
+def test_logging_configured_once_across_reruns(tmp_path, monkeypatch):
+    monkeypatch.setenv("GESTAO_LOGS", str(tmp_path))
+    root = logging.getLogger()
+    before = list(root.handlers)
+    try:
+        # Cada rerun do Streamlit executa app.py num módulo novo
+        for _ in range(3):
+            runpy.run_path(os.path.join(ROOT, "app.py"), run_name="rerun")["configure_logging"]()
+        added = [h for h in root.handlers if h not in before]
+        assert len(added) == 2
+    finally:
+        for handler in root.handlers[:]:
+            if handler not in before:
+                root.removeHandler(handler)
+                handler.close()
@@ -0,0 +1,121 @@
+"""
+Testes do cliente do Storage e da fila de envio de fotos contra o Supabase
+local (supabase_standin.py), sem rede.
+
+Executar: python -m pytest -q test_storage.py
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import requests
+from PIL import Image
+
+import services
+from photos import RENDITION_SIZES
+from storage import StorageError, SupabaseStorage
+from supabase_standin import SupabaseStandIn
+
+
+@pytest.fixture
+def standin():
+    with SupabaseStandIn(key="test-key") as server:
+        yield server
+
+
+@pytest.fixture
+def storage(standin):
+    client = SupabaseStorage(standin.url, "test-key", standin.bucket, timeout=(2, 2), retries=2, backoff=0.01)
+    yield client
+    client.close()
+
+
+def _png():
+    out = io.BytesIO()
+    Image.new("RGB", (300, 200), "green").save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_put_retries_transient_errors(standin, storage):
+    standin.fail_next(2, status=503)
+    url = storage.put("users/a.txt", b"abc", "text/plain")
+    assert url == f"{standin.url}/storage/v1/object/public/user-photos/users/a.txt"
+    assert standin.objects["users/a.txt"][0] == b"abc"
+    assert [method for method, _ in standin.requests] == ["PUT"] * 3
+
+
+def test_put_gives_up_after_bounded_retries(standin, storage):
+    standin.fail_next(5, status=503)
+    with pytest.raises(StorageError) as excinfo:
+        storage.put("users/b.txt", b"abc", "text/plain")
+    assert excinfo.value.status == 503
+    assert len(standin.requests) == 3  # 1 tentativa + 2 novas
+
+
+def test_put_rejects_bad_key(standin):
+    client = SupabaseStorage(standin.url, "errada", standin.bucket, retries=0)
+    with pytest.raises(StorageError) as excinfo:
+        client.put("users/c.txt", b"abc", "text/plain")
+    assert excinfo.value.status == 403
+
+
+def test_stalled_storage_times_out(standin):
+    standin.delay = 1.0
+    client = SupabaseStorage(standin.url, "test-key", standin.bucket, timeout=(1, 0.2), retries=0)
+    started = time.monotonic()
+    with pytest.raises(requests.RequestException):
+        client.put("users/d.txt", b"abc", "text/plain")
+    assert time.monotonic() - started < 1.0
+
+
+@pytest.fixture
+def photo_backend(standin, monkeypatch):
+    monkeypatch.setattr(services, "_supabase_settings", (standin.url, "test-key", standin.bucket))
+    monkeypatch.setattr(services, "_STORAGE", None)
+    services.bootstrap()
+    yield standin
+    services.wait_for_photo_uploads(5)
+    monkeypatch.setattr(services, "_STORAGE", None)
+
+
+def test_create_user_uploads_photo_in_background(photo_backend):
+    photo_backend.delay = 0.2
+    user = services.create_user("Foto", f"foto_{time.time_ns()}@test.com", "child", "123")
+    services.enqueue_user_photo(user.id, _png())
+    # Volta antes do envio terminar
+    assert services.get_user_by_id(user.id).photo is None
+    assert services.photo_upload_pending(user.id)
+
+    assert services.wait_for_photo_uploads(10)
+    assert not services.photo_upload_pending(user.id)
+    photo = services.get_user_by_id(user.id).photo
+    assert photo.startswith(f"{photo_backend.url}/storage/v1/object/public/user-photos/users/user_{user.id}_")
+    assert photo.endswith(f"_{RENDITION_SIZES[-1]}px.webp") or photo.endswith(f"_{RENDITION_SIZES[-1]}px.jpg")
+    assert len(photo_backend.objects) == len(RENDITION_SIZES)
+
+
+def test_only_latest_queued_photo_is_saved(photo_backend):
+    user = services.create_user("Duas Fotos", f"duas_{time.time_ns()}@test.com", "child", "123")
+    photo_backend.delay = 0.3  # o primeiro envio ainda está em curso quando o segundo entra
+    first = services.enqueue_user_photo(user.id, _png())
+    second = services.enqueue_user_photo(user.id, _png())
+    assert services.wait_for_photo_uploads(10)
+    assert first.result() is None
+    assert services.get_user_by_id(user.id).photo == second.result()
+
+
+def test_photo_failures_keep_the_created_user(photo_backend, monkeypatch):
+    user = services.create_user("Inválida", f"invalida_{time.time_ns()}@test.com", "child", "123")
+    with pytest.raises(ValueError):
+        services.enqueue_user_photo(user.id, b"isto nao e imagem")
+    # Storage sem chave: a foto falha, o usuário continua lá
+    monkeypatch.setattr(services, "_supabase_settings", (photo_backend.url, "", photo_backend.bucket))
+    with pytest.raises(ValueError):
+        services.enqueue_user_photo(user.id, _png())
+    assert services.get_user_by_id(user.id).photo is None
+    assert not services.photo_upload_pending(user.id)
+    services.delete_user(user.id)